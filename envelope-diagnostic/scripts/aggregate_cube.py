@@ -0,0 +1,297 @@
+"""
+Aggregate Cube (聚合立方体)
+
+Precomputed aggregates over (condition, pattern_label, measure) so diagnostic
+questions are answered without rescanning summary rows:
+- L2 measures (tempo / gain / accent): |shift| values plus clamp, requested-OOB
+  and effective-OOB counts, from summary_runs
+- L1 measures (delta_integrated_lufs / delta_lra_lu / delta_onset_density_eps):
+  paired deltas plus the count of clamped pairs, from paired_summary_all
+
+Every cell holds count, sum, sum of squares, min, max, the flag counts and a
+mergeable QuantileSketch, so roll-ups (e.g. all pattern labels of a condition)
+merge cells instead of touching rows. Queries run from the CLI or a local HTTP
+endpoint:
+
+    GET /query?measure=tempo&condition=constrained_tight&group_by=pattern_label&q=0.5,0.95
+"""
+
+import argparse
+import json
+import math
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from sketches import QuantileSketch
+from table_io import read_table
+
+CUBE_VERSION = 1
+DIMENSIONS = ('condition', 'pattern_label')
+L2_MEASURES = ('tempo', 'gain', 'accent')
+L1_MEASURES = ('delta_integrated_lufs', 'delta_lra_lu', 'delta_onset_density_eps')
+FLAG_NAMES = ('clamped', 'req_oob', 'eff_oob')
+CLAMP_COLUMNS = ['tempo_clamped', 'gain_clamped', 'accent_clamped']
+
+
+class Cell:
+    """立方体的一个单元：矩统计 + 标志计数 + 分位数草图，可合并"""
+
+    def __init__(self, relative_accuracy=0.01):
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.flags = {name: 0 for name in FLAG_NAMES}
+        self.flag_counts = {name: 0 for name in FLAG_NAMES}
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def update(self, values, flags=None):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if values.size:
+            self.count += values.size
+            self.total += float(values.sum())
+            self.total_sq += float(np.square(values).sum())
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+            self.sketch.update(values)
+        for name, column in (flags or {}).items():
+            column = np.asarray(column, dtype=float)
+            known = ~np.isnan(column)
+            self.flags[name] += int(column[known].sum())
+            self.flag_counts[name] += int(known.sum())
+        return self
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for name in FLAG_NAMES:
+            self.flags[name] += other.flags[name]
+            self.flag_counts[name] += other.flag_counts[name]
+        self.sketch.merge(other.sketch)
+        return self
+
+    def summary(self, quantiles=(0.5, 0.95)):
+        n = self.count
+        mean = self.total / n if n else math.nan
+        var = max(self.total_sq / n - mean * mean, 0.0) if n else math.nan
+        row = {
+            'n': n,
+            'mean': mean,
+            'std': math.sqrt(var) if n else math.nan,
+            'min': self.min if n else math.nan,
+            'max': self.max if n else math.nan,
+        }
+        for q in quantiles:
+            row[f'p{q * 100:g}'] = self.sketch.quantile(q)
+        for name in FLAG_NAMES:
+            if self.flag_counts[name]:
+                row[f'{name}_rate'] = self.flags[name] / self.flag_counts[name]
+        return row
+
+    def to_dict(self):
+        return {
+            'count': self.count, 'total': self.total, 'total_sq': self.total_sq,
+            'min': self.min if self.count else None, 'max': self.max if self.count else None,
+            'flags': self.flags, 'flag_counts': self.flag_counts, 'sketch': self.sketch.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        cell = cls()
+        cell.count, cell.total, cell.total_sq = data['count'], data['total'], data['total_sq']
+        cell.min = data['min'] if data['min'] is not None else math.inf
+        cell.max = data['max'] if data['max'] is not None else -math.inf
+        cell.flags = dict(data['flags'])
+        cell.flag_counts = dict(data['flag_counts'])
+        cell.sketch = QuantileSketch.from_dict(data['sketch'])
+        return cell
+
+
+def build_cube(summary, paired=None):
+    """由 summary_runs（L2）与 paired_summary_all（L1）构建 {(condition, pattern_label, measure): Cell}"""
+    cube = {}
+    summary = summary.assign(pattern_label=summary['pattern_label'].fillna('unknown'))
+    for (condition, label), group in summary.groupby(list(DIMENSIONS), sort=True, observed=True):
+        for param in L2_MEASURES:
+            flags = {name: group[f'{param}_{name}'].to_numpy(dtype=float) for name in FLAG_NAMES}
+            cube[(str(condition), str(label), param)] = Cell().update(
+                group[f'{param}_delta'].abs().to_numpy(dtype=float), flags)
+
+    if paired is not None and not paired.empty:
+        paired = paired.assign(pattern_label=paired['pattern_label'].fillna('unknown'))
+        clamped = (paired[CLAMP_COLUMNS] == 1).any(axis=1).astype(float)
+        for (condition, label), group in paired.groupby(list(DIMENSIONS), sort=True, observed=True):
+            for metric in L1_MEASURES:
+                cube[(str(condition), str(label), metric)] = Cell().update(
+                    group[metric].to_numpy(dtype=float), {'clamped': clamped[group.index].to_numpy()})
+    return cube
+
+
+def save_cube(cube, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    cells = [{'condition': c, 'pattern_label': p, 'measure': m, **cell.to_dict()}
+             for (c, p, m), cell in sorted(cube.items())]
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': CUBE_VERSION, 'dimensions': list(DIMENSIONS), 'cells': cells}, f)
+    os.replace(tmp_path, path)
+
+
+def load_cube(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != CUBE_VERSION:
+        raise ValueError(f'{path}: unsupported cube version {data.get("version")}')
+    return {(d['condition'], d['pattern_label'], d['measure']): Cell.from_dict(d) for d in data['cells']}
+
+
+def query_cube(cube, measures, conditions=None, pattern_labels=None, group_by=(), quantiles=(0.5, 0.95)):
+    """切片 + 上卷：按 conditions / pattern_labels 过滤单元，按 group_by 维度合并
+
+    Returns:
+        list of dict，每组一行（measure、分组维度值和 Cell.summary 统计）
+    """
+    unknown = [d for d in group_by if d not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f'Unknown dimension(s): {unknown}')
+    invalid = [q for q in quantiles if not 0 <= q <= 1]
+    if invalid:
+        raise ValueError(f'Quantiles must be in [0, 1]: {invalid}')
+    groups = {}
+    for (condition, label, measure), cell in cube.items():
+        if measure not in measures:
+            continue
+        if conditions and condition not in conditions:
+            continue
+        if pattern_labels and label not in pattern_labels:
+            continue
+        coords = {'condition': condition, 'pattern_label': label}
+        key = (measure,) + tuple(coords[d] for d in group_by)
+        if key not in groups:
+            groups[key] = Cell()
+        groups[key].merge(cell)
+    rows = []
+    for key in sorted(groups):
+        row = {'measure': key[0], **dict(zip(group_by, key[1:]))}
+        row.update(groups[key].summary(quantiles))
+        rows.append(row)
+    return rows
+
+
+def _split(values):
+    """把 ['a,b', 'c'] 形式的参数展开为 ['a', 'b', 'c']"""
+    return [v for item in values or [] for v in item.split(',') if v]
+
+
+class CubeHandler(BaseHTTPRequestHandler):
+    server_version = 'AggregateCube/1.0'
+
+    def _reply(self, status, body):
+        data = json.dumps(body, allow_nan=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == '/health':
+            self._reply(200, {'status': 'ok', 'cells': len(self.server.cube)})
+            return
+        if url.path != '/query':
+            self._reply(404, {'error': 'not found'})
+            return
+        try:
+            rows = query_cube(
+                self.server.cube,
+                measures=_split(params.get('measure')) or list(L2_MEASURES + L1_MEASURES),
+                conditions=_split(params.get('condition')),
+                pattern_labels=_split(params.get('pattern_label')),
+                group_by=_split(params.get('group_by')),
+                quantiles=[float(q) for q in _split(params.get('q'))] or (0.5, 0.95),
+            )
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+            return
+        # JSON 不支持 NaN，空单元的统计量以 null 返回
+        self._reply(200, {'rows': [{k: None if isinstance(v, float) and math.isnan(v) else v
+                                    for k, v in row.items()} for row in rows]})
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+
+def serve(cube_path, host='127.0.0.1', port=8766, verbose=False):
+    httpd = ThreadingHTTPServer((host, port), CubeHandler)
+    httpd.daemon_threads = True
+    httpd.cube = load_cube(cube_path)
+    httpd.verbose = verbose
+    print(f'Serving {len(httpd.cube)} cube cells on http://{host}:{port}/query')
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and query the diagnostics aggregate cube')
+    parser.add_argument('--cube', default='reports/aggregate_cube.json')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help='Precompute the cube from the summary tables')
+    build.add_argument('--summary', default='summary/summary_runs.csv')
+    build.add_argument('--paired', default='summary/paired_summary_all.csv')
+
+    query = sub.add_parser('query', help='Slice / roll up the cube')
+    query.add_argument('--measure', nargs='+', default=list(L2_MEASURES + L1_MEASURES))
+    query.add_argument('--condition', nargs='*', default=None)
+    query.add_argument('--pattern', nargs='*', default=None)
+    query.add_argument('--group-by', nargs='*', default=[], choices=DIMENSIONS)
+    query.add_argument('--q', nargs='*', type=float, default=[0.5, 0.95], help='Quantiles to report')
+
+    srv = sub.add_parser('serve', help='Answer /query requests over HTTP')
+    srv.add_argument('--host', default='127.0.0.1')
+    srv.add_argument('--port', type=int, default=8766)
+    srv.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'query' and any(not 0 <= q <= 1 for q in args.q):
+        parser.error('--q quantiles must be in [0, 1]')
+
+    if args.command == 'build':
+        columns = (['condition', 'pattern_label']
+                   + [f'{p}_{s}' for p in L2_MEASURES for s in FLAG_NAMES + ('delta',)])
+        summary = read_table(args.summary, columns=columns)
+        paired = None
+        if os.path.exists(args.paired):
+            paired = read_table(args.paired, columns=['condition', 'pattern_label'] + CLAMP_COLUMNS
+                                + list(L1_MEASURES))
+        cube = build_cube(summary, paired)
+        save_cube(cube, args.cube)
+        print(f'Saved: {args.cube} ({len(cube)} cells)')
+    elif args.command == 'query':
+        rows = query_cube(load_cube(args.cube), args.measure, args.condition, args.pattern,
+                          args.group_by, args.q)
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(pd.DataFrame(rows).to_string(index=False))
+    else:
+        serve(args.cube, args.host, args.port, args.verbose)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+"""
+Enforcement Audit Log Aggregator (约束干预审计日志聚合)
+
+Streams the audit records of constrained conditions (audit_log: on in
+conditions.yaml), i.e. the JSONL session reports in the ingest store
+(ingest/date=YYYY-MM-DD/station=<id>/reports.jsonl), and counts envelope
+interventions per (time window, station, condition, parameter):
+- a parameter counts as intervened when it is listed in `interventions` or its
+  requested and effective values differ (the browser audit only lists tempo)
+- windows are bucketed by received_at (browser exports without it: the
+  Date.now() in their traceId); only the last --retention windows per
+  station are kept in memory, older windows are appended to --history
+- clamp rates per window and rolling clamp rates over the last --rolling
+  windows are written to --out, per station and across all stations
+  (station_id = "all")
+
+--follow keeps tailing the store: .jsonl files are read from the last byte
+offset, incomplete trailing lines wait for the next poll and new partitions are
+picked up on every scan. .json report files (browser exports, possibly
+pretty-printed) are read once with session_reports.iter_reports. The time
+series is rewritten after each poll that read data.
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from session_reports import PARAM_ALIASES, find_report_files, iter_reports, parse_params, parse_value
+from summarize_runs import load_conditions
+
+AUDIT_PARAMS = ('tempo', 'gain', 'accent')
+# PARAM_ALIASES 规范名 -> 审计参数名
+AUDIT_NAMES = {'tempo_bpm': 'tempo', 'gain': 'gain', 'accent': 'accent'}
+# parse_params 输出中用于比较 requested / effective 的字段
+COMPARE_KEYS = {'tempo': 'tempo_bpm', 'gain': 'gain_db', 'accent': 'accent_ratio'}
+COUNT_COLUMNS = ['reports'] + [f'{p}_interventions' for p in AUDIT_PARAMS] + ['any_interventions']
+GROUP_COLUMNS = ['station_id', 'condition']
+# 浏览器生成的 traceId 形如 trace_<Date.now()>
+TRACE_TIME_RE = re.compile(r'_(\d{13})$')
+
+
+def parse_time(value):
+    """ISO 时间字符串 / epoch 秒或毫秒 -> epoch 秒；无法解析返回 None"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value / 1000.0 if value > 1e11 else float(value)
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def record_time(record):
+    """记录的时间：received_at 等时间字段，缺失时取 traceId 中的毫秒时间戳"""
+    ts = parse_time(record.get('received_at') or record.get('receivedAt') or record.get('timestamp'))
+    if ts is None:
+        match = TRACE_TIME_RE.search(str(record.get('trace_id') or record.get('traceId') or ''))
+        if match:
+            ts = int(match.group(1)) / 1000.0
+    return ts
+
+
+def _params(record, key):
+    params = record.get('params')
+    if isinstance(params, dict):
+        value = params.get(key)
+    else:
+        value = record.get(f'params_{key}')
+    return value if isinstance(value, dict) else {}
+
+
+def _display_values(params):
+    """显示参数 -> {审计参数名: (number, unit)}"""
+    values = {}
+    for key, value in params.items():
+        name = AUDIT_NAMES.get(PARAM_ALIASES.get(key.strip().lower()))
+        if name:
+            values[name] = parse_value(value)
+    return values
+
+
+def _differs(a, b):
+    return not (math.isnan(a) or math.isnan(b) or math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9))
+
+
+def intervened_params(record):
+    """一条记录中被干预的参数集合：interventions 列表 ∪ requested≠effective 的参数"""
+    found = set()
+    for item in record.get('interventions') or []:
+        if isinstance(item, dict) and isinstance(item.get('param'), str):
+            name = AUDIT_NAMES.get(PARAM_ALIASES.get(item['param'].strip().lower()))
+            if name:
+                found.add(name)
+    requested, effective = _params(record, 'requested'), _params(record, 'effective')
+    if requested and effective:
+        req, eff = _display_values(requested), _display_values(effective)
+        mixed = False
+        for param in req.keys() & eff.keys():
+            (a, unit_a), (b, unit_b) = req[param], eff[param]
+            if unit_a != unit_b:
+                mixed = True
+            elif _differs(a, b):
+                found.add(param)
+        if mixed:
+            # 两侧单位不同（如 0.3 与 30%）时换算为规范数值后再比较
+            req, eff = parse_params(requested), parse_params(effective)
+            found.update(param for param, key in COMPARE_KEYS.items() if _differs(req[key], eff[key]))
+    return found
+
+
+class AuditAggregator:
+    """按站点维护最近 retention 个时间窗的计数；每个站点的 received_at 单调，按各自的时钟淘汰"""
+
+    def __init__(self, window=60, retention=1440, conditions=None, history_path=None):
+        self.window = window
+        self.retention = retention
+        self.conditions = set(conditions) if conditions else None
+        self.history_path = history_path
+        self.windows = {}
+        self.latest = {}
+        self.records = 0
+        self.late = 0
+        self.untimed = 0
+        self.skipped = 0
+
+    def add(self, record):
+        if not isinstance(record, dict):
+            return
+        condition = record.get('condition')
+        # 浏览器报告不带 condition：保留为 unknown，只丢弃明确不在审计范围内的 condition
+        if condition and self.conditions is not None and condition not in self.conditions:
+            self.skipped += 1
+            return
+        condition = condition or 'unknown'
+        ts = record_time(record)
+        if ts is None:
+            self.untimed += 1
+            return
+        station = str(record.get('station_id') or record.get('stationId') or 'unknown')
+        start = int(ts // self.window) * self.window
+        windows = self.windows.setdefault(station, {})
+        latest = self.latest.get(station)
+        if latest is not None and start <= latest - self.retention * self.window:
+            self.late += 1
+            return
+
+        counts = windows.get((start, condition))
+        if counts is None:
+            counts = windows[(start, condition)] = np.zeros(len(COUNT_COLUMNS), dtype=np.int64)
+        counts[0] += 1
+        params = intervened_params(record)
+        for i, param in enumerate(AUDIT_PARAMS, start=1):
+            if param in params:
+                counts[i] += 1
+        if params:
+            counts[-1] += 1
+        self.records += 1
+
+        if latest is None or start > latest:
+            self.latest[station] = start
+            self._evict(station, start - self.retention * self.window)
+
+    def _evict(self, station, cutoff):
+        windows = self.windows[station]
+        expired = [key for key in windows if key[0] <= cutoff]
+        if not expired:
+            return
+        rows = [(station, condition, start, *windows.pop((start, condition)).tolist())
+                for start, condition in sorted(expired)]
+        if self.history_path:
+            started = os.path.exists(self.history_path) and os.path.getsize(self.history_path) > 0
+            with open(self.history_path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if not started:
+                    writer.writerow(GROUP_COLUMNS + ['window_start'] + COUNT_COLUMNS)
+                writer.writerows(rows)
+
+    def counts_frame(self):
+        rows = [(station, condition, start, *counts.tolist())
+                for station, windows in self.windows.items()
+                for (start, condition), counts in windows.items()]
+        return pd.DataFrame(rows, columns=GROUP_COLUMNS + ['window_start'] + COUNT_COLUMNS)
+
+
+def clamp_rate_series(counts, window=60, rolling=15):
+    """每个窗口的干预比例及最近 rolling 个窗口的滚动比例；另附 station_id='all' 的跨站点汇总"""
+    if counts.empty:
+        return counts
+    total = counts.groupby(['condition', 'window_start'], as_index=False)[COUNT_COLUMNS].sum()
+    total.insert(0, 'station_id', 'all')
+    df = pd.concat([counts, total], ignore_index=True)
+    df['window_start'] = pd.to_datetime(df['window_start'], unit='s', utc=True)
+    df = df.sort_values(GROUP_COLUMNS + ['window_start'], kind='stable').reset_index(drop=True)
+
+    # 按时间跨度滚动：缺失的窗口不占位，相当于计数为 0
+    rolled = (df.set_index('window_start').groupby(GROUP_COLUMNS, sort=False)[COUNT_COLUMNS]
+              .rolling(f'{rolling * window}s').sum().reset_index(drop=True))
+    for name in COUNT_COLUMNS[1:]:
+        param = name[:-len('_interventions')]
+        df[f'{param}_clamp_rate'] = df[name] / df['reports']
+        df[f'{param}_rolling_clamp_rate'] = rolled[name].to_numpy() / rolled['reports'].to_numpy()
+    df.insert(3, 'rolling_reports', rolled['reports'].to_numpy().astype(np.int64))
+    return df
+
+
+class StoreTailer:
+    """按字节偏移增量读取 JSONL 文件；不完整的末行留到下次读取，文件被截断时从头开始
+
+    .json 文件（可能是多行格式化的单个报告 / 数组）不按行解析，整体流式读取一次。
+    """
+
+    def __init__(self, inputs, from_end=False, chunk_size=1 << 22):
+        self.inputs = inputs
+        self.chunk_size = chunk_size
+        self.offsets = {}
+        self.bad_records = 0
+        if from_end:
+            for path in find_report_files(inputs):
+                self.offsets[path] = os.path.getsize(path)
+
+    def poll(self):
+        """读取所有文件自上次以来新增的完整行，逐条产出解析后的记录"""
+        for path in find_report_files(self.inputs):
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if not path.endswith('.jsonl'):
+                if path not in self.offsets:
+                    self.offsets[path] = size
+                    try:
+                        yield from iter_reports(path)
+                    except ValueError:
+                        self.bad_records += 1
+                continue
+            offset = self.offsets.get(path, 0)
+            if size < offset:
+                offset = 0
+            if size == offset:
+                continue
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                while True:
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    end = chunk.rfind(b'\n')
+                    if end < 0:
+                        if len(chunk) < self.chunk_size:
+                            break
+                        # 单行超过 chunk_size：扩大读取块
+                        self.chunk_size *= 2
+                        f.seek(offset)
+                        continue
+                    for line in chunk[:end].splitlines():
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            self.bad_records += 1
+                    offset += end + 1
+                    f.seek(offset)
+            self.offsets[path] = offset
+
+
+def write_series(aggregator, out_path, rolling):
+    series = clamp_rate_series(aggregator.counts_frame(), aggregator.window, rolling)
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    tmp = f'{out_path}.tmp'
+    series.to_csv(tmp, index=False)
+    os.replace(tmp, out_path)
+    return series
+
+
+def audit_conditions(conditions_path):
+    """conditions.yaml 中 audit_log 打开的 condition"""
+    return [name for name, spec in load_conditions(conditions_path).items()
+            if str((spec or {}).get('audit_log', '')).lower() in ('on', 'true')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate enforcement interventions from audit logs')
+    parser.add_argument('inputs', nargs='*', default=['ingest'],
+                        help='Ingest store directory or JSONL report files (default: ingest)')
+    parser.add_argument('--conditions', default=None,
+                        help='conditions.yaml; records of conditions with audit_log: off are dropped '
+                             '(records without a condition are kept as "unknown")')
+    parser.add_argument('--window', type=int, default=60, help='Window length in seconds')
+    parser.add_argument('--rolling', type=int, default=15, help='Windows per rolling clamp rate')
+    parser.add_argument('--retention', type=int, default=1440, help='Windows kept in memory per station')
+    parser.add_argument('--out', default='reports/audit_clamp_rates.csv')
+    parser.add_argument('--history', default=None,
+                        help='Append counts of windows that fall out of --retention to this CSV')
+    parser.add_argument('--follow', action='store_true', help='Keep tailing the inputs')
+    parser.add_argument('--from-end', action='store_true', help='With --follow, skip existing lines')
+    parser.add_argument('--poll', type=float, default=5.0, help='Seconds between polls with --follow')
+    args = parser.parse_args()
+
+    conditions = audit_conditions(args.conditions) if args.conditions else None
+    aggregator = AuditAggregator(args.window, max(args.retention, args.rolling), conditions, args.history)
+    tailer = StoreTailer(args.inputs, from_end=args.follow and args.from_end)
+
+    def update():
+        before = aggregator.records + aggregator.late + aggregator.untimed + aggregator.skipped
+        for record in tailer.poll():
+            aggregator.add(record)
+        after = aggregator.records + aggregator.late + aggregator.untimed + aggregator.skipped
+        return after - before
+
+    update()
+    series = write_series(aggregator, args.out, args.rolling)
+    print(f'Aggregated {aggregator.records} records into {len(series)} window rows -> {args.out}')
+    if not args.follow:
+        if aggregator.late or aggregator.untimed or aggregator.skipped or tailer.bad_records:
+            print(f'Dropped: {aggregator.skipped} from non-audited conditions, {aggregator.late} late, '
+                  f'{aggregator.untimed} without timestamp, '
+                  f'{tailer.bad_records} unparsable lines / files')
+        return
+
+    try:
+        while True:
+            time.sleep(args.poll)
+            if update():
+                series = write_series(aggregator, args.out, args.rolling)
+                print(f'{datetime.now(timezone.utc).isoformat(timespec="seconds")} '
+                      f'{aggregator.records} records, {len(series)} window rows')
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""
+Batch Figure Build (批量生成六联图)
+
+Renders the hexad figure for every non-baseline condition in conditions.yaml, in
+each requested style and format, with one command:
+- summary_runs and paired_summary_all are read once and baseline is paired with
+  each condition in the parent process
+- one task per (condition, style) draws the figure once and saves every format;
+  tasks run in a process pool
+- each figure's input hash (paired data, envelope, plot options and the plotting
+  code) is recorded in a build manifest; figures whose hash is unchanged and
+  whose file exists are skipped (--force re-renders everything)
+- statistics are computed once per condition (or reused from the figures'
+  <name>.stats.json sidecars when the input hash matches) and collected into
+  reports/hexad_stats.csv from the sidecars
+
+Output names follow figures/: hexad_<suffix>.<fmt> (supplement) and
+hexad_<suffix>_main.<fmt> (main), with suffix = condition minus 'constrained_'.
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import yaml
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.utils.envelope_loader import load_envelope
+from scripts.compose_hexad_kde import (DENSITY_AUTO_N, L2_RENDERS, PAIRED_COLUMNS, SUMMARY_COLUMNS,
+                                       figure_key, get_paired_csv_path, hexad_key, prepare_hexad_inputs,
+                                       render_hexad, resolve_hexad_stats, stats_sidecar_path)
+from scripts.table_io import read_table
+
+STYLES = ('supplement', 'main')
+
+
+def figure_path(out_dir, condition, style, fmt):
+    suffix = condition.replace('constrained_', '')
+    return os.path.join(out_dir, f'hexad_{suffix}{"_main" if style == "main" else ""}.{fmt}')
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_paired(paired_all, conditions, fmt='csv'):
+    """读入各 condition 的 paired 行；优先用长表 paired_summary_all，否则逐个读 paired_summary_<suffix>"""
+    if os.path.exists(paired_all):
+        df = read_table(paired_all, columns=PAIRED_COLUMNS + ['condition'], conditions=conditions)
+        return {condition: group.drop(columns='condition')
+                for condition, group in df.groupby('condition', observed=True)}
+    paired = {}
+    for condition in conditions:
+        path = get_paired_csv_path(condition, fmt)
+        if os.path.exists(path):
+            paired[condition] = read_table(path, columns=PAIRED_COLUMNS)
+    return paired
+
+
+def stats_table(sidecar_paths):
+    """由统计 sidecar 生成报表：每个 condition 一行，列为 <panel>_<stat>（不读原始数据）"""
+    rows = {}
+    for path in sidecar_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            sidecar = json.load(f)
+        row = {'condition': sidecar['condition'], 'input_hash': sidecar['input_hash']}
+        for panel, values in sidecar['stats'].items():
+            row.update({f'{panel}_{name}': value for name, value in values.items()})
+        rows[sidecar['condition']] = row
+    return pd.DataFrame(list(rows.values()))
+
+
+def _render_task(task):
+    key, condition, style, paths, merged_l2, df_paired, envelope, stats, options = task
+    stats = render_hexad(merged_l2, df_paired, condition, envelope, paths, style=style, stats=stats, **options)
+    return key, condition, style, paths, stats
+
+
+def build_figures(summary, paired_all, conditions_yaml, conditions=None, styles=STYLES, formats=('svg',),
+                  out_dir='figures', manifest_path=None, workers=None, force=False, fmt='csv',
+                  stats_table_path='reports/hexad_stats.csv', **options):
+    """批量生成六联图
+
+    Args:
+        conditions: 要绘制的 condition；None 表示 conditions.yaml 中除 baseline 外的全部
+        options: 传给 render_hexad 的绘图参数（dpi、figsize、use_histogram、show_clamp_bounds、kde_bw、
+            l2_render）
+        stats_table_path: 由本次构建的统计 sidecar 汇总的报表；None 表示不写
+
+    Returns:
+        (rendered, skipped)：重新生成的文件列表与跳过的文件列表
+    """
+    with open(conditions_yaml, 'r', encoding='utf-8') as f:
+        all_conditions = yaml.safe_load(f)['conditions']
+    if conditions is None:
+        conditions = [c for c in all_conditions if c != 'baseline']
+    unknown = [c for c in conditions if c not in all_conditions]
+    if unknown:
+        raise ValueError(f'Unknown condition(s): {unknown}')
+
+    manifest_path = manifest_path or os.path.join(out_dir, 'figure_manifest.json')
+    manifest = {} if force else load_manifest(manifest_path)
+
+    df_summary = read_table(summary, columns=SUMMARY_COLUMNS, conditions=['baseline'] + list(conditions))
+    paired = load_paired(paired_all, conditions, fmt)
+
+    tasks, skipped, sidecars = [], [], []
+    for condition in conditions:
+        if condition not in paired:
+            print(f'WARNING: no paired data for {condition}, skipped')
+            continue
+        try:
+            merged_l2, df_paired = prepare_hexad_inputs(df_summary, paired[condition], condition)
+        except ValueError as e:
+            print(f'WARNING: {e}, skipped')
+            continue
+        envelope = load_envelope(conditions_yaml, condition)
+        input_hash = hexad_key(merged_l2, df_paired, envelope, condition)
+        condition_sidecars = [stats_sidecar_path(figure_path(out_dir, condition, style, formats[0]))
+                              for style in styles]
+        stats = resolve_hexad_stats(merged_l2, df_paired, condition, envelope, input_hash, condition_sidecars)
+        sidecars.extend(condition_sidecars)
+        for style in styles:
+            key = figure_key(input_hash, style=style,
+                             **{k: list(v) if isinstance(v, tuple) else v for k, v in options.items()})
+            paths = [figure_path(out_dir, condition, style, ext) for ext in formats]
+            stale = [p for p in paths if manifest.get(p) != key or not os.path.exists(p)]
+            skipped.extend(p for p in paths if p not in stale)
+            if stale:
+                tasks.append((key, condition, style, stale, merged_l2, df_paired, envelope, stats, options))
+
+    rendered = []
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_render_task, task) for task in tasks]
+            for future in as_completed(futures):
+                key, condition, style, paths, stats = future.result()
+                for path in paths:
+                    manifest[path] = key
+                rendered.extend(paths)
+                save_manifest(manifest, manifest_path)
+                print(f'{condition} [{style}]: {", ".join(paths)} '
+                      f'(clamp tempo={stats["tempo"]["clamp_rate"]:.1%}, '
+                      f'gain={stats["gain"]["clamp_rate"]:.1%}, accent={stats["accent"]["clamp_rate"]:.1%})')
+
+    if stats_table_path and sidecars:
+        os.makedirs(os.path.dirname(stats_table_path) or '.', exist_ok=True)
+        stats_table(sidecars).to_csv(stats_table_path, index=False)
+        print(f'Saved: {stats_table_path}')
+    return rendered, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render hexad figures for all conditions / styles / formats')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help='Format of the default summary/paired inputs')
+    parser.add_argument('--summary', default=None,
+                        help='Path to summary_runs (default: summary/summary_runs.<format>)')
+    parser.add_argument('--paired-all', default=None,
+                        help='Long-form paired table (default: summary/paired_summary_all.<format>)')
+    parser.add_argument('--conditions_yaml', default='conditions.yaml')
+    parser.add_argument('--condition', nargs='*', default=None,
+                        help='Conditions to render (default: all non-baseline conditions)')
+    parser.add_argument('--styles', nargs='+', choices=STYLES, default=list(STYLES))
+    parser.add_argument('--formats', nargs='+', default=['svg'], help='Output formats, e.g. svg png pdf')
+    parser.add_argument('--out-dir', default='figures')
+    parser.add_argument('--manifest', default=None,
+                        help='Build manifest of figure input hashes (default: <out-dir>/figure_manifest.json)')
+    parser.add_argument('--dpi', type=int, default=200)
+    parser.add_argument('--width', type=float, default=15)
+    parser.add_argument('--height', type=float, default=9)
+    parser.add_argument('--kde', action='store_true', help='Use KDE instead of histogram for L1 plots')
+    parser.add_argument('--kde-bw', default='scott',
+                        help="KDE bandwidth: 'scott', 'silverman', 'isj' or a scalar factor of the std")
+    parser.add_argument('--show-clamp-bounds', action='store_true')
+    parser.add_argument('--l2-render', choices=L2_RENDERS + ('auto',), default='scatter',
+                        help=f'L2 point rendering (auto: hexbin above {DENSITY_AUTO_N} runs)')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help='Re-render even if inputs are unchanged')
+    parser.add_argument('--stats-table', default='reports/hexad_stats.csv',
+                        help='Per-condition statistics table built from the .stats.json sidecars (empty: skip)')
+    args = parser.parse_args()
+
+    kde_bw = args.kde_bw
+    if kde_bw not in ('scott', 'silverman', 'isj'):
+        try:
+            kde_bw = float(kde_bw)
+        except ValueError:
+            parser.error(f'--kde-bw: expected scott, silverman, isj or a number, got {kde_bw!r}')
+
+    try:
+        rendered, skipped = build_figures(
+            summary=args.summary or f'summary/summary_runs.{args.format}',
+            paired_all=args.paired_all or f'summary/paired_summary_all.{args.format}',
+            conditions_yaml=args.conditions_yaml,
+            conditions=args.condition,
+            styles=args.styles,
+            formats=[f.lstrip('.').lower() for f in args.formats],
+            out_dir=args.out_dir,
+            manifest_path=args.manifest,
+            workers=args.workers,
+            force=args.force,
+            fmt=args.format,
+            stats_table_path=args.stats_table or None,
+            dpi=args.dpi,
+            figsize=(args.width, args.height),
+            use_histogram=not args.kde,
+            show_clamp_bounds=args.show_clamp_bounds,
+            kde_bw=kde_bw,
+            l2_render=args.l2_render,
+        )
+    except (FileNotFoundError, KeyError, ValueError) as e:
+        raise SystemExit(f'Error: {e}')
+    print(f'Rendered {len(rendered)} figure(s), {len(skipped)} unchanged')
+
+
+if __name__ == '__main__':
+    main()
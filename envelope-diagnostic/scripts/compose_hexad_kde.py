@@ -4,20 +4,48 @@ Hexad Plot Composer with KDE (六联图 - KDE 版本)
 Generates a 2x3 hexad plot combining:
 - Row 1 (L2 参数层): Tempo, Gain, Accent Ratio
 - Row 2 (L1 信号层): ΔOnset Density, ΔLUFS, ΔLRA (KDE 密度曲线)
+
+Panel statistics (clamp rates, L1 N / median / mean / IQR) are written next to the
+figure as <name>.stats.json, keyed by the hash of the paired input data, and
+reused when only styling options change.
 """
 
 import argparse
+import functools
+import hashlib
+import json
 import os
 import sys
 
+import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from scipy import stats
+from matplotlib.colors import LinearSegmentedColormap, LogNorm, to_rgb
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.utils.envelope_loader import load_envelope, get_tempo_bounds, get_gain_bounds_db
+from scripts.content_hash import content_hash, frame_hash
+from scripts.fast_kde import fft_kde
+from scripts.memo_cache import MISSING, MemoCache, memoize
+from scripts.run_index import query_runs
+from scripts.table_io import read_table
+
+# 六联图只需要的列（Parquet 时只读这些列和对应 condition 分区）
+SUMMARY_COLUMNS = ['trace_id', 'seed', 'condition', 'tempo_req', 'tempo_eff',
+                   'gain_req', 'gain_eff', 'accent_req', 'accent_eff']
+PAIRED_COLUMNS = ['trace_id', 'seed', 'tempo_clamped', 'gain_clamped', 'accent_clamped',
+                  'delta_integrated_lufs', 'delta_lra_lu', 'delta_onset_density_eps']
+
+# L2 面板的散点渲染方式；密度模式下图像大小与 run 数无关
+L2_RENDERS = ('scatter', 'raster', 'hexbin', 'hist2d')
+DENSITY_GRIDSIZE = 60
+DENSITY_AUTO_N = 50_000
+# 统计 sidecar 格式版本；统计口径变化时递增
+STATS_VERSION = 1
+# 绘图代码本身也计入图像缓存键，改动绘图逻辑后图会重新生成
+RENDER_SOURCES = ('compose_hexad_kde.py', 'fast_kde.py')
 
 
 def get_accent_bounds(envelope: dict):
@@ -27,8 +55,57 @@ def get_accent_bounds(envelope: dict):
     return (envelope['accent_ratio']['min'], envelope['accent_ratio']['max'])
 
 
+def _light_cmap(color):
+    """从浅色（与白色混合）到 color 的单色 colormap，用于密度面板"""
+    rgb = np.array(to_rgb(color))
+    return LinearSegmentedColormap.from_list(f'density_{color}', [rgb + (1 - rgb) * 0.75, rgb])
+
+
+def _draw_points(ax, x, y, color, label, render, line_range):
+    """按 render 方式绘制一类散点
+
+    scatter: 每个点一个矢量元素；raster: 同样的散点但点层栅格化（坐标轴和文字仍为矢量）；
+    hexbin / hist2d: 分箱后按计数（对数）着色，元素数与 N 无关
+    """
+    if len(x) == 0 or render in ('scatter', 'raster'):
+        ax.scatter(x, y, s=18, alpha=0.7, color=color, label=label, zorder=2, rasterized=render == 'raster')
+        return
+    # 图例用空散点占位，保持与 scatter 模式相同的图例
+    ax.scatter([], [], s=18, alpha=0.7, color=color, label=label)
+    if render == 'hexbin':
+        ax.hexbin(x, y, gridsize=DENSITY_GRIDSIZE, extent=(*line_range, *line_range), mincnt=1, bins='log',
+                  cmap=_light_cmap(color), linewidths=0, zorder=2)
+    else:
+        ax.hist2d(x, y, bins=DENSITY_GRIDSIZE, range=[line_range, line_range], cmin=1, norm=LogNorm(),
+                  cmap=_light_cmap(color), rasterized=True, zorder=2)
+
+
+def _clamp_sides(y, is_clamped, clamp_bounds, tolerance=0.01):
+    """区分 clamp 到上界和下界的点"""
+    if clamp_bounds is None:
+        return np.zeros(len(y), dtype=bool), np.zeros(len(y), dtype=bool)
+    bound_min, bound_max = clamp_bounds
+    return is_clamped & (y >= bound_max - tolerance), is_clamped & (y <= bound_min + tolerance)
+
+
+def l2_panel_stats(y, is_clamped=None, clamp_bounds=None):
+    """L2 面板统计量：clamp 率与上 / 下界 clamp 计数"""
+    if is_clamped is None:
+        is_clamped = np.zeros(len(y), dtype=bool)
+    clamped_to_max, clamped_to_min = _clamp_sides(y, is_clamped, clamp_bounds)
+    n_total = len(y)
+    n_clamped = int(is_clamped.sum())
+    return {
+        'clamp_rate': n_clamped / n_total if n_total > 0 else 0.0,
+        'n_clamped': n_clamped,
+        'n_total': n_total,
+        'n_clamped_max': int(clamped_to_max.sum()),
+        'n_clamped_min': int(clamped_to_min.sum()),
+    }
+
+
 def plot_l2_panel(ax, x, y, title, xlabel, ylabel, is_clamped=None, show_clamp_rate=True,
-                  clamp_bounds=None, style='supplement'):
+                  clamp_bounds=None, style='supplement', render='scatter', stats=None):
     """绘制 L2 曲棍图面板
     
     Args:
@@ -42,6 +119,9 @@ def plot_l2_panel(ax, x, y, title, xlabel, ylabel, is_clamped=None, show_clamp_r
         show_clamp_rate: whether to show clamp rate annotation
         clamp_bounds: tuple (min, max) for clamp boundary lines, or None to skip
         style: 'main' (精简) or 'supplement' (完整)
+        render: 散点渲染方式 'scatter' / 'raster' / 'hexbin' / 'hist2d'，
+            'auto' 在 N > DENSITY_AUTO_N 时使用 hexbin
+        stats: 预先计算的 l2_panel_stats 结果（统计量缓存命中时传入），None 则现算
     """
     # 学术配色方案
     COLOR_INBOUNDS = '#9CB0C3'   # 蓝灰色 - 未被 clamp 的点
@@ -52,51 +132,44 @@ def plot_l2_panel(ax, x, y, title, xlabel, ylabel, is_clamped=None, show_clamp_r
     if is_clamped is None:
         is_clamped = np.zeros(len(x), dtype=bool)
     
-    n_total = len(x)
-    
     data_min = min(x.min(), y.min())
     data_max = max(x.max(), y.max())
     margin = (data_max - data_min) * 0.1 if (data_max - data_min) > 0 else 1.0
     line_range = [data_min - margin, data_max + margin]
     
     # 区分 clamp 到上界和下界的点
-    if clamp_bounds is not None:
-        bound_min, bound_max = clamp_bounds
-        tolerance = 0.01
-        clamped_to_max = is_clamped & (y >= bound_max - tolerance)
-        clamped_to_min = is_clamped & (y <= bound_min + tolerance)
-    else:
-        clamped_to_max = np.zeros(len(x), dtype=bool)
-        clamped_to_min = np.zeros(len(x), dtype=bool)
-    
-    n_clamped = is_clamped.sum()
-    n_clamped_max = clamped_to_max.sum()
-    n_clamped_min = clamped_to_min.sum()
-    clamp_rate = n_clamped / n_total if n_total > 0 else 0.0
-    
+    clamped_to_max, clamped_to_min = _clamp_sides(y, is_clamped, clamp_bounds)
+    if stats is None:
+        stats = l2_panel_stats(y, is_clamped, clamp_bounds)
+    n_total = stats['n_total']
+    n_clamped = stats['n_clamped']
+    n_clamped_max = stats['n_clamped_max']
+    n_clamped_min = stats['n_clamped_min']
+    clamp_rate = stats['clamp_rate']
+    
+    if render == 'auto':
+        render = 'hexbin' if n_total > DENSITY_AUTO_N else 'scatter'
+    if render not in L2_RENDERS:
+        raise ValueError(f'Unknown L2 render mode: {render}')
+
     # 绘制散点 - 分三类，始终显示所有类别的 legend
     # main 风格：不显示计数；supplement 风格：显示计数
-    ax.scatter(x[~is_clamped], y[~is_clamped], s=18, alpha=0.7, color=COLOR_INBOUNDS, label='In-bounds', zorder=2)
+    in_bounds = ~is_clamped
+    _draw_points(ax, x[in_bounds], y[in_bounds], COLOR_INBOUNDS, 'In-bounds', render, line_range)
     
-    # Clamped↑ - 始终添加到 legend（即使没有数据点）
+    # Clamped↑ / Clamped↓ - 始终添加到 legend（没有数据点时为空散点）
     label_max = 'Clamped↑' if style == 'main' else f'Clamped↑ ({n_clamped_max})'
-    if n_clamped_max > 0:
-        ax.scatter(x[clamped_to_max], y[clamped_to_max], s=18, alpha=0.7, color=COLOR_BOUND_MAX, label=label_max, zorder=2)
-    else:
-        ax.scatter([], [], s=18, alpha=0.7, color=COLOR_BOUND_MAX, label=label_max)  # 空散点用于 legend
+    _draw_points(ax, x[clamped_to_max], y[clamped_to_max], COLOR_BOUND_MAX, label_max, render, line_range)
     
-    # Clamped↓ - 始终添加到 legend（即使没有数据点）
     label_min = 'Clamped↓' if style == 'main' else f'Clamped↓ ({n_clamped_min})'
-    if n_clamped_min > 0:
-        ax.scatter(x[clamped_to_min], y[clamped_to_min], s=18, alpha=0.7, color=COLOR_BOUND_MIN, label=label_min, zorder=2)
-    else:
-        ax.scatter([], [], s=18, alpha=0.7, color=COLOR_BOUND_MIN, label=label_min)  # 空散点用于 legend
+    _draw_points(ax, x[clamped_to_min], y[clamped_to_min], COLOR_BOUND_MIN, label_min, render, line_range)
     
     # 绘制 y=x 参考线（黑色虚线）- 线宽降低，作为参考线不应比数据更抢眼
     ax.plot(line_range, line_range, '--', color=COLOR_REFLINE, linewidth=1.0, zorder=3)
     
     # 绘制 clamp 边界线（如果提供）- 上界绿色，下界橙色，线宽降低、透明度提高
     if clamp_bounds is not None:
+        bound_min, bound_max = clamp_bounds
         ax.axhline(y=bound_min, color=COLOR_BOUND_MIN, linestyle=':', linewidth=1.5, alpha=0.7, zorder=4)
         ax.axhline(y=bound_max, color=COLOR_BOUND_MAX, linestyle=':', linewidth=1.5, alpha=0.7, zorder=4)
     
@@ -118,7 +191,18 @@ def plot_l2_panel(ax, x, y, title, xlabel, ylabel, is_clamped=None, show_clamp_r
     ax.tick_params(labelsize=8)
     ax.grid(alpha=0.2)
     
-    return {'clamp_rate': clamp_rate, 'n_clamped': n_clamped, 'n_total': n_total}
+    return stats
+
+
+def l1_stats(data: pd.Series) -> dict:
+    """L1 Δ 面板统计量（N、中位数、均值、IQR、标准差）"""
+    clean_data = data.dropna()
+    n = len(clean_data)
+    if n < 2:
+        return {'n': n, 'median': 0, 'mean': 0, 'iqr': 0, 'std': 0}
+    q1, median, q3 = clean_data.quantile([0.25, 0.5, 0.75])
+    return {'n': n, 'median': float(median), 'mean': float(clean_data.mean()), 'iqr': float(q3 - q1),
+            'std': float(clean_data.std())}
 
 
 def plot_l1_histogram(
@@ -132,7 +216,8 @@ def plot_l1_histogram(
     bin_center_at_zero: bool = True,  # 是否让 0 在 bin 中心
     xlim: tuple = None,  # 固定 x 轴范围 (min, max)
     show_ylabel: bool = True,  # 是否显示 y 轴标签
-    style: str = 'supplement'  # 'main' or 'supplement'
+    style: str = 'supplement',  # 'main' or 'supplement'
+    stats: dict = None  # 预先计算的 l1_stats 结果，None 则现算
 ) -> dict:
     """
     绘制 L1 Δ 直方图
@@ -149,14 +234,12 @@ def plot_l1_histogram(
             ax.set_ylabel('Count')
         if xlim:
             ax.set_xlim(xlim)
-        return {'n': n, 'median': 0, 'mean': 0, 'iqr': 0}
+        return l1_stats(clean_data)
     
     # 计算统计量
-    median = clean_data.median()
-    mean = clean_data.mean()
-    q1 = clean_data.quantile(0.25)
-    q3 = clean_data.quantile(0.75)
-    iqr = q3 - q1
+    if stats is None:
+        stats = l1_stats(clean_data)
+    median, iqr = stats['median'], stats['iqr']
     
     # 使用固定范围或数据范围
     if xlim:
@@ -214,7 +297,7 @@ def plot_l1_histogram(
         ax.set_ylabel('Count', fontsize=9)
     ax.tick_params(labelsize=8)
     
-    return {'n': n, 'median': median, 'mean': mean, 'iqr': iqr}
+    return stats
 
 
 def plot_l1_kde(
@@ -225,27 +308,34 @@ def plot_l1_kde(
     show_stats: bool = True,
     zero_line: bool = True,
     color: str = '#7C9D97',  # 学术配色 - 青绿色
-    fill_alpha: float = 0.4
+    fill_alpha: float = 0.4,
+    bw_method='scott',
+    weights: pd.Series = None,
+    stats: dict = None
 ) -> dict:
     """
-    绘制 L1 Δ KDE 密度曲线
+    绘制 L1 Δ KDE 密度曲线（分箱 FFT KDE，见 fast_kde.py）
+
+    Args:
+        bw_method: 'scott' / 'silverman' / 'isj' 或标量因子
+        weights: 与 data 同索引的样本权重，None 表示等权
+        stats: 预先计算的 l1_stats 结果，None 则现算
     """
     clean_data = data.dropna()
+    if weights is not None:
+        weights = weights.reindex(clean_data.index).fillna(0.0)
     n = len(clean_data)
     
     if n < 2:
         ax.set_title(title)
         ax.set_xlabel(xlabel)
         ax.set_ylabel('Density')
-        return {'n': n, 'median': 0, 'mean': 0, 'iqr': 0}
+        return l1_stats(clean_data)
     
     # 计算统计量
-    median = clean_data.median()
-    mean = clean_data.mean()
-    q1 = clean_data.quantile(0.25)
-    q3 = clean_data.quantile(0.75)
-    iqr = q3 - q1
-    std = clean_data.std()
+    if stats is None:
+        stats = l1_stats(clean_data)
+    median, mean, iqr, std = stats['median'], stats['mean'], stats['iqr'], stats['std']
     
     # 检查数据方差是否足够（避免 KDE 奇异矩阵错误）
     if std < 1e-6:
@@ -254,13 +344,13 @@ def plot_l1_kde(
         if zero_line:
             ax.axvline(x=0, color='black', linestyle='--', linewidth=1.5, label='x=0')
     else:
-        # 计算 KDE
-        kde = stats.gaussian_kde(clean_data)
-        
         # 生成 x 轴范围（以 0 为中心对称）
         data_max = max(abs(clean_data.min()), abs(clean_data.max())) * 1.1
         x_range = np.linspace(-data_max, data_max, 500)
-        y_kde = kde(x_range)
+
+        # 计算 KDE（线性分箱 + FFT 卷积，与 gaussian_kde 曲线一致）
+        y_kde, _ = fft_kde(clean_data.to_numpy(), x_range, bw_method=bw_method,
+                           weights=None if weights is None else weights.to_numpy())
         
         # 绘制 KDE 曲线和填充
         ax.plot(x_range, y_kde, color=color, linewidth=2)
@@ -292,7 +382,135 @@ def plot_l1_kde(
     ax.set_ylabel('Density')
     ax.set_ylim(bottom=0)
     
-    return {'n': n, 'median': median, 'mean': mean, 'iqr': iqr}
+    return stats
+
+
+def prepare_hexad_inputs(df_summary, df_paired, condition, selection=None):
+    """由已读入的 summary / paired 表准备一个 condition 的绘图输入
+
+    Args:
+        df_summary: 至少包含 baseline 与 condition 的 summary 行（SUMMARY_COLUMNS）
+        df_paired: 该 condition 的 paired 行（PAIRED_COLUMNS）
+        selection: 只保留这些 (trace_id, seed)；None 表示全部
+
+    Returns:
+        (merged_l2, df_paired)：baseline 与 condition 按 (trace_id, seed) 配对的 L2 表和 L1 表
+    """
+    base = df_summary[df_summary['condition'] == 'baseline']
+    con = df_summary[df_summary['condition'] == condition]
+    merged_l2 = base.merge(con, on=['trace_id', 'seed'], suffixes=('_baseline', '_constrained'))
+    if selection is not None:
+        keys = pd.MultiIndex.from_frame(merged_l2[['trace_id', 'seed']])
+        merged_l2 = merged_l2[keys.isin(list(selection))]
+
+    if merged_l2.empty:
+        raise ValueError(f'No L2 data found for condition: {condition}')
+
+    if selection is not None:
+        keys = pd.MultiIndex.from_frame(df_paired[['trace_id', 'seed']])
+        df_paired = df_paired[keys.isin(list(selection))]
+
+    if df_paired.empty:
+        raise ValueError(f'No L1 data found for condition: {condition}')
+    return merged_l2, df_paired
+
+
+def hexad_key(merged_l2, df_paired, envelope, condition):
+    """六联图输入的内容哈希：配对后的 L2 / L1 数据、envelope 与 condition（与绘图参数无关）"""
+    return content_hash({
+        'kind': 'hexad_input', 'l2': frame_hash(merged_l2.reset_index(drop=True)),
+        'l1': frame_hash(df_paired.reset_index(drop=True)), 'envelope': envelope, 'condition': condition,
+    })
+
+
+@functools.lru_cache(maxsize=None)
+def render_code_hash():
+    h = hashlib.sha256()
+    for name in RENDER_SOURCES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def figure_key(input_hash, **options):
+    """图像缓存键：输入哈希 + 绘图参数 + 绘图代码哈希"""
+    return content_hash({'kind': 'hexad', 'input': input_hash, 'matplotlib': matplotlib.__version__,
+                         'code': render_code_hash(), **options})
+
+
+def hexad_bounds(envelope):
+    """(tempo, gain (dB), accent) clamp 边界"""
+    return get_tempo_bounds(envelope), get_gain_bounds_db(envelope), get_accent_bounds(envelope)
+
+
+def hexad_clamp_flags(merged_l2, df_paired):
+    """从 paired 表获取真实的 clamp 标记，按 (trace_id, seed) 与 merged_l2 对齐"""
+    clamp_flags = {'tempo': None, 'gain': None, 'accent': None}
+    if 'tempo_clamped' in df_paired.columns:
+        paired_merged = merged_l2.merge(
+            df_paired[['trace_id', 'seed', 'tempo_clamped', 'gain_clamped', 'accent_clamped']], 
+            on=['trace_id', 'seed'], how='left'
+        )
+        for param in clamp_flags:
+            clamp_flags[param] = paired_merged[f'{param}_clamped'].fillna(0).astype(bool).values
+    return clamp_flags
+
+
+def lra_delta(df_paired, condition):
+    """对于 relaxed 模式，LRA delta 需要取反（因为原始计算方向相反）"""
+    lra_data = df_paired['delta_lra_lu']
+    return -lra_data if 'relaxed' in condition else lra_data
+
+
+def compute_hexad_stats(merged_l2, df_paired, condition, envelope):
+    """六联图各面板的统计量（与样式、配色、渲染方式无关）"""
+    clamp_flags = hexad_clamp_flags(merged_l2, df_paired)
+    stats = {}
+    for param, bounds in zip(('tempo', 'gain', 'accent'), hexad_bounds(envelope)):
+        stats[param] = l2_panel_stats(merged_l2[f'{param}_eff_constrained'].values, clamp_flags[param], bounds)
+    stats['lufs'] = l1_stats(df_paired['delta_integrated_lufs'])
+    stats['lra'] = l1_stats(lra_delta(df_paired, condition))
+    stats['onset'] = l1_stats(df_paired['delta_onset_density_eps'])
+    return stats
+
+
+def stats_sidecar_path(output_path):
+    """图像旁的统计 sidecar：figures/hexad_tight.svg -> figures/hexad_tight.stats.json"""
+    return os.path.splitext(output_path)[0] + '.stats.json'
+
+
+def load_stats_sidecar(path, input_hash):
+    """读取 sidecar；不存在、版本不符或输入哈希不同时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if sidecar.get('version') != STATS_VERSION or sidecar.get('input_hash') != input_hash:
+        return None
+    return sidecar['stats']
+
+
+def write_stats_sidecar(path, input_hash, condition, stats):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': STATS_VERSION, 'input_hash': input_hash, 'condition': condition, 'stats': stats},
+                  f, indent=2, default=lambda v: v.item())
+    os.replace(tmp_path, path)
+
+
+def resolve_hexad_stats(merged_l2, df_paired, condition, envelope, input_hash, sidecar_paths, cache=None):
+    """统计量优先取自输入哈希一致的 sidecar，其次取自缓存，都没有才计算；并补写缺失 / 过期的 sidecar"""
+    found = {path: load_stats_sidecar(path, input_hash) for path in sidecar_paths}
+    stats = next((v for v in found.values() if v is not None), None)
+    if stats is None:
+        stats_key = content_hash({'kind': 'hexad_stats', 'input': input_hash, 'version': STATS_VERSION})
+        stats = memoize(cache, stats_key, lambda: compute_hexad_stats(merged_l2, df_paired, condition, envelope))
+    for path, value in found.items():
+        if value is None:
+            write_stats_sidecar(path, input_hash, condition, stats)
+    return stats
 
 
 def compose_hexad_kde(
@@ -305,7 +523,11 @@ def compose_hexad_kde(
     figsize: tuple = (15, 9),
     use_histogram: bool = False,
     show_clamp_bounds: bool = False,
-    style: str = 'supplement'  # 'main' (精简) or 'supplement' (完整)
+    style: str = 'supplement',  # 'main' (精简) or 'supplement' (完整)
+    selection: set = None,
+    cache: MemoCache = None,
+    kde_bw='scott',
+    l2_render: str = 'scatter'
 ) -> dict:
     """
     生成六联图 (2x3) - KDE 或直方图版本
@@ -314,6 +536,11 @@ def compose_hexad_kde(
         use_histogram: 如果为 True，L1 层使用直方图；否则使用 KDE
         show_clamp_bounds: 如果为 True，在 L2 图上显示 clamp 边界线
         style: 'main' (精简，适合主文) or 'supplement' (完整，适合补充材料)
+        selection: 只绘制这些 (trace_id, seed)；None 表示全部（见 --index）
+        cache: 结果缓存；输入数据、envelope 与绘图参数都未变时直接写出缓存的图像
+            统计量写入图像旁的 <name>.stats.json（按输入哈希复用，见 resolve_hexad_stats）
+        kde_bw: KDE 带宽方法（'scott' / 'silverman' / 'isj' 或标量因子）
+        l2_render: L2 面板渲染方式（见 plot_l2_panel）
     """
     if not os.path.exists(summary_csv):
         raise FileNotFoundError(f'Missing {summary_csv}')
@@ -323,36 +550,50 @@ def compose_hexad_kde(
         raise FileNotFoundError(f'Missing {conditions_yaml}')
 
     envelope = load_envelope(conditions_yaml, condition)
-    
-    # 获取 clamp 边界值
-    tempo_bounds = get_tempo_bounds(envelope)
-    gain_bounds = get_gain_bounds_db(envelope)
-    accent_bounds = get_accent_bounds(envelope)
-
-    df_summary = pd.read_csv(summary_csv)
-    base = df_summary[df_summary['condition'] == 'baseline']
-    con = df_summary[df_summary['condition'] == condition]
-    merged_l2 = base.merge(con, on=['trace_id', 'seed'], suffixes=('_baseline', '_constrained'))
-
-    if merged_l2.empty:
-        raise ValueError(f'No L2 data found for condition: {condition}')
-
-    df_paired = pd.read_csv(paired_csv)
-
-    if df_paired.empty:
-        raise ValueError(f'No L1 data found in {paired_csv}')
-
-    # 从 paired_csv 获取真实的 clamp 标记
-    clamp_flags = {'tempo': None, 'gain': None, 'accent': None}
-    if 'tempo_clamped' in df_paired.columns:
-        # 按 trace_id 和 seed 对齐
-        paired_merged = merged_l2.merge(
-            df_paired[['trace_id', 'seed', 'tempo_clamped', 'gain_clamped', 'accent_clamped']], 
-            on=['trace_id', 'seed'], how='left'
-        )
-        clamp_flags['tempo'] = paired_merged['tempo_clamped'].fillna(0).astype(bool).values
-        clamp_flags['gain'] = paired_merged['gain_clamped'].fillna(0).astype(bool).values
-        clamp_flags['accent'] = paired_merged['accent_clamped'].fillna(0).astype(bool).values
+    df_summary = read_table(summary_csv, columns=SUMMARY_COLUMNS, conditions=['baseline', condition])
+    df_paired = read_table(paired_csv, columns=PAIRED_COLUMNS)
+    merged_l2, df_paired = prepare_hexad_inputs(df_summary, df_paired, condition, selection)
+
+    # 统计量只依赖输入数据：改样式 / 配色时直接复用 sidecar
+    input_hash = hexad_key(merged_l2, df_paired, envelope, condition)
+    stats = resolve_hexad_stats(merged_l2, df_paired, condition, envelope, input_hash,
+                                [stats_sidecar_path(output_path)], cache)
+
+    cache_key = None
+    if cache is not None:
+        cache_key = figure_key(
+            input_hash, dpi=dpi, figsize=list(figsize), use_histogram=use_histogram, kde_bw=kde_bw,
+            show_clamp_bounds=show_clamp_bounds, style=style, l2_render=l2_render,
+            ext=os.path.splitext(output_path)[1].lower())
+        hit = cache.get(cache_key)
+        if hit is not MISSING:
+            os.makedirs(os.path.dirname(output_path) or 'results', exist_ok=True)
+            with open(output_path, 'wb') as f:
+                f.write(hit)
+            return stats
+
+    render_hexad(merged_l2, df_paired, condition, envelope, [output_path], dpi=dpi, figsize=figsize,
+                 use_histogram=use_histogram, show_clamp_bounds=show_clamp_bounds, style=style,
+                 kde_bw=kde_bw, l2_render=l2_render, stats=stats)
+    if cache_key is not None:
+        with open(output_path, 'rb') as f:
+            cache.put(cache_key, f.read())
+    return stats
+
+
+def render_hexad(merged_l2, df_paired, condition, envelope, output_paths, dpi=200, figsize=(15, 9),
+                 use_histogram=False, show_clamp_bounds=False, style='supplement', kde_bw='scott',
+                 l2_render='scatter', stats=None):
+    """绘制一张六联图并保存到 output_paths（同一图按扩展名保存为多种格式）
+
+    stats 为 compute_hexad_stats 的结果（来自统计 sidecar / 缓存）时不再重新计算统计量。
+
+    Returns:
+        各面板的统计量 dict
+    """
+    tempo_bounds, gain_bounds, accent_bounds = hexad_bounds(envelope)
+    clamp_flags = hexad_clamp_flags(merged_l2, df_paired)
+    panel_stats = stats or {}
 
     fig, axes = plt.subplots(2, 3, figsize=figsize)
     ax_tempo, ax_gain, ax_accent = axes[0]
@@ -374,7 +615,9 @@ def compose_hexad_kde(
         'L2 Tempo (BPM)', 'Baseline Tempo', 'Constrained Tempo',
         is_clamped=clamp_flags['tempo'],
         clamp_bounds=tempo_bounds,
-        style=style
+        style=style,
+        render=l2_render,
+        stats=panel_stats.get('tempo')
     )
 
     gain_stats = plot_l2_panel(
@@ -384,7 +627,9 @@ def compose_hexad_kde(
         'L2 Gain (dB)', 'Baseline Gain (dB)', 'Constrained Gain (dB)',
         is_clamped=clamp_flags['gain'],
         clamp_bounds=gain_bounds,
-        style=style
+        style=style,
+        render=l2_render,
+        stats=panel_stats.get('gain')
     )
 
     accent_stats = plot_l2_panel(
@@ -394,7 +639,9 @@ def compose_hexad_kde(
         'L2 Accent Ratio', 'Baseline Accent', 'Constrained Accent',
         is_clamped=clamp_flags['accent'],
         clamp_bounds=accent_bounds,
-        style=style
+        style=style,
+        render=l2_render,
+        stats=panel_stats.get('accent')
     )
 
     # === Row 2: L1 信号层 (直方图或 KDE) ===
@@ -418,7 +665,8 @@ def compose_hexad_kde(
             bin_width=BIN_WIDTH_ONSET,
             xlim=XLIM_ONSET,
             show_ylabel=True,
-            style=style
+            style=style,
+            stats=panel_stats.get('onset')
         )
 
         lufs_stats = plot_l1_histogram(
@@ -429,55 +677,55 @@ def compose_hexad_kde(
             bin_width=BIN_WIDTH_LUFS,
             xlim=XLIM_LUFS,
             show_ylabel=True,  # 三张都显示 Count
-            style=style
+            style=style,
+            stats=panel_stats.get('lufs')
         )
 
-        # 对于 relaxed 模式，LRA delta 需要取反（因为原始计算方向相反）
-        lra_data = df_paired['delta_lra_lu']
-        if 'relaxed' in condition:
-            lra_data = -lra_data
-        
         lra_stats = plot_l1_histogram(
-            data=lra_data,
+            data=lra_delta(df_paired, condition),
             ax=ax_lra,
             title='ΔLoudness Range',
             xlabel='ΔLRA (LU)',
             bin_width=BIN_WIDTH_LRA,
             xlim=XLIM_LRA,
             show_ylabel=True,  # 三张都显示 Count
-            style=style
+            style=style,
+            stats=panel_stats.get('lra')
         )
     else:
         onset_stats = plot_l1_kde(
             data=df_paired['delta_onset_density_eps'],
             ax=ax_onset,
             title='ΔOnset Density',
-            xlabel='Δ Onset Density (events/sec)'
+            xlabel='Δ Onset Density (events/sec)',
+            bw_method=kde_bw,
+            stats=panel_stats.get('onset')
         )
 
         lufs_stats = plot_l1_kde(
             data=df_paired['delta_integrated_lufs'],
             ax=ax_lufs,
             title='ΔIntegrated Loudness',
-            xlabel='ΔLUFS (LUFS)'
+            xlabel='ΔLUFS (LUFS)',
+            bw_method=kde_bw,
+            stats=panel_stats.get('lufs')
         )
 
-        lra_data = df_paired['delta_lra_lu']
-        if 'relaxed' in condition:
-            lra_data = -lra_data
-        
         lra_stats = plot_l1_kde(
-            data=lra_data,
+            data=lra_delta(df_paired, condition),
             ax=ax_lra,
             title='ΔLoudness Range',
-            xlabel='ΔLRA (LU)'
+            xlabel='ΔLRA (LU)',
+            bw_method=kde_bw,
+            stats=panel_stats.get('lra')
         )
 
     # 不显示图内总标题（应放到 figure caption）
     fig.tight_layout()
     
-    os.makedirs(os.path.dirname(output_path) or 'results', exist_ok=True)
-    fig.savefig(output_path, dpi=dpi, bbox_inches='tight')
+    for output_path in output_paths:
+        os.makedirs(os.path.dirname(output_path) or 'results', exist_ok=True)
+        fig.savefig(output_path, dpi=dpi, bbox_inches='tight')
     plt.close(fig)
 
     return {
@@ -490,20 +738,23 @@ def compose_hexad_kde(
     }
 
 
-def get_paired_csv_path(condition: str) -> str:
+def get_paired_csv_path(condition: str, fmt: str = 'csv') -> str:
     """根据 condition 自动选择对应的 paired_summary 文件"""
     suffix = condition.replace('constrained_', '')
     if suffix == 'default':
-        return 'summary/paired_summary.csv'
+        return f'summary/paired_summary.{fmt}'
     else:
-        return f'summary/paired_summary_{suffix}.csv'
+        return f'summary/paired_summary_{suffix}.{fmt}'
 
 
 def main():
     parser = argparse.ArgumentParser(
         description='Generate hexad plot with KDE density curves'
     )
-    parser.add_argument('--summary', default='summary/summary_runs.csv')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help='Format of the default summary/paired inputs')
+    parser.add_argument('--summary', default=None,
+                        help='Path to summary_runs.csv or .parquet (default: summary/summary_runs.<format>)')
     parser.add_argument('--paired', default=None,
                         help='Path to paired_summary.csv (auto-detected if not specified)')
     parser.add_argument('--condition', default='constrained_default')
@@ -516,22 +767,50 @@ def main():
                         help='Use histogram instead of KDE for L1 plots (default: True)')
     parser.add_argument('--kde', action='store_true',
                         help='Use KDE instead of histogram for L1 plots')
+    parser.add_argument('--kde-bw', default='scott',
+                        help="KDE bandwidth: 'scott', 'silverman', 'isj' or a scalar factor of the std")
     parser.add_argument('--show-clamp-bounds', action='store_true',
                         help='Show clamp boundary lines on L2 plots')
+    parser.add_argument('--l2-render', choices=L2_RENDERS + ('auto',), default='scatter',
+                        help='L2 points: vector scatter, rasterized scatter, or hexbin / hist2d density '
+                             f'(auto: hexbin above {DENSITY_AUTO_N} runs)')
     parser.add_argument('--style', choices=['main', 'supplement'], default='supplement',
                         help='Output style: main (精简) or supplement (完整)')
+    parser.add_argument('--index', default=None,
+                        help='SQLite run index (run_index.py) used to select a subset of runs')
+    parser.add_argument('--trace', nargs='*', default=None, help='With --index: only these trace ids')
+    parser.add_argument('--pattern', nargs='*', default=None, help='With --index: only these pattern labels')
+    parser.add_argument('--cache', default='.cache/memo',
+                        help='Memo cache keyed by input / option hashes (empty string disables it)')
+    parser.add_argument('--cache-max-mb', type=float, default=1024)
     args = parser.parse_args()
 
     # 自动选择 paired_summary 文件
-    paired_csv = args.paired if args.paired else get_paired_csv_path(args.condition)
+    summary_csv = args.summary if args.summary else f'summary/summary_runs.{args.format}'
+    paired_csv = args.paired if args.paired else get_paired_csv_path(args.condition, args.format)
     
     # 默认使用直方图，除非指定 --kde
     use_histogram = not args.kde
     show_clamp_bounds = args.show_clamp_bounds
 
+    kde_bw = args.kde_bw
+    if kde_bw not in ('scott', 'silverman', 'isj'):
+        try:
+            kde_bw = float(kde_bw)
+        except ValueError:
+            parser.error(f'--kde-bw: expected scott, silverman, isj or a number, got {kde_bw!r}')
+
+    selection = None
+    if args.index:
+        runs = query_runs(args.index, conditions=[args.condition], trace_ids=args.trace,
+                          pattern_labels=args.pattern)
+        selection = {(trace_id, int(seed)) for _, trace_id, seed, _ in runs}
+    elif args.trace or args.pattern:
+        parser.error('--trace / --pattern require --index')
+
     try:
         stats = compose_hexad_kde(
-            summary_csv=args.summary,
+            summary_csv=summary_csv,
             paired_csv=paired_csv,
             condition=args.condition,
             conditions_yaml=args.conditions_yaml,
@@ -540,7 +819,11 @@ def main():
             figsize=(args.width, args.height),
             use_histogram=use_histogram,
             show_clamp_bounds=show_clamp_bounds,
-            style=args.style
+            style=args.style,
+            selection=selection,
+            cache=MemoCache(args.cache, int(args.cache_max_mb * 1024 * 1024)) if args.cache else None,
+            kde_bw=kde_bw,
+            l2_render=args.l2_render
         )
         
         print(f'Saved: {args.out}')
@@ -0,0 +1,59 @@
+"""
+Canonical Content Hashing (规范化内容哈希)
+
+sha256 of a canonical JSON form, so logically identical configs hash the same
+regardless of key order, whitespace or 120 vs 120.0:
+- content_hash(obj): dicts with sorted keys, integral floats as ints
+- condition_config_hash(cfg, envelope): condition entry from conditions.yaml with
+  the envelope path replaced by the envelope content, so the same envelope under
+  different condition names / file names gets the same hash
+- frame_hash(df): row-order sensitive hash of a DataFrame's values and columns
+"""
+
+import hashlib
+import json
+import math
+
+import pandas as pd
+
+
+def canonicalize(obj):
+    """递归规范化：dict 按键排序，整数值浮点转 int，NaN / inf 转为字符串"""
+    if isinstance(obj, dict):
+        return {str(k): canonicalize(obj[k]) for k in sorted(obj, key=str)}
+    if isinstance(obj, (list, tuple)):
+        return [canonicalize(v) for v in obj]
+    if isinstance(obj, bool) or obj is None or isinstance(obj, str):
+        return obj
+    if isinstance(obj, int):
+        return obj
+    if isinstance(obj, float):
+        if not math.isfinite(obj):
+            return repr(obj)
+        return int(obj) if obj.is_integer() else obj
+    if hasattr(obj, 'item'):
+        # numpy 标量
+        return canonicalize(obj.item())
+    return str(obj)
+
+
+def canonical_json(obj):
+    return json.dumps(canonicalize(obj), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def content_hash(obj):
+    return hashlib.sha256(canonical_json(obj).encode('utf-8')).hexdigest()
+
+
+def condition_config_hash(cfg, envelope):
+    """condition 配置的内容哈希；envelope 路径替换为 envelope 内容，忽略文件名"""
+    resolved = dict(cfg or {})
+    resolved['envelope'] = envelope
+    return content_hash(resolved)
+
+
+def frame_hash(df):
+    """DataFrame 的内容哈希（列名、dtype 与按行顺序的值）"""
+    h = hashlib.sha256(canonical_json([[str(c), str(t)] for c, t in df.dtypes.items()]).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
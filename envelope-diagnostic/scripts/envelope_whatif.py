@@ -0,0 +1,200 @@
+"""
+Envelope What-If Simulator (Envelope 假设推演)
+
+Predicts the L2 enforcement statistics of candidate envelopes from the requested
+parameters already recorded in summary_runs, without generating new runs:
+- candidates come from envelope configs (configs/*.json) and/or a grid spec
+- the enforcer rule (clip to [min, max]) is evaluated for all candidates at once:
+  rates and mean shifts from searchsorted / prefix sums over the sorted requests,
+  p95 from a broadcast over the request tails only
+- output columns match reports/l2_enforcement_summary.csv (OOB / clamp rates,
+  shift mean / p95 / max per parameter)
+
+Gain bounds are linear (as in the configs) and are compared with the dB values in
+summary_runs after conversion (20 * log10).
+
+Grid spec (JSON): every bound is a fixed value, a list, or {"start", "stop", "num"};
+the grid is the Cartesian product of all bounds, unspecified bounds come from --base.
+
+    {"tempo_bpm": {"min": [115, 120], "max": {"start": 125, "stop": 140, "num": 16}},
+     "gain": {"max": {"start": 0.5, "stop": 1.0, "num": 11}}}
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from table_io import parquet_path, read_table, write_table
+
+# (envelope key, summary 列前缀)
+PARAMS = [('tempo_bpm', 'tempo'), ('gain', 'gain'), ('accent_ratio', 'accent')]
+BOUND_COLUMNS = [f'{prefix}_{side}' for _, prefix in PARAMS for side in ('min', 'max')]
+
+
+def read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def linear_to_db(values):
+    """线性增益转 dB；0 及以下对应 -inf（下界为 0 时不限制）"""
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide='ignore'):
+        return np.where(values > 0, 20 * np.log10(np.maximum(values, 1e-300)), -np.inf)
+
+
+def envelope_row(envelope, name):
+    row = {'candidate': name}
+    for key, prefix in PARAMS:
+        row[f'{prefix}_min'] = float(envelope[key]['min'])
+        row[f'{prefix}_max'] = float(envelope[key]['max'])
+    return row
+
+
+def _axis_values(spec):
+    if isinstance(spec, dict):
+        return np.linspace(spec['start'], spec['stop'], int(spec['num'])).tolist()
+    if isinstance(spec, list):
+        return [float(v) for v in spec]
+    return [float(spec)]
+
+
+def expand_grid(grid, base):
+    """按 grid spec 展开候选 envelope（笛卡尔积），返回 DataFrame"""
+    base_row = envelope_row(base, 'base')
+    axes = []
+    for key, prefix in PARAMS:
+        for side in ('min', 'max'):
+            spec = grid.get(key, {}).get(side, base_row[f'{prefix}_{side}'])
+            axes.append(_axis_values(spec))
+    mesh = np.meshgrid(*axes, indexing='ij')
+    table = pd.DataFrame({col: m.ravel() for col, m in zip(BOUND_COLUMNS, mesh)})
+    # 丢弃 min > max 的无效组合
+    valid = np.ones(len(table), dtype=bool)
+    for _, prefix in PARAMS:
+        valid &= table[f'{prefix}_min'].to_numpy() <= table[f'{prefix}_max'].to_numpy()
+    table = table[valid].reset_index(drop=True)
+    table.insert(0, 'candidate', [f'grid_{i:06d}' for i in range(len(table))])
+    return table
+
+
+def load_requested(summary_path):
+    """每个 (trace_id, seed) 的请求参数；各 condition 的请求值相同，取第一次出现"""
+    columns = ['trace_id', 'seed', 'condition', 'tempo_req', 'gain_req', 'accent_req']
+    df = read_table(summary_path, columns=columns)
+    df = df.sort_values('condition', key=lambda c: c != 'baseline', kind='stable')
+    return df.drop_duplicates(['trace_id', 'seed']).reset_index(drop=True)
+
+
+def simulate_param(req, lo, hi, quantile=0.95, chunk_size=4096):
+    """对一个参数计算所有候选的 clamp 统计
+
+    clamp 规则为 clip(req, lo, hi)，shift = max(lo - req, 0) + max(req - hi, 0)。
+    请求值排序一次后，OOB 比例和 shift 均值由 searchsorted + 前缀和得到；
+    p95 只依赖最大的 m 个 shift，而它们必然来自最小的 m 个和最大的 m 个请求值，
+    因此只需对 (K, 2m) 的尾部矩阵做广播。
+
+    Args:
+        req: (N,) 请求值
+        lo, hi: (K,) 候选边界，要求 lo <= hi
+    Returns:
+        dict of (K,) 数组：requested_oob_rate, clamp_rate, shift_mean/p95/max, effective_oob_rate
+    """
+    req = np.sort(req[~np.isnan(req)])
+    n, k = len(req), len(lo)
+    out = {name: np.zeros(k) for name in ('requested_oob_rate', 'clamp_rate', 'shift_mean',
+                                          'shift_p95', 'shift_max', 'effective_oob_rate')}
+    if n == 0:
+        return out
+
+    csum = np.concatenate([[0.0], np.cumsum(req)])
+    below = np.searchsorted(req, lo, side='left')
+    above = n - np.searchsorted(req, hi, side='right')
+    # below == 0 时 lo 可能为 -inf（gain 下界 0），-inf * 0 的结果由 where 丢弃
+    with np.errstate(invalid='ignore'):
+        low_shift = np.where(below > 0, lo * below - csum[below], 0.0)
+        high_shift = np.where(above > 0, (csum[n] - csum[n - above]) - hi * above, 0.0)
+
+    # min <= max 时 clip 后一定在界内，clamp 与请求越界等价，有效值不会越界
+    out['requested_oob_rate'] = (below + above) / n
+    out['clamp_rate'] = out['requested_oob_rate'].copy()
+    out['shift_mean'] = (low_shift + high_shift) / n
+    out['shift_max'] = np.maximum(np.maximum(lo - req[0], req[-1] - hi), 0.0)
+
+    # 与 np.quantile(linear) 相同的插值位置，只需第 f、f+1 个次序统计量
+    rank = quantile * (n - 1)
+    f = int(np.floor(rank))
+    frac = rank - f
+    m = n - f
+    tail = req if 2 * m >= n else np.concatenate([req[:m], req[-m:]])
+    for start in range(0, k, chunk_size):
+        sl = slice(start, start + chunk_size)
+        shift = np.abs(np.clip(tail[None, :], lo[sl, None], hi[sl, None]) - tail[None, :])
+        top = np.sort(shift, axis=1)[:, -m:]
+        upper = top[:, 1] if m > 1 else top[:, 0]
+        out['shift_p95'][sl] = top[:, 0] + (upper - top[:, 0]) * frac
+    return out
+
+
+def simulate(requested, candidates, chunk_size=4096):
+    """对所有候选 envelope 预测 L2 enforcement 统计，列顺序与 l2_enforcement_summary 一致"""
+    result = candidates.copy()
+    for _, prefix in PARAMS:
+        lo = candidates[f'{prefix}_min'].to_numpy(dtype=float)
+        hi = candidates[f'{prefix}_max'].to_numpy(dtype=float)
+        if (lo > hi).any():
+            bad = candidates.loc[lo > hi, 'candidate'].tolist()
+            raise ValueError(f'{prefix} min > max in candidates: {bad[:5]}')
+        if prefix == 'gain':
+            lo, hi = linear_to_db(lo), linear_to_db(hi)
+        req = requested[f'{prefix}_req'].to_numpy(dtype=float)
+        stats = simulate_param(req, lo, hi, chunk_size=chunk_size)
+        result[f'{prefix}_requested_oob_rate'] = stats['requested_oob_rate']
+        result[f'{prefix}_clamp_rate'] = stats['clamp_rate']
+        for stat in ('mean', 'p95', 'max'):
+            result[f'{prefix}_shift_{stat}'] = stats[f'shift_{stat}']
+        result[f'{prefix}_effective_oob_rate'] = stats['effective_oob_rate']
+    clamp_cols = [f'{prefix}_clamp_rate' for _, prefix in PARAMS]
+    result['max_clamp_rate'] = result[clamp_cols].max(axis=1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Predict L2 enforcement statistics for candidate envelopes')
+    parser.add_argument('--summary', default='summary/summary_runs.csv',
+                        help='summary_runs table with requested params (.csv or .parquet)')
+    parser.add_argument('--configs', nargs='*', default=[],
+                        help='Envelope configs to evaluate (e.g. configs/*.json)')
+    parser.add_argument('--grid', default=None, help='Grid spec JSON (see module docstring)')
+    parser.add_argument('--base', default='configs/default.json',
+                        help='Envelope supplying bounds not varied by --grid')
+    parser.add_argument('--chunk-size', type=int, default=4096, help='Candidates per broadcast block')
+    parser.add_argument('--out', default='reports/envelope_whatif.csv')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'both'], default='csv',
+                        help='Parquet is much faster to write for large grids (requires pyarrow)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.summary):
+        raise SystemExit(f'Error: Missing {args.summary}')
+    if not args.configs and not args.grid:
+        raise SystemExit('Error: Provide --configs and/or --grid')
+
+    parts = [pd.DataFrame([envelope_row(read_json(path), os.path.splitext(os.path.basename(path))[0])
+                           for path in args.configs])] if args.configs else []
+    if args.grid:
+        parts.append(expand_grid(read_json(args.grid), read_json(args.base)))
+    candidates = pd.concat(parts, ignore_index=True)
+
+    requested = load_requested(args.summary)
+    result = simulate(requested, candidates, args.chunk_size)
+    print(f'Simulated {len(candidates)} envelopes over {len(requested)} requested runs')
+
+    write_table(result, args.out, args.format)
+    print(f'Saved: {args.out}' if args.format == 'csv' else f'Saved: {parquet_path(args.out)}')
+
+
+if __name__ == '__main__':
+    main()
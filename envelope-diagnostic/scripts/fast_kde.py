@@ -0,0 +1,166 @@
+"""
+Binned FFT Kernel Density Estimate (分箱 FFT 核密度估计)
+
+Gaussian KDE in O(N + M log M) instead of gaussian_kde's O(N x grid):
+- linear_binning: spread each (weighted) sample over its two nearest grid nodes
+- fft_kde: convolve the binned counts with a sampled Gaussian kernel (FFT) and
+  interpolate onto the evaluation points
+- bandwidth: 'scott' / 'silverman' (same factors as scipy.stats.gaussian_kde),
+  'isj' (Botev et al. 2010 improved Sheather-Jones) or a scalar factor of the
+  sample std, as with gaussian_kde's bw_method
+
+With the default grid the curve matches gaussian_kde to well below line width.
+"""
+
+import warnings
+
+import numpy as np
+from scipy.fft import dct
+from scipy.optimize import brentq
+from scipy.signal import fftconvolve
+
+# 核截断半径（单位：带宽）与分箱网格上限
+KERNEL_CUTOFF = 6.0
+MIN_BINS = 1024
+MAX_BINS = 1 << 18
+# 每个带宽至少覆盖的网格点数，线性分箱误差为 O((δ/h)^2)
+BINS_PER_BW = 8
+ISJ_BINS = 1 << 14
+
+
+def _prepare(x, weights):
+    """去除 NaN，权重归一化到和为 1；返回 (x, w, n_eff)"""
+    x = np.asarray(x, dtype=float).ravel()
+    if weights is None:
+        w = np.ones_like(x)
+    else:
+        w = np.asarray(weights, dtype=float).ravel()
+        if w.shape != x.shape:
+            raise ValueError(f'weights shape {w.shape} does not match data shape {x.shape}')
+        if np.any(w < 0):
+            raise ValueError('weights must be non-negative')
+    keep = ~(np.isnan(x) | np.isnan(w))
+    x, w = x[keep], w[keep]
+    total = w.sum()
+    if x.size < 2 or total <= 0:
+        raise ValueError('KDE needs at least two samples with positive weight')
+    w = w / total
+    return x, w, 1.0 / np.sum(w ** 2)
+
+
+def weighted_std(x, w):
+    """与 np.cov(aweights=w) 相同的无偏加权标准差（w 已归一化）"""
+    mean = np.dot(w, x)
+    var = np.dot(w, (x - mean) ** 2) / (1.0 - np.sum(w ** 2))
+    return float(np.sqrt(var))
+
+
+def linear_binning(x, w, lo, hi, n_bins):
+    """线性分箱：样本权重按距离分给左右两个网格点
+
+    Returns:
+        (grid, counts)，counts 之和等于 w 之和
+    """
+    grid = np.linspace(lo, hi, n_bins)
+    delta = (hi - lo) / (n_bins - 1)
+    pos = (x - lo) / delta
+    left = np.clip(np.floor(pos).astype(np.int64), 0, n_bins - 2)
+    frac = np.clip(pos - left, 0.0, 1.0)
+    counts = np.bincount(left, weights=w * (1.0 - frac), minlength=n_bins)
+    counts += np.bincount(left + 1, weights=w * frac, minlength=n_bins)
+    return grid, counts
+
+
+def _isj_fixed_point(t, n, i_sq, a2):
+    """Botev 不动点方程 t - ξγ^[l](t)，根即为 t*"""
+    ell = 7
+    f = 0.5 * np.pi ** (2 * ell) * np.sum(i_sq ** ell * a2 * np.exp(-i_sq * np.pi ** 2 * t))
+    if f <= 0:
+        return -1.0
+    for s in range(ell - 1, 1, -1):
+        k0 = np.prod(np.arange(1, 2 * s, 2, dtype=float)) / np.sqrt(2 * np.pi)
+        const = (1 + 0.5 ** (s + 0.5)) / 3
+        time = (2 * const * k0 / (n * f)) ** (2 / (3 + 2 * s))
+        f = 0.5 * np.pi ** (2 * s) * np.sum(i_sq ** s * a2 * np.exp(-i_sq * np.pi ** 2 * time))
+    return t - (2 * n * np.sqrt(np.pi) * f) ** (-0.4)
+
+
+def isj_bandwidth(x, w, n_eff):
+    """Improved Sheather-Jones 带宽（DCT 实现）；无解时退回 Silverman"""
+    lo, hi = x.min(), x.max()
+    span = hi - lo
+    lo, hi = lo - span / 2, hi + span / 2
+    _, counts = linear_binning(x, w, lo, hi, ISJ_BINS)
+    a = dct(counts, type=2)
+    i_sq = np.arange(1, ISJ_BINS, dtype=float) ** 2
+    # scipy 的 DCT-II 系数是 Botev dct1d 的 2 倍，0.5 * a^2 即原文的 2 * (a/2)^2
+    a2 = a[1:] ** 2
+    upper = 0.1
+    for _ in range(8):
+        try:
+            # 样本集中在少数几个值上时 f 可能下溢为 0
+            with np.errstate(divide='ignore', over='ignore'):
+                t_star = brentq(_isj_fixed_point, 0.0, upper, args=(n_eff, i_sq, a2))
+            return float(np.sqrt(t_star) * (hi - lo))
+        except ValueError:
+            upper *= 2
+    warnings.warn('ISJ bandwidth did not converge, falling back to silverman', RuntimeWarning)
+    return weighted_std(x, w) * (n_eff * 0.75) ** (-0.2)
+
+
+def bandwidth(x, bw_method='scott', weights=None):
+    """核带宽（x 的单位）
+
+    Args:
+        bw_method: 'scott' / 'silverman' / 'isj'，或标量因子（带宽 = 因子 x 加权标准差）
+    """
+    x, w, n_eff = _prepare(x, weights)
+    return _bandwidth(x, w, n_eff, bw_method)
+
+
+def _bandwidth(x, w, n_eff, bw_method):
+    if bw_method == 'isj':
+        return isj_bandwidth(x, w, n_eff)
+    if bw_method == 'scott':
+        factor = n_eff ** (-0.2)
+    elif bw_method == 'silverman':
+        factor = (n_eff * 0.75) ** (-0.2)
+    elif np.isscalar(bw_method) and not isinstance(bw_method, str):
+        factor = float(bw_method)
+    else:
+        raise ValueError(f"bw_method must be 'scott', 'silverman', 'isj' or a scalar, got {bw_method!r}")
+    return weighted_std(x, w) * factor
+
+
+def fft_kde(x, points, bw_method='scott', weights=None):
+    """在 points 上求高斯 KDE 密度（积分为 1）
+
+    Args:
+        x: 样本
+        points: 求值点（任意顺序）
+        bw_method: 见 bandwidth()
+        weights: 样本权重（非负），None 表示等权
+
+    Returns:
+        (density, bw)
+    """
+    x, w, n_eff = _prepare(x, weights)
+    points = np.asarray(points, dtype=float)
+    bw = _bandwidth(x, w, n_eff, bw_method)
+    if not bw > 0:
+        raise ValueError('KDE bandwidth is zero (data has no spread)')
+
+    # 分箱范围覆盖样本和求值点；网格足够细使每个带宽内有 BINS_PER_BW 个点
+    lo = min(x.min(), points.min()) - KERNEL_CUTOFF * bw
+    hi = max(x.max(), points.max()) + KERNEL_CUTOFF * bw
+    n_bins = int(np.clip((hi - lo) / bw * BINS_PER_BW, MIN_BINS, MAX_BINS))
+    grid, counts = linear_binning(x, w, lo, hi, n_bins)
+    delta = grid[1] - grid[0]
+
+    half = min(n_bins - 1, int(np.ceil(KERNEL_CUTOFF * bw / delta)))
+    offsets = np.arange(-half, half + 1) * delta
+    kernel = np.exp(-0.5 * (offsets / bw) ** 2) / (bw * np.sqrt(2 * np.pi))
+    density = fftconvolve(counts, kernel, mode='same')
+    # FFT 舍入误差可能产生极小的负值
+    density = np.maximum(density, 0.0)
+    return np.interp(points, grid, density), bw
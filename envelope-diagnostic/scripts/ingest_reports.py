@@ -0,0 +1,301 @@
+"""
+Session Report Ingestion Service (会话报告接收服务)
+
+Local HTTP endpoint for batched session reports from game stations:
+- POST /reports  body: JSON array, single object or NDJSON (gzip/deflate allowed)
+- Reports are validated, normalized and queued in a bounded write buffer
+- A writer thread appends them to ingest/date=YYYY-MM-DD/station=<id>/reports.jsonl
+
+When the buffer is full the request waits briefly and then answers 503 with
+Retry-After, so stations back off and resend instead of reports being dropped.
+"""
+
+import argparse
+import json
+import os
+import re
+import signal
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+METRIC_KEYS = {
+    'integratedLufs': 'integrated_lufs',
+    'lraEffective': 'lra_lu',
+    'onsetDensity': 'onset_density_eps',
+    'peakLufs': 'peak_lufs',
+}
+
+STATION_RE = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+
+class ReportRejected(ValueError):
+    pass
+
+
+class BodyTooLarge(ReportRejected):
+    pass
+
+
+# Content-Encoding -> zlib wbits（gzip 头 / zlib 头）
+WBITS = {'gzip': 31, 'deflate': 15}
+
+
+def decode_body(raw, encoding, max_bytes=None):
+    """按 Content-Encoding 解压请求体；解压后超过 max_bytes 时抛出 BodyTooLarge"""
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding in WBITS:
+        decompressor = zlib.decompressobj(wbits=WBITS[encoding])
+        data = decompressor.decompress(raw, max_bytes or 0)
+        if decompressor.unconsumed_tail or (max_bytes and not decompressor.eof and len(data) >= max_bytes):
+            raise BodyTooLarge('decompressed body too large')
+        if not decompressor.eof:
+            raise ReportRejected('truncated compressed body')
+        return data
+    if encoding == 'identity':
+        return raw
+    raise ReportRejected(f'unsupported Content-Encoding: {encoding}')
+
+
+def parse_reports(text):
+    """解析 JSON 数组、单个对象或 NDJSON"""
+    text = text.strip()
+    if not text:
+        return []
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(payload, dict) and isinstance(payload.get('reports'), list):
+        return payload['reports']
+    return payload if isinstance(payload, list) else [payload]
+
+
+def normalize_report(report, station_id, received_at):
+    """校验单条报告并转换为存储格式（snake_case 字段）"""
+    if not isinstance(report, dict):
+        raise ReportRejected('report is not an object')
+    trace_id = report.get('traceId') or report.get('trace_id')
+    if not isinstance(trace_id, str) or not trace_id:
+        raise ReportRejected('missing traceId')
+    params = report.get('params')
+    if not isinstance(params, dict):
+        raise ReportRejected('missing params')
+    requested = params.get('requested')
+    effective = params.get('effective')
+    if not isinstance(requested, dict) or not isinstance(effective, dict):
+        raise ReportRejected('params.requested/effective must be objects')
+
+    metrics = report.get('metrics') or {}
+    if not isinstance(metrics, dict):
+        raise ReportRejected('metrics must be an object')
+    pattern_label = report.get('patternLabel') or report.get('pattern_label')
+
+    return {
+        'trace_id': trace_id,
+        'station_id': station_id,
+        'received_at': received_at,
+        'condition': report.get('condition'),
+        'pattern_label': pattern_label.lower() if isinstance(pattern_label, str) else None,
+        'config_hash': report.get('configHash') or report.get('config_hash'),
+        'enforcement_status': report.get('enforcementStatus'),
+        'params_requested': requested,
+        'params_effective': effective,
+        'raw_effective': params.get('raw_effective'),
+        'metrics': {METRIC_KEYS.get(k, k): v for k, v in metrics.items()},
+        'interventions': report.get('interventions') or [],
+    }
+
+
+def partition_dir(store_dir, record):
+    day = record['received_at'][:10]
+    return os.path.join(store_dir, f'date={day}', f'station={record["station_id"]}')
+
+
+class ReportBuffer:
+    """有界写缓冲：按字节数限制内存，后台线程按分区追加写入磁盘"""
+
+    def __init__(self, store_dir, max_bytes=64 * 1024 * 1024, flush_bytes=4 * 1024 * 1024,
+                 flush_interval=2.0):
+        self.store_dir = store_dir
+        self.max_bytes = max_bytes
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._pending_bytes = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name='report-writer', daemon=True)
+        self.written = 0
+
+    def start(self):
+        self._writer.start()
+        return self
+
+    def put(self, records, timeout=5.0):
+        """加入缓冲；缓冲已满且等待超时则返回 False（调用方应让客户端重试）"""
+        lines = [(partition_dir(self.store_dir, r), json.dumps(r, ensure_ascii=False) + '\n')
+                 for r in records]
+        size = sum(len(line) for _, line in lines)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending and self._pending_bytes + size > self.max_bytes:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed:
+                    return False
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+            self._pending.extend(lines)
+            self._pending_bytes += size
+            if self._pending_bytes >= self.flush_bytes:
+                self._cond.notify_all()
+        return True
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and self._pending_bytes < self.flush_bytes:
+                    self._cond.wait(self.flush_interval)
+                batch, self._pending, self._pending_bytes = self._pending, [], 0
+                closed = self._closed
+                self._cond.notify_all()
+            if batch:
+                self._write(batch)
+            if closed:
+                return
+
+    def _write(self, batch):
+        by_partition = {}
+        for part, line in batch:
+            by_partition.setdefault(part, []).append(line)
+        for part, lines in by_partition.items():
+            os.makedirs(part, exist_ok=True)
+            with open(os.path.join(part, 'reports.jsonl'), 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self.written += len(lines)
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    server_version = 'ReportIngest/1.0'
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/reports':
+            self._reply(404, {'error': 'not found'})
+            return
+        station_id = self.headers.get('X-Station-Id') or parse_qs(url.query).get('station', [''])[0]
+        if not STATION_RE.match(station_id or ''):
+            self._reply(400, {'error': 'missing or invalid station id'})
+            return
+
+        header = self.headers.get('Content-Length')
+        if header is None:
+            self._reply(411, {'error': 'Content-Length required'})
+            return
+        try:
+            length = int(header)
+        except ValueError:
+            self._reply(400, {'error': 'invalid Content-Length'})
+            return
+        if length < 0:
+            self._reply(411, {'error': 'Content-Length must not be negative'})
+            return
+        if length > self.server.max_body_bytes:
+            self._reply(413, {'error': 'request body too large'})
+            return
+        try:
+            raw = decode_body(self.rfile.read(length), self.headers.get('Content-Encoding'),
+                              self.server.max_body_bytes)
+            reports = parse_reports(raw.decode('utf-8'))
+        except BodyTooLarge as e:
+            self._reply(413, {'error': str(e)})
+            return
+        except (ReportRejected, OSError, zlib.error, UnicodeDecodeError, json.JSONDecodeError) as e:
+            self._reply(400, {'error': f'unreadable body: {e}'})
+            return
+
+        received_at = datetime.now(timezone.utc).isoformat()
+        accepted, rejected = [], []
+        for i, report in enumerate(reports):
+            try:
+                accepted.append(normalize_report(report, station_id, received_at))
+            except ReportRejected as e:
+                rejected.append({'index': i, 'reason': str(e)})
+
+        if accepted and not self.server.buffer.put(accepted, timeout=self.server.put_timeout):
+            self._reply(503, {'error': 'write buffer full, retry later'}, {'Retry-After': '2'})
+            return
+        self._reply(202, {'accepted': len(accepted), 'rejected': rejected})
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self._reply(200, {'status': 'ok', 'written': self.server.buffer.written})
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+
+def serve(store_dir, host='127.0.0.1', port=8765, max_buffer_mb=64, max_body_mb=32,
+          put_timeout=5.0, verbose=False):
+    buffer = ReportBuffer(store_dir, max_bytes=max_buffer_mb * 1024 * 1024).start()
+    httpd = ThreadingHTTPServer((host, port), IngestHandler)
+    httpd.daemon_threads = True
+    httpd.buffer = buffer
+    httpd.max_body_bytes = max_body_mb * 1024 * 1024
+    httpd.put_timeout = put_timeout
+    httpd.verbose = verbose
+    # SIGTERM 时先停止接收，再把缓冲区写完
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=httpd.shutdown).start())
+    print(f'Ingesting session reports on http://{host}:{port}/reports -> {store_dir}')
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        buffer.close()
+        print(f'Stopped; {buffer.written} reports written')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batched session-report ingestion endpoint')
+    parser.add_argument('--store', default='ingest')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-buffer-mb', type=int, default=64,
+                        help='Upper bound on reports held in memory before backpressure')
+    parser.add_argument('--max-body-mb', type=int, default=32)
+    parser.add_argument('--put-timeout', type=float, default=5.0,
+                        help='Seconds a request waits for buffer space before 503')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    serve(args.store, args.host, args.port, args.max_buffer_mb, args.max_body_mb,
+          args.put_timeout, args.verbose)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""
+L1 Audio Metrics Engine (L1 信号层指标)
+
+Headless re-derivation of the l1metrics.json fields from a run's WAV file:
+- integrated_lufs: ITU-R BS.1770-4 K-weighting, 400 ms blocks (75% overlap),
+  absolute (-70 LUFS) and relative (-10 LU) gating
+- lra_lu: EBU Tech 3342 loudness range over 3 s short-term windows (10 Hz),
+  -70 LUFS / -20 LU gating, 10th-95th percentile spread
+- onset_density_eps: spectral-flux onsets per second
+- peak_lufs: maximum momentary (400 ms) loudness
+- true_peak_dbtp: 4x oversampled true peak (extra field)
+
+WAVs are memory-mapped and processed in chunks; K-weighted energy is accumulated
+in 100 ms segments so block / window loudness is a vectorized sum over segments.
+Many runs are processed in a process pool.
+"""
+
+import argparse
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+from scipy.io import wavfile
+
+ABS_GATE_LUFS = -70.0
+SEGMENT_SEC = 0.1
+CHUNK_SEC = 30.0
+ONSET_N_FFT = 2048
+ONSET_HOP = 512
+TRUE_PEAK_UP = 4
+# resample_poly(x, 4, 1) 的 FIR 半长为 40 个输出样本（10 个输入样本），块两侧各多取这些输入
+TRUE_PEAK_MARGIN = 16
+
+
+def k_weighting_coeffs(sr):
+    """BS.1770 K 加权两级 biquad 系数（按采样率由模拟原型推导，48 kHz 时与标准表一致）"""
+    # Stage 1: high shelf
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = math.tan(math.pi * f0 / sr)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    b1 = np.array([(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0])
+    a1 = np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+    # Stage 2: RLB high pass
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * f0 / sr)
+    a0 = 1 + k / q + k * k
+    b2 = np.array([1.0, -2.0, 1.0])
+    a2 = np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+    return np.vstack([np.concatenate([b1, a1]), np.concatenate([b2, a2])])
+
+
+def read_wav(path):
+    """内存映射读取 WAV，返回 (sr, samples[n, ch])；整数 PCM 不在此处转换"""
+    sr, data = wavfile.read(path, mmap=True)
+    if data.ndim == 1:
+        data = data[:, None]
+    return sr, data
+
+
+def to_float(block):
+    if block.dtype.kind == 'f':
+        return block.astype(np.float64)
+    if block.dtype == np.uint8:
+        return (block.astype(np.float64) - 128) / 128
+    return block.astype(np.float64) / float(np.iinfo(block.dtype).max + 1)
+
+
+def energy_to_lufs(mean_square):
+    with np.errstate(divide='ignore'):
+        return -0.691 + 10 * np.log10(mean_square)
+
+
+def gated_loudness(block_ms, rel_gate):
+    """绝对门限 + 相对门限后的功率平均响度"""
+    lufs = energy_to_lufs(block_ms)
+    above_abs = block_ms[lufs > ABS_GATE_LUFS]
+    if above_abs.size == 0:
+        return -math.inf, lufs, np.zeros_like(block_ms, dtype=bool)
+    rel_threshold = energy_to_lufs(above_abs.mean()) + rel_gate
+    keep = (lufs > ABS_GATE_LUFS) & (lufs > rel_threshold)
+    return float(energy_to_lufs(block_ms[keep].mean())) if keep.any() else -math.inf, lufs, keep
+
+
+def window_sums(segments, n):
+    """n 个连续 100 ms 段的能量和（滑动窗口，步长一个段）"""
+    if len(segments) < n:
+        return np.empty(0)
+    csum = np.concatenate([[0.0], np.cumsum(segments)])
+    return csum[n:] - csum[:-n]
+
+
+def onset_times(flux, frame_rate, delta=0.1, wait_sec=0.1):
+    """谱通量峰值检测：自适应阈值（滑动中值 + delta）上的局部极大值"""
+    if flux.size < 3 or flux.max() <= 0:
+        return np.empty(0)
+    flux = flux / flux.max()
+    width = max(3, int(round(0.1 * frame_rate)) | 1)
+    padded = np.pad(flux, width // 2, mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, width)
+    threshold = np.median(windows, axis=1) + delta
+    local_max = (flux[1:-1] >= flux[:-2]) & (flux[1:-1] > flux[2:])
+    peaks = np.flatnonzero(local_max & (flux[1:-1] > threshold[1:-1])) + 1
+    wait = max(1, int(round(wait_sec * frame_rate)))
+    kept = []
+    for p in peaks:
+        if not kept or p - kept[-1] >= wait:
+            kept.append(p)
+    return np.asarray(kept) / frame_rate
+
+
+def compute_l1_metrics(path, chunk_sec=CHUNK_SEC):
+    sr, data = read_wav(path)
+    n_samples, n_channels = data.shape
+    seg_len = int(round(SEGMENT_SEC * sr))
+    sos = k_weighting_coeffs(sr)
+    zi = np.zeros((n_channels, sos.shape[0], 2))
+
+    chunk = max(seg_len, int(chunk_sec * sr) // seg_len * seg_len)
+    window = np.hanning(ONSET_N_FFT)
+    segment_energy, flux_parts = [], []
+    true_peak = 0.0
+    tail = np.zeros(0)
+    prev_mag = None
+    for start in range(0, n_samples, chunk):
+        block = to_float(data[start:start + chunk])
+        filtered = np.empty_like(block)
+        for ch in range(n_channels):
+            filtered[:, ch], zi[ch] = signal.sosfilt(sos, block[:, ch], zi=zi[ch])
+        n_seg = len(block) // seg_len
+        if n_seg:
+            sq = (filtered[:n_seg * seg_len] ** 2).reshape(n_seg, seg_len, n_channels)
+            # 通道权重 G=1（单声道 / 立体声），各通道均方相加
+            segment_energy.append(sq.sum(axis=1).sum(axis=1))
+
+        # 过采样时带上相邻块的样本，只保留本块对应的输出，结果与整段过采样一致、与分块无关
+        lo = max(0, start - TRUE_PEAK_MARGIN)
+        context = to_float(data[lo:start + chunk + TRUE_PEAK_MARGIN])
+        offset = (start - lo) * TRUE_PEAK_UP
+        oversampled = signal.resample_poly(context, TRUE_PEAK_UP, 1, axis=0)
+        true_peak = max(true_peak, float(np.abs(oversampled[offset:offset + len(block) * TRUE_PEAK_UP]).max()))
+
+        # 谱通量：单声道混合，块间保留 n_fft - hop 个样本的重叠
+        mono = np.concatenate([tail, block.mean(axis=1)])
+        n_frames = 1 + (len(mono) - ONSET_N_FFT) // ONSET_HOP if len(mono) >= ONSET_N_FFT else 0
+        if n_frames:
+            frames = np.lib.stride_tricks.sliding_window_view(mono, ONSET_N_FFT)[::ONSET_HOP][:n_frames]
+            mag = np.log1p(100 * np.abs(np.fft.rfft(frames * window, axis=1)))
+            # 第一帧与静音比较，音频开头的起音也计为 onset
+            if prev_mag is None:
+                prev_mag = np.zeros_like(mag[:1])
+            mag_prev = np.vstack([prev_mag, mag[:-1]])
+            flux_parts.append(np.maximum(mag - mag_prev, 0).sum(axis=1))
+            prev_mag = mag[-1:]
+            tail = mono[n_frames * ONSET_HOP:]
+        else:
+            tail = mono
+
+    segments = np.concatenate(segment_energy) if segment_energy else np.empty(0)
+    momentary_ms = window_sums(segments, 4) / (4 * seg_len)
+    short_term_ms = window_sums(segments, 30) / (30 * seg_len)
+
+    integrated, momentary_lufs, _ = gated_loudness(momentary_ms, -10.0)
+    if short_term_ms.size:
+        _, st_lufs, st_keep = gated_loudness(short_term_ms, -20.0)
+        kept = st_lufs[st_keep]
+        lra = float(np.percentile(kept, 95) - np.percentile(kept, 10)) if kept.size else 0.0
+    else:
+        lra = 0.0
+
+    duration = n_samples / sr
+    flux = np.concatenate(flux_parts) if flux_parts else np.empty(0)
+    onsets = onset_times(flux, sr / ONSET_HOP)
+
+    def finite(v):
+        return round(float(v), 6) if np.isfinite(v) else None
+
+    return {
+        'integrated_lufs': finite(integrated),
+        'lra_lu': finite(lra),
+        'onset_density_eps': finite(len(onsets) / duration) if duration > 0 else None,
+        'peak_lufs': finite(momentary_lufs.max()) if momentary_lufs.size else None,
+        'true_peak_dbtp': finite(20 * math.log10(true_peak)) if true_peak > 0 else None,
+        'duration_sec': round(duration, 6),
+        'sample_rate': int(sr),
+    }
+
+
+def find_audio_runs(runs_dir, audio_name='audio.wav'):
+    """扫描 runs/condition/trace/seed 下的音频文件"""
+    from summarize_runs import list_runs
+    return [(run_path, os.path.join(run_path, audio_name))
+            for *_, run_path in list_runs(runs_dir)
+            if os.path.exists(os.path.join(run_path, audio_name))]
+
+
+def _process_run(args):
+    run_path, audio_path, out_name, overwrite = args
+    out_path = os.path.join(run_path, out_name)
+    existing_path = os.path.join(run_path, 'l1metrics.json')
+    existing = None
+    if os.path.exists(existing_path):
+        with open(existing_path, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+    if os.path.exists(out_path) and not overwrite:
+        return run_path, existing, None
+    try:
+        metrics = compute_l1_metrics(audio_path)
+    except (ValueError, OSError) as e:
+        return run_path, existing, {'error': str(e)}
+    metrics['audio_path'] = audio_path
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, indent=2)
+    return run_path, existing, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute l1metrics.json from run audio')
+    parser.add_argument('--runs', default='runs')
+    parser.add_argument('--audio-name', default='audio.wav')
+    parser.add_argument('--out-name', default='l1metrics_py.json',
+                        help='Output file name in each run dir (use l1metrics.json to replace browser metrics)')
+    parser.add_argument('--overwrite', action='store_true', help='Recompute even if the output exists')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--report', default='reports/l1_metrics_validation.csv',
+                        help='CSV comparing recomputed metrics with existing l1metrics.json')
+    args = parser.parse_args()
+
+    runs = find_audio_runs(args.runs, args.audio_name)
+    tasks = [(run_path, audio_path, args.out_name, args.overwrite) for run_path, audio_path in runs]
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for run_path, existing, metrics in pool.map(_process_run, tasks, chunksize=8):
+            if metrics is None:
+                continue
+            if 'error' in metrics:
+                print(f'WARNING: {run_path}: {metrics["error"]}')
+                continue
+            row = {'run_path': run_path}
+            for key in ('integrated_lufs', 'lra_lu', 'onset_density_eps', 'peak_lufs'):
+                row[f'{key}_py'] = metrics.get(key)
+                if existing is not None:
+                    row[f'{key}_browser'] = existing.get(key)
+            rows.append(row)
+
+    print(f'Computed L1 metrics for {len(rows)} of {len(runs)} runs')
+    if rows and args.report:
+        os.makedirs(os.path.dirname(args.report) or '.', exist_ok=True)
+        pd.DataFrame(rows).to_csv(args.report, index=False)
+        print(f'Saved: {args.report}')
+
+
+if __name__ == '__main__':
+    main()
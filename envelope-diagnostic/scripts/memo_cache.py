@@ -0,0 +1,99 @@
+"""
+Memoization Cache (结果缓存)
+
+Local content-addressed cache for derived outputs (paired tables, L2 statistics,
+figures). Keys are hashes of the inputs (see content_hash.py); values are pickled
+to <cache_dir>/<key[:2]>/<key>.pkl. A small SQLite table tracks size and last
+access, and the least recently used entries are evicted once the total size
+exceeds max_bytes.
+"""
+
+import os
+import pickle
+import sqlite3
+import time
+
+MISSING = object()
+
+
+class MemoCache:
+    """带容量上限和 LRU 淘汰的磁盘缓存"""
+
+    def __init__(self, cache_dir='.cache/memo', max_bytes=1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), timeout=30)
+        self._db.execute('CREATE TABLE IF NOT EXISTS entries '
+                         '(key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)')
+        self._db.commit()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.pkl')
+
+    def get(self, key):
+        """返回缓存值；不存在（或文件已丢失）时返回 MISSING"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._db.commit()
+            self.misses += 1
+            return MISSING
+        self._db.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+        self._db.commit()
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                         (key, os.path.getsize(path), time.time()))
+        self._db.commit()
+        self.evict()
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def total_bytes(self):
+        return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def evict(self):
+        """按最近访问时间从旧到新删除，直到总大小不超过 max_bytes"""
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for key, size in self._db.execute('SELECT key, size FROM entries ORDER BY last_access').fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+            removed += 1
+        self._db.commit()
+        return removed
+
+    def close(self):
+        self._db.close()
+
+
+def memoize(cache, key, compute):
+    """cache 为 None 时直接计算"""
+    return compute() if cache is None else cache.get_or_compute(key, compute)
@@ -0,0 +1,137 @@
+"""
+Paired Delta Inference (配对 Δ 统计推断)
+
+Bootstrap confidence intervals and paired tests for the L1 deltas in the
+long-form paired summary, per condition and pattern label (plus pooled 'all'):
+- percentile bootstrap CIs for the mean and median delta
+- exact sign test on non-zero deltas
+- sign-flip permutation test for the mean delta
+
+Resampling is done in batches of NumPy index / sign matrices and the batches are
+spread over a process pool. Every batch gets its own child seed from one
+SeedSequence, so results do not depend on the worker count.
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from table_io import read_table
+
+DELTA_METRICS = ['delta_integrated_lufs', 'delta_lra_lu', 'delta_onset_density_eps']
+
+
+def resample_batch(x, n_resamples, seed, max_elements=20_000_000):
+    """一个批次的 bootstrap 与 sign-flip 重采样
+
+    Returns:
+        (boot_means, boot_medians, perm_means) 三个长度为 n_resamples 的数组
+    """
+    rng = np.random.default_rng(seed)
+    n = len(x)
+    rows = max(1, max_elements // max(n, 1))
+    boot_means, boot_medians, perm_means = [], [], []
+    for start in range(0, n_resamples, rows):
+        b = min(rows, n_resamples - start)
+        samples = x[rng.integers(0, n, size=(b, n))]
+        boot_means.append(samples.mean(axis=1))
+        boot_medians.append(np.median(samples, axis=1))
+        signs = rng.integers(0, 2, size=(b, n), dtype=np.int8) * 2 - 1
+        perm_means.append((signs * x).mean(axis=1))
+    return np.concatenate(boot_means), np.concatenate(boot_medians), np.concatenate(perm_means)
+
+
+def _batch_task(args):
+    key, x, n_resamples, seed = args
+    return key, resample_batch(x, n_resamples, seed)
+
+
+def summarize_group(x, boot_means, boot_medians, perm_means, confidence):
+    alpha = (1 - confidence) / 2
+    n_pos = int((x > 0).sum())
+    n_neg = int((x < 0).sum())
+    obs_mean = x.mean()
+    sign_p = stats.binomtest(n_pos, n_pos + n_neg, 0.5).pvalue if n_pos + n_neg else 1.0
+    # 加 1 校正，避免 p = 0
+    perm_p = (np.sum(np.abs(perm_means) >= abs(obs_mean) - 1e-12) + 1) / (len(perm_means) + 1)
+    return {
+        'n': len(x),
+        'mean': obs_mean,
+        'median': float(np.median(x)),
+        'mean_ci_low': np.quantile(boot_means, alpha),
+        'mean_ci_high': np.quantile(boot_means, 1 - alpha),
+        'median_ci_low': np.quantile(boot_medians, alpha),
+        'median_ci_high': np.quantile(boot_medians, 1 - alpha),
+        'n_pos': n_pos,
+        'n_neg': n_neg,
+        'sign_test_p': sign_p,
+        'permutation_p': min(perm_p, 1.0),
+    }
+
+
+def paired_inference(paired, n_resamples=10000, confidence=0.95, seed=0, workers=None,
+                     batch_size=1000):
+    """对每个 (condition, pattern_label, metric) 计算 bootstrap CI 与配对检验"""
+    groups = []
+    for condition, cond_df in paired.groupby('condition', sort=False, observed=True):
+        groups.append((condition, 'all', cond_df))
+        for label, label_df in cond_df.groupby('pattern_label', sort=True, observed=True):
+            groups.append((condition, label, label_df))
+
+    tasks, data = [], {}
+    for condition, label, group in groups:
+        for metric in DELTA_METRICS:
+            x = group[metric].dropna().to_numpy(dtype=float)
+            if len(x) < 2:
+                continue
+            key = (condition, label, metric)
+            data[key] = x
+            for start in range(0, n_resamples, batch_size):
+                tasks.append((key, x, min(batch_size, n_resamples - start)))
+
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    results = {key: ([], [], []) for key in data}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = ((key, x, b, s) for (key, x, b), s in zip(tasks, seeds))
+        for key, batch in pool.map(_batch_task, jobs, chunksize=4):
+            for acc, values in zip(results[key], batch):
+                acc.append(values)
+
+    rows = []
+    for key, x in data.items():
+        boot_means, boot_medians, perm_means = (np.concatenate(v) for v in results[key])
+        condition, label, metric = key
+        rows.append({'condition': condition, 'pattern_label': label, 'metric': metric,
+                     **summarize_group(x, boot_means, boot_medians, perm_means, confidence)})
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bootstrap CIs and paired tests for L1 deltas')
+    parser.add_argument('--paired', default='summary/paired_summary_all.csv',
+                        help='Long-form paired summary (.csv or .parquet)')
+    parser.add_argument('--conditions', nargs='*', default=None,
+                        help='Only analyse these conditions')
+    parser.add_argument('--resamples', type=int, default=10000)
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default='reports/paired_inference.csv')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.paired):
+        raise SystemExit(f'Error: Missing {args.paired}')
+    columns = ['condition', 'trace_id', 'seed', 'pattern_label'] + DELTA_METRICS
+    paired = read_table(args.paired, columns=columns, conditions=args.conditions)
+    result = paired_inference(paired, args.resamples, args.confidence, args.seed, args.workers)
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    result.to_csv(args.out, index=False)
+    print(f'Saved: {args.out} ({len(result)} rows)')
+
+
+if __name__ == '__main__':
+    main()
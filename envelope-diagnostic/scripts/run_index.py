@@ -0,0 +1,288 @@
+"""
+Run Index (运行索引)
+
+SQLite catalog of the runs/<condition>/<trace_id>/<seed>/ tree, so scripts can
+select runs without walking the file system:
+- runs: one row per run directory with pattern_label, config_hash (canonical
+  content hash of the condition config, as in summary_runs) and
+  browser_config_hash (configHash reported by the browser)
+- artifacts: size, mtime and sha256 of every known file in a run
+
+Updates are incremental: files whose size and mtime are unchanged are not
+re-hashed, rows for deleted runs are removed, and --condition limits the walk to
+the given condition subtrees. Hashing audio files is optional (--hash-audio).
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import run_manifest
+
+SCHEMA_VERSION = 2
+AUDIO_FILES = ('audio.wav',)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS runs (
+    condition TEXT NOT NULL,
+    trace_id TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    run_path TEXT NOT NULL,
+    pattern_label TEXT,
+    config_hash TEXT,
+    browser_config_hash TEXT,
+    indexed_at REAL,
+    PRIMARY KEY (condition, trace_id, seed)
+);
+CREATE INDEX IF NOT EXISTS runs_trace ON runs (trace_id, seed);
+CREATE INDEX IF NOT EXISTS runs_pattern ON runs (condition, pattern_label);
+CREATE INDEX IF NOT EXISTS runs_config ON runs (config_hash);
+CREATE TABLE IF NOT EXISTS artifacts (
+    condition TEXT NOT NULL,
+    trace_id TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha256 TEXT,
+    PRIMARY KEY (condition, trace_id, seed, name)
+);
+'''
+
+
+def connect(db_path):
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    version = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+    if version is None:
+        conn.execute("INSERT INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+        conn.commit()
+    elif int(version[0]) != SCHEMA_VERSION:
+        # 索引可由目录树完全重建：旧版本直接清空重建
+        conn.executescript('DROP TABLE runs; DROP TABLE artifacts;')
+        conn.executescript(SCHEMA)
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'schema_version'", (str(SCHEMA_VERSION),))
+        conn.commit()
+    return conn
+
+
+def _subdirs(path):
+    with os.scandir(path) as it:
+        return sorted((e.name, e.path) for e in it if e.is_dir())
+
+
+def walk_runs(runs_dir, conditions=None):
+    """遍历 runs 目录；给定 conditions 时只进入这些 condition 子树"""
+    for condition, cond_path in _subdirs(runs_dir):
+        if conditions and condition not in conditions:
+            continue
+        for trace_id, trace_path in _subdirs(cond_path):
+            for seed, seed_path in _subdirs(trace_path):
+                if seed.isdigit():
+                    yield condition, trace_id, int(seed), seed_path
+
+
+def _stat_files(run_path, names):
+    stats = {}
+    for name in names:
+        try:
+            st = os.stat(os.path.join(run_path, name))
+        except FileNotFoundError:
+            continue
+        stats[name] = (st.st_size, st.st_mtime_ns)
+    return stats
+
+
+def condition_hashes(conditions_path):
+    """每个 condition 的规范化配置哈希，与 summarize_runs 写入 summary_runs 的 config_hash 一致"""
+    # summarize_runs 导入本模块，这里延迟导入以避免循环
+    from summarize_runs import load_conditions, load_config_hashes, load_envelope_map
+    conditions = load_conditions(conditions_path)
+    return load_config_hashes(conditions, load_envelope_map(conditions))
+
+
+def read_run_labels(run_path):
+    """从 sessionReport.json / reward_spec.json 读取 pattern_label 与浏览器上报的 configHash"""
+    label, config_hash = None, None
+    for name in ('sessionReport.json', 'reward_spec.json'):
+        path = os.path.join(run_path, name)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        label = label or data.get('patternLabel') or data.get('pattern_label')
+        config_hash = config_hash or data.get('configHash') or data.get('config_hash')
+    return label.lower() if isinstance(label, str) else None, config_hash
+
+
+def scan_run(run, known, hash_audio=False):
+    """对比已索引的 artifact 记录，只对 size / mtime 变化的文件重新计算哈希
+
+    Returns:
+        (run, artifacts, labels)  无变化时 artifacts 为 None
+    """
+    run_path = run[3]
+    stats = _stat_files(run_path, run_manifest.RUN_FILES + AUDIO_FILES)
+    known = known or {}
+    # 之前未哈希的音频在 --hash-audio 时需要补算
+    audio_pending = hash_audio and any(known[n][2] is None for n in AUDIO_FILES if n in known)
+    if known and {n: v[:2] for n, v in known.items()} == stats and not audio_pending:
+        return run, None, None
+    artifacts = {}
+    for name, (size, mtime_ns) in stats.items():
+        old = known.get(name)
+        if old is not None and old[:2] == (size, mtime_ns) and old[2] is not None:
+            sha = old[2]
+        elif name in AUDIO_FILES and not hash_audio:
+            sha = None
+        else:
+            sha = run_manifest.file_sha256(os.path.join(run_path, name))
+        artifacts[name] = (size, mtime_ns, sha)
+    return run, artifacts, read_run_labels(run_path)
+
+
+def update_index(db_path, runs_dir, conditions=None, workers=None, hash_audio=False, config_hashes=None):
+    """增量更新索引，返回 (n_runs, n_updated, n_removed)
+
+    config_hashes: {condition: 规范化配置哈希}；配置变化不改动 run 文件，因此每次更新都按 condition 重写该列。
+    """
+    config_hashes = config_hashes or {}
+    conn = connect(db_path)
+    try:
+        known = {}
+        query = 'SELECT condition, trace_id, seed, name, size, mtime_ns, sha256 FROM artifacts'
+        for condition, trace_id, seed, name, size, mtime_ns, sha in conn.execute(query):
+            if conditions and condition not in conditions:
+                continue
+            known.setdefault((condition, trace_id, seed), {})[name] = (size, mtime_ns, sha)
+        indexed = set(conn.execute('SELECT condition, trace_id, seed FROM runs').fetchall())
+        if conditions:
+            indexed = {key for key in indexed if key[0] in conditions}
+
+        runs = list(walk_runs(runs_dir, conditions))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                lambda run: scan_run(run, known.get(run[:3]) if run[:3] in indexed else None, hash_audio),
+                runs))
+
+        now = time.time()
+        n_updated = 0
+        for (condition, trace_id, seed, run_path), artifacts, labels in results:
+            if artifacts is None:
+                continue
+            n_updated += 1
+            key = (condition, trace_id, seed)
+            conn.execute('INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (*key, run_path, labels[0], config_hashes.get(condition), labels[1], now))
+            conn.execute('DELETE FROM artifacts WHERE condition = ? AND trace_id = ? AND seed = ?', key)
+            conn.executemany('INSERT INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             [(*key, name, os.path.join(run_path, name), *values)
+                              for name, values in artifacts.items()])
+
+        scanned = {run[0] for run in runs}
+        conn.executemany('UPDATE runs SET config_hash = ? WHERE condition = ?',
+                         [(config_hashes.get(condition), condition) for condition in scanned])
+
+        stale = indexed - {run[:3] for run in runs}
+        for key in stale:
+            conn.execute('DELETE FROM runs WHERE condition = ? AND trace_id = ? AND seed = ?', key)
+            conn.execute('DELETE FROM artifacts WHERE condition = ? AND trace_id = ? AND seed = ?', key)
+        conn.commit()
+        return len(runs), n_updated, len(stale)
+    finally:
+        conn.close()
+
+
+def _in_clause(column, values, clauses, params):
+    if values:
+        values = list(values)
+        clauses.append(f'{column} IN ({",".join("?" * len(values))})')
+        params.extend(values)
+
+
+def query_runs(db_path, conditions=None, trace_ids=None, seeds=None, pattern_labels=None,
+               config_hashes=None, require=None, browser_config_hashes=None):
+    """按条件查询索引，返回与 list_runs 相同形式的 (condition, trace_id, seed, run_path) 列表
+
+    Args:
+        require: 必须存在的 artifact 文件名（如 ['l1metrics.json', 'reward_spec.json']）
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f'Missing run index {db_path} (build it with run_index.py build)')
+    clauses, params = [], []
+    _in_clause('r.condition', conditions, clauses, params)
+    _in_clause('r.trace_id', trace_ids, clauses, params)
+    _in_clause('r.seed', [int(s) for s in seeds] if seeds else None, clauses, params)
+    _in_clause('r.pattern_label', [p.lower() for p in pattern_labels] if pattern_labels else None,
+               clauses, params)
+    _in_clause('r.config_hash', config_hashes, clauses, params)
+    _in_clause('r.browser_config_hash', browser_config_hashes, clauses, params)
+    for name in require or ():
+        clauses.append('EXISTS (SELECT 1 FROM artifacts a WHERE a.condition = r.condition '
+                       'AND a.trace_id = r.trace_id AND a.seed = r.seed AND a.name = ?)')
+        params.append(name)
+    where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+    sql = f'SELECT r.condition, r.trace_id, r.seed, r.run_path FROM runs r {where} ' \
+          'ORDER BY r.condition, r.trace_id, r.seed'
+    conn = sqlite3.connect(db_path)
+    try:
+        return [(c, t, str(s), p) for c, t, s, p in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the SQLite run index')
+    parser.add_argument('--db', default='summary/run_index.sqlite')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help='Create or incrementally update the index')
+    build.add_argument('--runs', default='runs')
+    build.add_argument('--conditions', default='conditions.yaml',
+                       help='Condition configs used for the config_hash column (same hash as summary_runs)')
+    build.add_argument('--condition', nargs='*', default=None,
+                       help='Only rescan these condition subtrees')
+    build.add_argument('--workers', type=int, default=None)
+    build.add_argument('--hash-audio', action='store_true', help='Also hash audio files (slow)')
+
+    query = sub.add_parser('query', help='List matching runs')
+    query.add_argument('--condition', nargs='*', default=None)
+    query.add_argument('--trace', nargs='*', default=None)
+    query.add_argument('--seed', nargs='*', default=None)
+    query.add_argument('--pattern', nargs='*', default=None)
+    query.add_argument('--config-hash', nargs='*', default=None,
+                       help='Canonical condition config hash (config_hash in summary_runs)')
+    query.add_argument('--browser-config-hash', nargs='*', default=None,
+                       help='configHash reported by the browser in sessionReport.json')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.time()
+        config_hashes = None
+        if os.path.exists(args.conditions):
+            config_hashes = condition_hashes(args.conditions)
+        else:
+            print(f'WARNING: {args.conditions} not found, config_hash left empty')
+        n_runs, n_updated, n_removed = update_index(args.db, args.runs, args.condition,
+                                                    args.workers, args.hash_audio, config_hashes)
+        print(f'Indexed {n_runs} runs ({n_updated} updated, {n_removed} removed) '
+              f'in {time.time() - start:.1f}s -> {args.db}')
+    else:
+        for condition, trace_id, seed, run_path in query_runs(
+                args.db, args.condition, args.trace, args.seed, args.pattern, args.config_hash,
+                browser_config_hashes=args.browser_config_hash):
+            print(f'{condition}\t{trace_id}\t{seed}\t{run_path}')
+
+
+if __name__ == '__main__':
+    main()
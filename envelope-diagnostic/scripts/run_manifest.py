@@ -0,0 +1,88 @@
+"""
+Run Manifest (运行清单)
+
+Persistent record of every summarized run directory: per-file size, mtime and
+content hash plus the extracted summary row. summarize_runs uses it to reparse
+only new or changed runs and to drop runs that no longer exist.
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 3
+RUN_FILES = ('l1metrics.json', 'reward_spec.json', 'sessionReport.json')
+
+
+def run_key(condition, trace_id, seed):
+    return f'{condition}/{trace_id}/{seed}'
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def run_stats(run_path):
+    """返回 run 目录下各文件的 (size, mtime_ns)；不存在的文件不出现在结果中"""
+    stats = {}
+    for name in RUN_FILES:
+        try:
+            st = os.stat(os.path.join(run_path, name))
+        except FileNotFoundError:
+            continue
+        stats[name] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def run_hashes(run_path, names):
+    return {name: file_sha256(os.path.join(run_path, name)) for name in names}
+
+
+def load_manifest(path, envelopes_hash):
+    """读取清单；版本或 envelope 配置变化时返回空清单（所有行都依赖 envelope 边界）"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != MANIFEST_VERSION or data.get('envelopes_hash') != envelopes_hash:
+        return {}
+    return data.get('runs', {})
+
+
+def save_manifest(path, envelopes_hash, runs):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'envelopes_hash': envelopes_hash, 'runs': runs}, f)
+    os.replace(tmp_path, path)
+
+
+def check_entry(entry, run_path):
+    """判断清单记录是否仍然有效
+
+    Returns:
+        (status, stats, hashes)  status 为 'unchanged'、'touched'（仅 mtime 变化、内容相同）
+        或 'changed'；hashes 仅在计算过时返回
+    """
+    stats = run_stats(run_path)
+    if entry is None or set(stats) != set(entry['files']):
+        return 'changed', stats, None
+    if all(stats[name] == entry['files'][name]['stat'] for name in stats):
+        return 'unchanged', stats, None
+    if any(stats[name][0] != entry['files'][name]['stat'][0] for name in stats):
+        return 'changed', stats, None
+    hashes = run_hashes(run_path, stats)
+    if all(hashes[name] == entry['files'][name]['sha256'] for name in stats):
+        return 'touched', stats, hashes
+    return 'changed', stats, hashes
+
+
+def make_entry(stats, hashes, row):
+    return {
+        'files': {name: {'stat': stats[name], 'sha256': hashes[name]} for name in stats},
+        'row': row,
+    }
@@ -0,0 +1,282 @@
+"""
+Session Report Parser (会话报告解析)
+
+Converts session reports into a typed table. Report params are stored as display
+strings under human-readable keys ("accent ratio": "12.28%", "gain": "-4.77 dB");
+they are parsed column-wise into numeric columns named as in summary_runs:
+- tempo_req / tempo_eff
+- accent_req / accent_pct_req ...   ("%" strings are percents, bare numbers are ratios)
+- gain_req (dB) / gain_raw_req ...  ("dB" strings are dB, bare numbers are linear gain)
+
+raw_effective (when a report has it) takes precedence over the effective strings.
+Accepts browser reports (params.requested / params.effective) and records from the
+ingest store (params_requested / params_effective). Files are read incrementally:
+JSON arrays are decoded element by element, NDJSON line by line.
+"""
+
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from table_io import write_table
+
+# 显示键 -> 规范键
+PARAM_ALIASES = {
+    'tempo': 'tempo_bpm',
+    'tempo_bpm': 'tempo_bpm',
+    'accent ratio': 'accent',
+    'accent_ratio': 'accent',
+    'accent': 'accent',
+    'gain': 'gain',
+}
+# 规范字段 -> summary_runs 列名前缀（gain 为 dB，accent 为比例，与 summary_runs 一致）
+COLUMN_PREFIX = {
+    'tempo_bpm': 'tempo',
+    'gain_db': 'gain',
+    'gain_raw': 'gain_raw',
+    'accent_ratio': 'accent',
+    'accent_pct': 'accent_pct',
+}
+METRIC_KEYS = {
+    'integratedLufs': 'integrated_lufs',
+    'lraEffective': 'lra_lu',
+    'onsetDensity': 'onset_density_eps',
+    'peakLufs': 'peak_lufs',
+}
+UNIT_CHARS = '%dBb '
+
+
+def iter_reports(path, chunk_size=1 << 20):
+    """逐条产出文件中的报告（JSON 数组、单个对象或 NDJSON），不一次性读入整个文件"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = f.read(chunk_size)
+        eof = len(buf) < chunk_size
+        pos = 0
+        in_array = None
+
+        def fill():
+            nonlocal buf, pos, eof
+            more = '' if eof else f.read(chunk_size)
+            eof = len(more) < chunk_size
+            buf = buf[pos:] + more
+            pos = 0
+            return bool(more)
+
+        while True:
+            # 跳过空白和数组分隔符
+            while True:
+                while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buf) or not fill():
+                    break
+            if pos >= len(buf):
+                return
+            if in_array is None:
+                in_array = buf[pos] == '['
+                if in_array:
+                    pos += 1
+                    continue
+            if in_array and buf[pos] == ']':
+                return
+            while True:
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                    # 对象恰好在缓冲区末尾结束时，数字等可能被截断，再读一块确认
+                    if end == len(buf) and not eof and fill():
+                        continue
+                    break
+                except json.JSONDecodeError:
+                    if not fill():
+                        raise
+            pos = end
+            if isinstance(obj, dict) and isinstance(obj.get('reports'), list):
+                yield from obj['reports']
+            else:
+                yield obj
+
+
+def parse_value(value):
+    """解析单个显示值，返回 (number, unit)；unit 为 '%'、'dB' 或 ''"""
+    if value is None or isinstance(value, bool):
+        return math.nan, ''
+    if isinstance(value, (int, float)):
+        return float(value), ''
+    text = str(value).strip()
+    unit = '%' if text.endswith('%') else 'dB' if text.lower().endswith('db') else ''
+    try:
+        return float(text.rstrip(UNIT_CHARS)), unit
+    except ValueError:
+        return math.nan, unit
+
+
+def parse_values(values):
+    """parse_value 的向量化版本：对整列做字符串处理，返回 (numbers, units)"""
+    s = pd.Series(values, dtype=object)
+    text = s.astype(str).str.strip()
+    is_pct = text.str.endswith('%').to_numpy()
+    is_db = text.str.lower().str.endswith('db').to_numpy()
+    # None / True 等非数值文本在 to_numeric 中变为 NaN
+    numbers = pd.to_numeric(text.str.rstrip(UNIT_CHARS), errors='coerce').to_numpy(dtype=float)
+    units = np.select([is_pct, is_db], ['%', 'dB'], '')
+    return numbers, units
+
+
+def canonical_params(accent, accent_unit, gain, gain_unit):
+    """由解析后的 accent / gain 值和单位推出全部规范字段（数组或标量）"""
+    accent = np.asarray(accent, dtype=float)
+    gain = np.asarray(gain, dtype=float)
+    is_pct = np.asarray(accent_unit) == '%'
+    is_db = np.asarray(gain_unit) == 'dB'
+    accent_ratio = np.where(is_pct, accent / 100, accent)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gain_db = np.where(is_db, gain, 20 * np.log10(gain))
+    gain_raw = np.where(is_db, 10 ** (gain / 20), gain)
+    return {
+        'gain_db': gain_db,
+        'gain_raw': gain_raw,
+        'accent_ratio': accent_ratio,
+        'accent_pct': accent_ratio * 100,
+    }
+
+
+def parse_params(params):
+    """把一组显示参数（requested / effective）转换为 load_run 使用的数值字典"""
+    values = {}
+    for key, value in params.items():
+        name = PARAM_ALIASES.get(key.strip().lower())
+        if name:
+            values[name] = parse_value(value)
+    tempo, _ = values.get('tempo_bpm', (math.nan, ''))
+    accent, accent_unit = values.get('accent', (math.nan, ''))
+    gain, gain_unit = values.get('gain', (math.nan, ''))
+    parsed = {'tempo_bpm': tempo}
+    parsed.update({k: float(v) for k, v in canonical_params(accent, accent_unit, gain, gain_unit).items()})
+    return parsed
+
+
+META_COLUMNS = ('trace_id', 'pattern_label', 'condition', 'config_hash', 'enforcement_status')
+RAW_PARAM_COLUMNS = ('tempo_bpm', 'accent', 'gain')
+
+
+def _first(report, *keys):
+    for key in keys:
+        value = report.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def _aliased(params):
+    """按 PARAM_ALIASES 取出 (tempo, accent, gain) 原始值；显示键大多可直接命中"""
+    found = {}
+    for key, value in params.items():
+        name = PARAM_ALIASES.get(key) or PARAM_ALIASES.get(key.strip().lower())
+        if name:
+            found[name] = value
+    return tuple(found.get(name) for name in RAW_PARAM_COLUMNS)
+
+
+def flatten_report(report):
+    """把一条报告展开为扁平元组（元数据、requested/effective 原始值、raw_effective、metrics）"""
+    params = report.get('params')
+    if isinstance(params, dict):
+        requested, effective = params.get('requested') or {}, params.get('effective') or {}
+        raw_effective = params.get('raw_effective')
+    else:
+        requested = report.get('params_requested') or {}
+        effective = report.get('params_effective') or {}
+        raw_effective = report.get('raw_effective')
+    if not isinstance(raw_effective, dict):
+        raw_effective = {}
+    metrics = report.get('metrics') or {}
+    label = _first(report, 'patternLabel', 'pattern_label')
+    return (
+        _first(report, 'traceId', 'trace_id'),
+        label.lower() if isinstance(label, str) else None,
+        report.get('condition'),
+        _first(report, 'configHash', 'config_hash'),
+        _first(report, 'enforcementStatus', 'enforcement_status'),
+        *_aliased(requested),
+        *_aliased(effective),
+        *(raw_effective.get(key) for key in COLUMN_PREFIX),
+        *(_first(metrics, camel, snake) for camel, snake in METRIC_KEYS.items()),
+    )
+
+
+def reports_to_frame(reports):
+    """批量把报告转换为类型化 DataFrame：逐条只做扁平化，数值解析按整列进行"""
+    raw_columns = ([f'{name}_req_raw' for name in RAW_PARAM_COLUMNS]
+                   + [f'{name}_eff_raw' for name in RAW_PARAM_COLUMNS])
+    exact_columns = [f'{key}_exact' for key in COLUMN_PREFIX]
+    columns = list(META_COLUMNS) + raw_columns + exact_columns + list(METRIC_KEYS.values())
+    flat = pd.DataFrame.from_records([flatten_report(r) for r in reports], columns=columns)
+
+    df = flat[list(META_COLUMNS)].copy()
+    for side in ('req', 'eff'):
+        tempo, _ = parse_values(flat[f'tempo_bpm_{side}_raw'])
+        accent, accent_unit = parse_values(flat[f'accent_{side}_raw'])
+        gain, gain_unit = parse_values(flat[f'gain_{side}_raw'])
+        df[f'tempo_{side}'] = tempo
+        for key, values in canonical_params(accent, accent_unit, gain, gain_unit).items():
+            df[f'{COLUMN_PREFIX[key]}_{side}'] = values
+
+    # raw_effective 为精确值，存在时覆盖由显示字符串解析出的 effective
+    for key, prefix in COLUMN_PREFIX.items():
+        exact = pd.to_numeric(flat[f'{key}_exact'], errors='coerce').to_numpy(dtype=float)
+        df[f'{prefix}_eff'] = np.where(np.isnan(exact), df[f'{prefix}_eff'].to_numpy(), exact)
+
+    for key in METRIC_KEYS.values():
+        df[key] = pd.to_numeric(flat[key], errors='coerce')
+    return df
+
+
+def read_reports(paths, batch_size=50000):
+    """流式读取多个报告文件，每 batch_size 条解析成一个 DataFrame 后拼接"""
+    frames, batch = [], []
+    for path in paths:
+        for report in iter_reports(path):
+            if isinstance(report, dict):
+                batch.append(report)
+            if len(batch) >= batch_size:
+                frames.append(reports_to_frame(batch))
+                batch = []
+    if batch:
+        frames.append(reports_to_frame(batch))
+    return pd.concat(frames, ignore_index=True) if frames else reports_to_frame([])
+
+
+def find_report_files(paths):
+    """展开目录（如 ingest/ 分区存储）为其中的 .json / .jsonl 文件"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, n) for n in sorted(names)
+                             if n.endswith('.json') or n.endswith('.jsonl'))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse session reports into a typed table')
+    parser.add_argument('inputs', nargs='+', help='Report files (.json / .jsonl) or directories')
+    parser.add_argument('--out', default='summary/session_reports.csv')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'both'], default='csv')
+    parser.add_argument('--batch-size', type=int, default=50000)
+    args = parser.parse_args()
+
+    files = find_report_files(args.inputs)
+    df = read_reports(files, args.batch_size)
+    write_table(df, args.out, args.format)
+    print(f'Parsed {len(df)} reports from {len(files)} files -> {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Mergeable Statistics Sketches (可合并统计草图)
+
+Bounded-memory summaries used by the streaming summarizer:
+- QuantileSketch: DDSketch-style log-bucket histogram with relative accuracy
+  guarantees, supports negative values, merge and JSON round-trip
+- RateCounter: running count / flag sums / value sum / max
+"""
+
+import math
+
+import numpy as np
+
+
+class QuantileSketch:
+    """相对误差为 relative_accuracy 的分位数草图，内存只与数值的数量级跨度有关"""
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _add_buckets(self, store, magnitudes):
+        keys = np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+        uniq, counts = np.unique(keys, return_counts=True)
+        for key, n in zip(uniq.tolist(), counts.tolist()):
+            store[key] = store.get(key, 0) + n
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.count += values.size
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        pos = values[values >= self.min_value]
+        neg = -values[values <= -self.min_value]
+        self.zero_count += values.size - pos.size - neg.size
+        if pos.size:
+            self._add_buckets(self.positive, pos)
+        if neg.size:
+            self._add_buckets(self.negative, neg)
+        return self
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError('Cannot merge sketches with different relative accuracy')
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, n in other_store.items():
+                store[key] = store.get(key, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _bucket_value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        """返回近似分位数；空草图返回 nan"""
+        if self.count == 0:
+            return math.nan
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        neg_keys = sorted(self.negative, reverse=True)
+        pos_keys = sorted(self.positive)
+        values = ([-self._bucket_value(k) for k in neg_keys] + [0.0]
+                  + [self._bucket_value(k) for k in pos_keys])
+        counts = ([self.negative[k] for k in neg_keys] + [self.zero_count]
+                  + [self.positive[k] for k in pos_keys])
+        rank = q * (self.count - 1)
+        idx = int(np.searchsorted(np.cumsum(counts), rank, side='right'))
+        return float(min(max(values[min(idx, len(values) - 1)], self.min), self.max))
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'min_value': self.min_value,
+            'positive': {str(k): v for k, v in self.positive.items()},
+            'negative': {str(k): v for k, v in self.negative.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relative_accuracy'], data['min_value'])
+        sketch.positive = {int(k): v for k, v in data['positive'].items()}
+        sketch.negative = {int(k): v for k, v in data['negative'].items()}
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.min = data['min'] if data['min'] is not None else math.inf
+        sketch.max = data['max'] if data['max'] is not None else -math.inf
+        return sketch
+
+
+class RateCounter:
+    """流式累计：行数、各标志列之和（缺失按 0）、数值的和 / 个数 / 最大值"""
+
+    def __init__(self):
+        self.n = 0
+        self.flags = {}
+        self.sums = {}
+        self.counts = {}
+        self.maxima = {}
+
+    def update_flags(self, frame, columns):
+        for col in columns:
+            self.flags[col] = self.flags.get(col, 0) + float(frame[col].fillna(0).sum())
+
+    def update_values(self, name, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if values.size:
+            self.sums[name] = self.sums.get(name, 0.0) + float(values.sum())
+            self.counts[name] = self.counts.get(name, 0) + values.size
+            self.maxima[name] = max(self.maxima.get(name, -math.inf), float(values.max()))
+
+    def rate(self, col):
+        return self.flags.get(col, 0) / self.n if self.n else 0
+
+    def mean(self, name):
+        return self.sums[name] / self.counts[name] if self.counts.get(name) else 0
+
+    def max(self, name):
+        return self.maxima.get(name, 0)
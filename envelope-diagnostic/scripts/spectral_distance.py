@@ -0,0 +1,225 @@
+"""
+Spectral Distances (频谱距离)
+
+Timbral impact of the envelope per paired (trace_id, seed): the baseline and
+constrained audio.wav of every row in paired_summary_all are compared with
+- logmel_l2_db: RMS difference of the log-mel spectrograms (dB), averaged over
+  time-aligned frames
+- spectral centroid (Hz): power-weighted mean frequency, averaged over frames
+- spectral flux (dB): mean positive log-mel change between consecutive frames
+
+Log-mel frames use the same STFT / mel filterbank as the browser spectrogram
+export (scripts/mel_spectrogram.py at the repository root). Each baseline file
+is decoded once for all conditions it is paired with; pairs run in a process
+pool. Per-pair results are kept in summary/spectral_distances.csv (only new
+pairs are computed on re-runs) and joined onto paired_summary_all and the
+per-condition paired_summary files as baseline_* / constrained_* / delta_*
+columns. Distances are measured directly and are not zeroed for unclamped pairs.
+Stored rows carry the STFT / mel parameters and the size and mtime of both WAVs;
+a row is recomputed when any of them no longer matches.
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from summarize_runs import write_paired_summaries
+from table_io import read_table
+
+# 复用仓库根目录 scripts/ 下的 STFT / mel 滤波器组实现
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                             'scripts'))
+import mel_spectrogram  # noqa: E402
+
+KEY_COLUMNS = ['condition', 'trace_id', 'seed']
+FEATURES = ('spectral_centroid_hz', 'spectral_flux_db')
+SPECTRAL_COLUMNS = (['logmel_l2_db']
+                    + [f'{side}_{feature}' for feature in FEATURES for side in ('baseline', 'constrained', 'delta')])
+# 结果表中用于判断是否过期的列：计算参数与两个 WAV 的 (size, mtime)
+PARAM_COLUMNS = ['n_fft', 'hop', 'n_mels', 'fmin', 'fmax']
+SOURCE_COLUMNS = ['baseline_wav_size', 'baseline_wav_mtime_ns', 'constrained_wav_size', 'constrained_wav_mtime_ns']
+
+
+def spectral_features(path, n_fft=2048, hop=1024, n_mels=64, fmin=20.0, fmax=8000.0):
+    """单个 WAV 的 log-mel 帧、平均谱质心与平均谱通量（分块 STFT，内存有界）"""
+    samples, sr, scale = mel_spectrogram.read_audio(path)
+    fb_t = np.ascontiguousarray(mel_spectrogram.mel_filterbank(sr, n_fft, n_mels, float(fmin), float(fmax)).T)
+    freqs = np.fft.rfftfreq(n_fft, 1.0 / sr)
+    n_frames = mel_spectrogram.frame_count(len(samples), n_fft, hop)
+    mel = np.empty((n_frames, n_mels), dtype=np.float32)
+    centroid_sum, centroid_n = 0.0, 0
+    for f0, power in mel_spectrogram.stft_power_chunks(samples, n_fft, hop, scale):
+        mel[f0:f0 + len(power)] = 10.0 * np.log10(np.maximum(power @ fb_t, 1e-12))
+        total = power.sum(axis=1)
+        # 静音帧没有质心，不计入平均
+        voiced = total > 1e-12
+        centroid_sum += float(((power[voiced] @ freqs) / total[voiced]).sum())
+        centroid_n += int(voiced.sum())
+    flux = np.maximum(np.diff(mel, axis=0), 0.0).mean(axis=1)
+    return {
+        'mel': mel,
+        'spectral_centroid_hz': centroid_sum / centroid_n if centroid_n else np.nan,
+        'spectral_flux_db': float(flux.mean()) if flux.size else np.nan,
+    }
+
+
+def logmel_l2(mel_a, mel_b):
+    """逐帧 log-mel 差的 RMS（dB），按较短的一段对齐后取平均"""
+    n = min(len(mel_a), len(mel_b))
+    if n == 0:
+        return np.nan
+    diff = mel_a[:n] - mel_b[:n]
+    return float(np.sqrt(np.mean(diff * diff, axis=1)).mean())
+
+
+def pair_distances(base, constrained):
+    row = {'logmel_l2_db': logmel_l2(constrained['mel'], base['mel'])}
+    for feature in FEATURES:
+        row[f'baseline_{feature}'] = base[feature]
+        row[f'constrained_{feature}'] = constrained[feature]
+        row[f'delta_{feature}'] = constrained[feature] - base[feature]
+    return row
+
+
+def audio_path(runs_dir, condition, trace_id, seed, audio_name='audio.wav'):
+    return os.path.join(runs_dir, condition, str(trace_id), str(seed), audio_name)
+
+
+def wav_signature(path):
+    """(size, mtime_ns)；文件不存在时为 (-1, -1)"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return -1, -1
+    return st.st_size, st.st_mtime_ns
+
+
+def source_signatures(pairs, runs_dir='runs', audio_name='audio.wav'):
+    """pairs 中每对当前的 WAV 签名（baseline 每个 (trace_id, seed) 只 stat 一次）"""
+    base = {}
+    rows = []
+    for condition, trace_id, seed in pairs[KEY_COLUMNS].itertuples(index=False):
+        if (trace_id, seed) not in base:
+            base[(trace_id, seed)] = wav_signature(audio_path(runs_dir, 'baseline', trace_id, seed, audio_name))
+        rows.append((condition, trace_id, seed, *base[(trace_id, seed)],
+                     *wav_signature(audio_path(runs_dir, condition, trace_id, seed, audio_name))))
+    return pd.DataFrame(rows, columns=KEY_COLUMNS + SOURCE_COLUMNS)
+
+
+def current_results(previous, pairs, params, runs_dir='runs', audio_name='audio.wav'):
+    """保留 previous 中参数与 WAV 签名都与当前一致的行；旧格式（无这些列）的结果全部视为过期"""
+    if any(c not in previous.columns for c in PARAM_COLUMNS + SOURCE_COLUMNS):
+        return previous.iloc[:0]
+    now = source_signatures(pairs, runs_dir, audio_name)
+    check = previous.merge(now, on=KEY_COLUMNS, how='inner', suffixes=('', '_now'))
+    ok = np.ones(len(check), dtype=bool)
+    for col in SOURCE_COLUMNS:
+        ok &= check[col].to_numpy() == check[f'{col}_now'].to_numpy()
+    for col in PARAM_COLUMNS:
+        ok &= check[col].to_numpy(dtype=float) == float(params[col])
+    return check.loc[ok, list(previous.columns)].reset_index(drop=True)
+
+
+def _pair_task(task):
+    """一个 baseline run 与其所有 constrained 配对；baseline 只解码一次"""
+    runs_dir, trace_id, seed, conditions, audio_name, params = task
+    rows, warnings = [], []
+    base_path = audio_path(runs_dir, 'baseline', trace_id, seed, audio_name)
+    # 先 stat 再读取：读取期间文件被改写时签名不匹配，下次会重新计算
+    base_size, base_mtime = wav_signature(base_path)
+    try:
+        base = spectral_features(base_path, **params)
+    except (ValueError, OSError) as e:
+        return rows, [f'{base_path}: {e}']
+    for condition in conditions:
+        path = audio_path(runs_dir, condition, trace_id, seed, audio_name)
+        size, mtime = wav_signature(path)
+        try:
+            constrained = spectral_features(path, **params)
+        except (ValueError, OSError) as e:
+            warnings.append(f'{path}: {e}')
+            continue
+        rows.append({'condition': condition, 'trace_id': trace_id, 'seed': seed,
+                     **pair_distances(base, constrained), **params,
+                     'baseline_wav_size': base_size, 'baseline_wav_mtime_ns': base_mtime,
+                     'constrained_wav_size': size, 'constrained_wav_mtime_ns': mtime})
+    return rows, warnings
+
+
+def compute_spectral_distances(pairs, runs_dir='runs', audio_name='audio.wav', workers=None,
+                               n_fft=2048, hop=1024, n_mels=64, fmin=20.0, fmax=8000.0):
+    """pairs: 含 condition / trace_id / seed 的表；返回每对一行的距离表（附计算参数与 WAV 签名）"""
+    params = {'n_fft': n_fft, 'hop': hop, 'n_mels': n_mels, 'fmin': float(fmin), 'fmax': float(fmax)}
+    tasks = [(runs_dir, trace_id, int(seed), list(group['condition']), audio_name, params)
+             for (trace_id, seed), group in pairs.groupby(['trace_id', 'seed'], sort=True)]
+    rows = []
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for task_rows, warnings in pool.map(_pair_task, tasks, chunksize=4):
+                rows.extend(task_rows)
+                for warning in warnings:
+                    print(f'WARNING: {warning}')
+    return pd.DataFrame(rows, columns=KEY_COLUMNS + SPECTRAL_COLUMNS + PARAM_COLUMNS + SOURCE_COLUMNS)
+
+
+def _normalize_keys(df):
+    return df.assign(condition=df['condition'].astype(str), trace_id=df['trace_id'].astype(str),
+                     seed=df['seed'].astype('int64'))
+
+
+def attach_spectral_columns(paired, distances):
+    """把距离列并入 paired 长表（已有的同名列先删除，可重复执行）"""
+    paired = _normalize_keys(paired.drop(columns=[c for c in SPECTRAL_COLUMNS if c in paired.columns]))
+    return paired.merge(_normalize_keys(distances[KEY_COLUMNS + SPECTRAL_COLUMNS]), on=KEY_COLUMNS, how='left')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Spectral distances between baseline and constrained audio')
+    parser.add_argument('--runs', default='runs')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'both'], default='csv',
+                        help='Format of the paired tables (read and rewritten)')
+    parser.add_argument('--audio-name', default='audio.wav')
+    parser.add_argument('--results', default='summary/spectral_distances.csv',
+                        help='Per-pair results; pairs listed here with the same parameters and unchanged '
+                             'WAVs are not recomputed')
+    parser.add_argument('--overwrite', action='store_true', help='Recompute every pair')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--n-fft', type=int, default=2048)
+    parser.add_argument('--hop', type=int, default=1024)
+    parser.add_argument('--n-mels', type=int, default=64)
+    parser.add_argument('--fmin', type=float, default=20.0)
+    parser.add_argument('--fmax', type=float, default=8000.0)
+    args = parser.parse_args()
+
+    in_fmt = 'parquet' if args.format == 'parquet' else 'csv'
+    paired = _normalize_keys(read_table(f'summary/paired_summary_all.{in_fmt}'))
+    params = {'n_fft': args.n_fft, 'hop': args.hop, 'n_mels': args.n_mels, 'fmin': args.fmin, 'fmax': args.fmax}
+    previous = None
+    todo = paired[KEY_COLUMNS]
+    if os.path.exists(args.results) and not args.overwrite:
+        previous = current_results(_normalize_keys(pd.read_csv(args.results)), todo, params,
+                                   args.runs, args.audio_name)
+        # 空表参与 concat 会把缺失列升级为 float，mtime_ns 因而失去精度
+        if previous.empty:
+            previous = None
+    if previous is not None:
+        done = todo.merge(previous[KEY_COLUMNS], on=KEY_COLUMNS, how='left', indicator=True)['_merge'] == 'both'
+        todo = todo[~done.to_numpy()]
+
+    computed = compute_spectral_distances(todo, args.runs, args.audio_name, args.workers, **params)
+    distances = pd.concat([previous, computed], ignore_index=True) if previous is not None else computed
+    os.makedirs(os.path.dirname(args.results) or '.', exist_ok=True)
+    distances.to_csv(args.results, index=False)
+    print(f'Computed {len(computed)} of {len(todo)} new or outdated pairs ({len(distances)} total): {args.results}')
+
+    conditions = list(pd.unique(paired['condition']))
+    write_paired_summaries(attach_spectral_columns(paired, distances), conditions, args.format)
+    print(f'Updated paired tables for {len(conditions)} condition(s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,29 @@
 import argparse
-import csv
+import itertools
 import json
+import math
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import yaml
 
+import run_index
+import run_manifest
+from content_hash import condition_config_hash, content_hash, frame_hash
+from memo_cache import MISSING, MemoCache
+from session_reports import parse_params
+from sketches import QuantileSketch, RateCounter
+from table_io import write_table
+
+
+# 输出根目录：空串为当前目录（规范输出）；子集汇总写到单独目录，不覆盖规范输出
+OUTPUT_ROOT = ''
+
+
+def output_path(path):
+    return os.path.join(OUTPUT_ROOT, path)
+
 
 def read_json(path):
     with open(path, 'r', encoding='utf-8') as f:
@@ -17,121 +35,201 @@ def load_conditions(path):
         return yaml.safe_load(f)['conditions']
 
 
+def load_envelope_map(conditions):
+    envelope_map = {}
+    for name, cfg in conditions.items():
+        env_path = cfg.get('envelope')
+        if env_path and os.path.exists(env_path):
+            envelope_map[name] = read_json(env_path)
+    return envelope_map
+
+
+def load_config_hashes(conditions, envelope_map):
+    """每个 condition 的规范化配置哈希（envelope 按内容计入，与 condition 名无关）"""
+    return {name: condition_config_hash(cfg, envelope_map.get(name)) for name, cfg in conditions.items()}
+
+
+def _subdirs(path):
+    with os.scandir(path) as it:
+        return sorted((e.name, e.path) for e in it if e.is_dir())
+
+
 def list_runs(base_dir):
+    """用 os.scandir 遍历 runs/condition/trace/seed，按名称排序保证输出顺序确定"""
     runs = []
-    for condition in os.listdir(base_dir):
-        cond_path = os.path.join(base_dir, condition)
-        if not os.path.isdir(cond_path):
-            continue
-        for trace_id in os.listdir(cond_path):
-            trace_path = os.path.join(cond_path, trace_id)
-            if not os.path.isdir(trace_path):
-                continue
-            for seed in os.listdir(trace_path):
-                seed_path = os.path.join(trace_path, seed)
-                if not os.path.isdir(seed_path):
-                    continue
+    for condition, cond_path in _subdirs(base_dir):
+        for trace_id, trace_path in _subdirs(cond_path):
+            for seed, seed_path in _subdirs(trace_path):
                 runs.append((condition, trace_id, seed, seed_path))
     return runs
 
 
+def iter_runs(base_dir):
+    """list_runs 的惰性版本；baseline 最先产出，流式配对时 baseline 指标已就绪"""
+    conditions = sorted(_subdirs(base_dir), key=lambda c: c[0] != 'baseline')
+    for condition, cond_path in conditions:
+        for trace_id, trace_path in _subdirs(cond_path):
+            for seed, seed_path in _subdirs(trace_path):
+                yield condition, trace_id, seed, seed_path
+
+
 def oob_flag(value, bounds):
     return int(value < bounds['min'] or value > bounds['max'])
 
 
-def summarize_runs(runs_dir, conditions_path):
-    conditions = load_conditions(conditions_path)
-    envelope_map = {}
-    for name, cfg in conditions.items():
-        env_path = cfg.get('envelope')
-        if env_path and os.path.exists(env_path):
-            envelope_map[name] = read_json(env_path)
+# 显示字符串的精度（tempo 取整，gain 两位小数 dB，accent 两位小数百分比）；
+# 键为比较字段，值为容差和随之一起替换的派生字段
+DISPLAY_PRECISION = {
+    'tempo_bpm': (0.5, ()),
+    'gain_db': (0.005, ('gain_raw',)),
+    'accent_ratio': (0.5e-4, ('accent_pct',)),
+}
+
+
+def snap_display_params(effective, requested):
+    """由显示字符串解析出的 effective 与 requested 相差不超过显示精度时视为未改动，取 requested 的原始值"""
+    snapped = dict(effective)
+    for key, (tolerance, linked) in DISPLAY_PRECISION.items():
+        if abs(snapped[key] - requested[key]) <= tolerance * (1 + 1e-6):
+            for name in (key, *linked):
+                snapped[name] = requested[name]
+    return snapped
+
+
+def load_run(run, envelope_map, config_hashes=None):
+    """读取单个 run 目录并生成 summary 行；缺少 metrics/reward 文件时返回 None
+
+    config_hash 为 condition 配置的规范化内容哈希，reward_hash 为 reward_spec 的内容哈希。
+    """
+    condition, trace_id, seed, run_path = run
+    metrics_path = os.path.join(run_path, 'l1metrics.json')
+    reward_path = os.path.join(run_path, 'reward_spec.json')
+    session_path = os.path.join(run_path, 'sessionReport.json')
+    if not os.path.exists(metrics_path) or not os.path.exists(reward_path):
+        return None
+
+    metrics = read_json(metrics_path)
+    reward = read_json(reward_path)
+    session = read_json(session_path) if os.path.exists(session_path) else None
+
+    if session:
+        # Use raw_effective from session if available (added in recent update)
+        # otherwise fall back to parsing the display strings
+        # Requested params in session are formatted strings now
+        # So we prefer to get requested params from reward_spec which is raw
+        requested = reward['params_requested']
+
+        if 'raw_effective' in session['params']:
+            effective = session['params']['raw_effective']
+        else:
+            # Older reports only have display strings ("12.28%", "-4.77 dB"), rounded to
+            # 2 decimals: values within display precision of requested were not clamped
+            effective = snap_display_params(parse_params(session['params']['effective']), requested)
+        
+        pattern_label = session.get('patternLabel')
+    else:
+        requested = reward['params_requested']
+        effective = reward['params_requested']
+        pattern_label = reward.get('pattern_label')
+    config_hash = config_hashes.get(condition) if config_hashes else None
+
+    envelope = envelope_map.get(condition)
+    tempo_bounds = envelope.get('tempo_bpm') if envelope else None
+    gain_bounds = envelope.get('gain') if envelope else None
+    accent_bounds = envelope.get('accent_ratio') if envelope else None
+
+    tempo_req_oob = oob_flag(requested['tempo_bpm'], tempo_bounds) if tempo_bounds else None
+    tempo_eff_oob = oob_flag(effective['tempo_bpm'], tempo_bounds) if tempo_bounds else None
+    gain_req_oob = oob_flag(requested['gain_raw'], gain_bounds) if gain_bounds else None
+    gain_eff_oob = oob_flag(effective['gain_raw'], gain_bounds) if gain_bounds else None
+    accent_req_oob = oob_flag(requested['accent_ratio'], accent_bounds) if accent_bounds else None
+    accent_eff_oob = oob_flag(effective['accent_ratio'], accent_bounds) if accent_bounds else None
+
+    row = {
+        'trace_id': trace_id,
+        'seed': int(seed),
+        'condition': condition,
+        'pattern_label': pattern_label,
+        'config_hash': config_hash,
+        'reward_hash': content_hash(reward),
+        'tempo_req': requested['tempo_bpm'],
+        'tempo_eff': effective['tempo_bpm'],
+        'tempo_req_oob': tempo_req_oob,
+        'tempo_eff_oob': tempo_eff_oob,
+        'tempo_clamped': int(requested['tempo_bpm'] != effective['tempo_bpm']),
+        'tempo_delta': effective['tempo_bpm'] - requested['tempo_bpm'],
+        'gain_req': requested['gain_db'],
+        'gain_eff': effective['gain_db'],
+        'gain_req_oob': gain_req_oob,
+        'gain_eff_oob': gain_eff_oob,
+        'gain_clamped': int(requested['gain_db'] != effective['gain_db']),
+        'gain_delta': effective['gain_db'] - requested['gain_db'],
+        'gain_unit': requested.get('gain_unit'),
+        'accent_req': requested['accent_ratio'],
+        'accent_eff': effective['accent_ratio'],
+        'accent_req_oob': accent_req_oob,
+        'accent_eff_oob': accent_eff_oob,
+        'accent_clamped': int(requested['accent_ratio'] != effective['accent_ratio']),
+        'accent_delta': effective['accent_ratio'] - requested['accent_ratio'],
+        'accent_pct_req': requested['accent_pct'],
+        'accent_pct_eff': effective['accent_pct'],
+        'integrated_lufs': metrics.get('integrated_lufs'),
+        'lra_lu': metrics.get('lra_lu'),
+        'onset_density_eps': metrics.get('onset_density_eps'),
+        'peak_lufs': metrics.get('peak_lufs'),
+        'audio_path': metrics.get('audio_path'),
+        'session_report_path': session_path if session else None,
+    }
+    return row
 
-    rows = []
-    for condition, trace_id, seed, run_path in list_runs(runs_dir):
-        metrics_path = os.path.join(run_path, 'l1metrics.json')
-        reward_path = os.path.join(run_path, 'reward_spec.json')
-        session_path = os.path.join(run_path, 'sessionReport.json')
-        if not os.path.exists(metrics_path) or not os.path.exists(reward_path):
-            continue
 
-        metrics = read_json(metrics_path)
-        reward = read_json(reward_path)
-        session = read_json(session_path) if os.path.exists(session_path) else None
-
-        if session:
-            # Use raw_effective from session if available (added in recent update)
-            # otherwise fall back to parsing strings (which is brittle)
-            if 'raw_effective' in session['params']:
-                effective = session['params']['raw_effective']
-            else:
-                # Fallback or error - for now assume raw_effective exists if session exists
-                # because we updated run_pair.js
-                effective = session['params']['effective'] 
-
-            # Requested params in session are formatted strings now
-            # So we prefer to get requested params from reward_spec which is raw
-            requested = reward['params_requested']
-            
-            pattern_label = session.get('patternLabel')
-            config_hash = session.get('configHash')
-        else:
-            requested = reward['params_requested']
-            effective = reward['params_requested']
-            pattern_label = reward.get('pattern_label')
-            config_hash = None
-
-        envelope = envelope_map.get(condition)
-        tempo_bounds = envelope.get('tempo_bpm') if envelope else None
-        gain_bounds = envelope.get('gain') if envelope else None
-        accent_bounds = envelope.get('accent_ratio') if envelope else None
-
-        tempo_req_oob = oob_flag(requested['tempo_bpm'], tempo_bounds) if tempo_bounds else None
-        tempo_eff_oob = oob_flag(effective['tempo_bpm'], tempo_bounds) if tempo_bounds else None
-        gain_req_oob = oob_flag(requested['gain_raw'], gain_bounds) if gain_bounds else None
-        gain_eff_oob = oob_flag(effective['gain_raw'], gain_bounds) if gain_bounds else None
-        accent_req_oob = oob_flag(requested['accent_ratio'], accent_bounds) if accent_bounds else None
-        accent_eff_oob = oob_flag(effective['accent_ratio'], accent_bounds) if accent_bounds else None
-
-        row = {
-            'trace_id': trace_id,
-            'seed': int(seed),
-            'condition': condition,
-            'pattern_label': pattern_label,
-            'config_hash': config_hash,
-            'tempo_req': requested['tempo_bpm'],
-            'tempo_eff': effective['tempo_bpm'],
-            'tempo_req_oob': tempo_req_oob,
-            'tempo_eff_oob': tempo_eff_oob,
-            'tempo_clamped': int(requested['tempo_bpm'] != effective['tempo_bpm']),
-            'tempo_delta': effective['tempo_bpm'] - requested['tempo_bpm'],
-            'gain_req': requested['gain_db'],
-            'gain_eff': effective['gain_db'],
-            'gain_req_oob': gain_req_oob,
-            'gain_eff_oob': gain_eff_oob,
-            'gain_clamped': int(requested['gain_db'] != effective['gain_db']),
-            'gain_delta': effective['gain_db'] - requested['gain_db'],
-            'gain_unit': requested.get('gain_unit'),
-            'accent_req': requested['accent_ratio'],
-            'accent_eff': effective['accent_ratio'],
-            'accent_req_oob': accent_req_oob,
-            'accent_eff_oob': accent_eff_oob,
-            'accent_clamped': int(requested['accent_ratio'] != effective['accent_ratio']),
-            'accent_delta': effective['accent_ratio'] - requested['accent_ratio'],
-            'accent_pct_req': requested['accent_pct'],
-            'accent_pct_eff': effective['accent_pct'],
-            'integrated_lufs': metrics.get('integrated_lufs'),
-            'lra_lu': metrics.get('lra_lu'),
-            'onset_density_eps': metrics.get('onset_density_eps'),
-            'peak_lufs': metrics.get('peak_lufs'),
-            'audio_path': metrics.get('audio_path'),
-            'session_report_path': session_path if session else None,
-        }
-        rows.append(row)
-
-    os.makedirs('summary', exist_ok=True)
+def summarize_runs(runs_dir, conditions_path, workers=None, manifest_path=None, rebuild=False,
+                   fmt='csv', runs=None):
+    """汇总所有 run；给定 manifest_path 时只重新解析新增或内容变化的 run
+
+    runs 为从 run 索引中选出的子集时不遍历 runs_dir；此时清单中子集以外的记录保留不动。
+    """
+    conditions = load_conditions(conditions_path)
+    envelope_map = load_envelope_map(conditions)
+    config_hashes = load_config_hashes(conditions, envelope_map)
+
+    subset = runs is not None
+    if runs is None:
+        runs = list_runs(runs_dir)
+    # 配置哈希已包含 envelope 内容，任何 condition 配置变化都使清单失效
+    envelopes_hash = content_hash(config_hashes)
+    manifest = {} if rebuild else run_manifest.load_manifest(manifest_path, envelopes_hash)
+
+    def process(run):
+        key = run_manifest.run_key(*run[:3])
+        entry = manifest.get(key)
+        status, stats, hashes = run_manifest.check_entry(entry, run[3])
+        if status == 'unchanged':
+            return key, status, entry
+        if status == 'touched':
+            return key, status, run_manifest.make_entry(stats, hashes, entry['row'])
+        row = load_run(run, envelope_map, config_hashes)
+        if hashes is None:
+            hashes = run_manifest.run_hashes(run[3], stats)
+        return key, status, run_manifest.make_entry(stats, hashes, row)
+
+    # 每个 run 需要读 2-3 个小 JSON 文件，I/O 为主，用线程池并发加载；map 保持输入顺序
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(process, runs))
+
+    entries = {key: entry for key, _, entry in results}
+    rows = [entry['row'] for entry in entries.values() if entry['row']]
+
+    if manifest_path:
+        n_changed = sum(status == 'changed' for _, status, _ in results)
+        n_stale = 0 if subset else len(set(manifest) - set(entries))
+        print(f'Runs: {len(runs)} total, {n_changed} parsed, '
+              f'{len(runs) - n_changed} reused from manifest, {n_stale} stale removed')
+        run_manifest.save_manifest(manifest_path, envelopes_hash,
+                                   {**manifest, **entries} if subset else entries)
+
     df = pd.DataFrame(rows)
-    df.to_csv('summary/summary_runs.csv', index=False)
+    write_table(df, output_path('summary/summary_runs.csv'), fmt, partition_cols=['condition'])
 
     return df, envelope_map
 
@@ -141,110 +239,202 @@ def snap_to_zero(value, threshold=1e-6):
     return 0.0 if abs(value) < threshold else value
 
 
-def build_paired_summary_for_condition(df, condition, output_path):
-    base = df[df['condition'] == 'baseline']
-    constrained = df[df['condition'] == condition]
-    merged = base.merge(constrained, on=['trace_id', 'seed'], suffixes=('_baseline', '_constrained'))
-    rows = []
-    for _, row in merged.iterrows():
-        # 检查是否有任何参数被 clamp
-        any_clamped = (row['tempo_clamped_constrained'] == 1 or 
-                       row['gain_clamped_constrained'] == 1 or 
-                       row['accent_clamped_constrained'] == 1)
-        
-        # 如果没有任何 clamp，delta 应该为 0（消除生成器随机噪声）
-        if any_clamped:
-            delta_lufs = row['integrated_lufs_constrained'] - row['integrated_lufs_baseline']
-            delta_lra = row['lra_lu_constrained'] - row['lra_lu_baseline']
-            delta_onset = row['onset_density_eps_constrained'] - row['onset_density_eps_baseline']
-            # 清理浮点误差（< 1e-6 视为 0）
-            delta_lufs = 0.0 if abs(delta_lufs) < 1e-6 else delta_lufs
-            delta_lra = 0.0 if abs(delta_lra) < 1e-6 else delta_lra
-            delta_onset = 0.0 if abs(delta_onset) < 1e-6 else delta_onset
-        else:
-            delta_lufs = 0.0
-            delta_lra = 0.0
-            delta_onset = 0.0
-        
-        rows.append({
-            'trace_id': row['trace_id'],
-            'seed': row['seed'],
-            'pattern_label': row['pattern_label_constrained'],
-            'baseline_integrated_lufs': row['integrated_lufs_baseline'],
-            'constrained_integrated_lufs': row['integrated_lufs_constrained'],
-            'delta_integrated_lufs': delta_lufs,
-            'baseline_lra_lu': row['lra_lu_baseline'],
-            'constrained_lra_lu': row['lra_lu_constrained'],
-            'delta_lra_lu': delta_lra,
-            'baseline_onset_density_eps': row['onset_density_eps_baseline'],
-            'constrained_onset_density_eps': row['onset_density_eps_constrained'],
-            'delta_onset_density_eps': delta_onset,
-            'tempo_clamped': row['tempo_clamped_constrained'],
-            'gain_clamped': row['gain_clamped_constrained'],
-            'accent_clamped': row['accent_clamped_constrained'],
-            'tempo_delta': row['tempo_delta_constrained'],
-            'gain_delta': row['gain_delta_constrained'],
-            'accent_delta': row['accent_delta_constrained'],
-        })
-    paired = pd.DataFrame(rows)
-    paired.to_csv(output_path, index=False)
+PAIRED_METRICS = ['integrated_lufs', 'lra_lu', 'onset_density_eps']
+CLAMP_COLUMNS = ['tempo_clamped', 'gain_clamped', 'accent_clamped']
+
+
+def paired_summary_path(condition, fmt='csv'):
+    """与 compose_hexad_kde.get_paired_csv_path 保持一致的命名"""
+    suffix = condition.replace('constrained_', '')
+    if suffix == 'default':
+        return output_path(f'summary/paired_summary.{fmt}')
+    return output_path(f'summary/paired_summary_{suffix}.{fmt}')
+
+
+def build_paired_summaries(df, conditions, threshold=1e-6, base=None):
+    """一次性为所有 constrained condition 与 baseline 配对（按 trace_id, seed），返回长表
+
+    delta 列向量化计算：未发生任何 clamp 的 run 记为 0（消除生成器随机噪声），
+    |delta| < threshold 的浮点误差也归零。base 为以 (trace_id, seed) 为索引的
+    baseline 指标表，缺省时从 df 中的 baseline 行构建。
+    """
+    if base is None:
+        base = df.loc[df['condition'] == 'baseline', ['trace_id', 'seed'] + PAIRED_METRICS]
+        base = base.set_index(['trace_id', 'seed'])
+    constrained = df[df['condition'].isin(conditions)]
+    merged = constrained.join(base, on=['trace_id', 'seed'], how='inner', rsuffix='_baseline')
+
+    any_clamped = (merged[CLAMP_COLUMNS] == 1).any(axis=1)
+    paired = pd.DataFrame({
+        'condition': merged['condition'],
+        'trace_id': merged['trace_id'],
+        'seed': merged['seed'],
+        'pattern_label': merged['pattern_label'],
+    })
+    for metric in PAIRED_METRICS:
+        delta = merged[metric] - merged[f'{metric}_baseline']
+        paired[f'baseline_{metric}'] = merged[f'{metric}_baseline']
+        paired[f'constrained_{metric}'] = merged[metric]
+        paired[f'delta_{metric}'] = delta.mask(~any_clamped | (delta.abs() < threshold), 0.0)
+    for col in CLAMP_COLUMNS + ['tempo_delta', 'gain_delta', 'accent_delta']:
+        paired[col] = merged[col]
+    return paired.reset_index(drop=True)
+
+
+PAIRED_INPUT_COLUMNS = (['trace_id', 'seed', 'pattern_label'] + PAIRED_METRICS + CLAMP_COLUMNS
+                        + ['tempo_delta', 'gain_delta', 'accent_delta'])
+MEMO_VERSION = 1
+
+
+def _condition_keys(df, conditions, kind, columns, **params):
+    """每个 condition 的缓存键：只取决于该 condition 行的内容，与 condition 名无关"""
+    keys = {}
+    for condition in conditions:
+        rows = df.loc[df['condition'] == condition, columns].reset_index(drop=True)
+        keys[condition] = content_hash({'kind': kind, 'version': MEMO_VERSION,
+                                        'rows': frame_hash(rows), **params})
+    return keys
+
+
+def build_paired_summaries_cached(df, conditions, cache, threshold=1e-6):
+    """build_paired_summaries 的缓存版本：逐 condition 查缓存，只为未命中的 condition 计算
+
+    配置相同、输入行相同的 condition（例如不同 sweep 中重名的 envelope）直接复用结果。
+    """
+    if cache is None:
+        return build_paired_summaries(df, conditions, threshold)
+    base = df.loc[df['condition'] == 'baseline', ['trace_id', 'seed'] + PAIRED_METRICS]
+    keys = _condition_keys(df, conditions, 'paired', PAIRED_INPUT_COLUMNS,
+                           base=frame_hash(base.reset_index(drop=True)), threshold=threshold)
+    parts = {c: cache.get(keys[c]) for c in conditions}
+    missing = [c for c in conditions if parts[c] is MISSING]
+    if missing:
+        built = build_paired_summaries(df, missing, threshold)
+        for condition in missing:
+            part = built[built['condition'] == condition].drop(columns='condition').reset_index(drop=True)
+            cache.put(keys[condition], part)
+            parts[condition] = part
+    # 与 build_paired_summaries 相同的行顺序（按 df 中 condition 出现的顺序）
+    order = [c for c in pd.unique(df['condition']) if c in parts]
+    frames = [parts[c].assign(condition=c) for c in order]
+    if not frames:
+        return build_paired_summaries(df, [], threshold)
+    paired = pd.concat(frames, ignore_index=True)
+    return paired[['condition'] + [c for c in paired.columns if c != 'condition']]
+
+
+def write_paired_summaries(paired, conditions, fmt='csv'):
+    """写出长表 summary/paired_summary_all 以及每个 condition 的 paired_summary 文件"""
+    write_table(paired, output_path('summary/paired_summary_all.csv'), fmt, partition_cols=['condition'])
+    paired_map = {}
+    for condition in conditions:
+        subset = paired[paired['condition'] == condition].drop(columns='condition').reset_index(drop=True)
+        write_table(subset, paired_summary_path(condition), fmt)
+        paired_map[condition] = subset
+    return paired_map
+
+
+def build_paired_summary_for_condition(df, condition, output_path, fmt='csv'):
+    paired = build_paired_summaries(df, [condition]).drop(columns='condition')
+    write_table(paired, output_path, fmt)
     return paired
 
 
-def summarize_l2_enforcement(df, envelope_map):
-    os.makedirs('reports', exist_ok=True)
-    for condition, envelope in envelope_map.items():
-        if condition == 'baseline':
-            continue
-        subset = df[df['condition'] == condition]
-        if subset.empty:
-            continue
-
-        def pct(col):
-            return (subset[col].fillna(0).sum() / len(subset)) if len(subset) else 0
-
-        def shift_stats(col):
-            vals = subset[col].abs().dropna()
-            if vals.empty:
-                return {'mean': 0, 'p95': 0, 'max': 0}
-            return {
-                'mean': vals.mean(),
-                'p95': vals.quantile(0.95),
-                'max': vals.max(),
-            }
-
-        summary = {
-            'condition': condition,
-            'config_hash': envelope.get('configHash'),
-            'tempo_requested_oob_rate': pct('tempo_req_oob'),
-            'tempo_clamp_rate': pct('tempo_clamped'),
-            'tempo_shift_mean': shift_stats('tempo_delta')['mean'],
-            'tempo_shift_p95': shift_stats('tempo_delta')['p95'],
-            'tempo_shift_max': shift_stats('tempo_delta')['max'],
-            'tempo_effective_oob_rate': pct('tempo_eff_oob'),
-            'gain_requested_oob_rate': pct('gain_req_oob'),
-            'gain_clamp_rate': pct('gain_clamped'),
-            'gain_shift_mean': shift_stats('gain_delta')['mean'],
-            'gain_shift_p95': shift_stats('gain_delta')['p95'],
-            'gain_shift_max': shift_stats('gain_delta')['max'],
-            'gain_effective_oob_rate': pct('gain_eff_oob'),
-            'accent_requested_oob_rate': pct('accent_req_oob'),
-            'accent_clamp_rate': pct('accent_clamped'),
-            'accent_shift_mean': shift_stats('accent_delta')['mean'],
-            'accent_shift_p95': shift_stats('accent_delta')['p95'],
-            'accent_shift_max': shift_stats('accent_delta')['max'],
-            'accent_effective_oob_rate': pct('accent_eff_oob'),
-        }
-        suffix = condition.replace('constrained_', '')
-        out_path = f'reports/l2_enforcement_summary_{suffix}.csv'
-        with open(out_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=list(summary.keys()))
-            writer.writeheader()
-            writer.writerow(summary)
+L2_PARAMS = ['tempo', 'gain', 'accent']
+
+
+L2_INPUT_COLUMNS = ['pattern_label'] + [f'{p}_{s}' for p in L2_PARAMS
+                                         for s in ('req_oob', 'clamped', 'eff_oob', 'delta')]
+
+
+def summarize_l2_enforcement(df, envelope_map, by_pattern=False, cache=None):
+    """对所有 constrained condition 做一次 groupby 聚合，计算 clamp/OOB 比例和 shift 统计
+
+    写出整表 reports/l2_enforcement_summary.csv，并由其派生每个 condition 的单行文件；
+    by_pattern=True 时额外写出按 (condition, pattern_label) 分组的
+    reports/l2_enforcement_by_pattern.csv。给定 cache 时按 condition 的输入行内容缓存，
+    只聚合未命中的 condition。
+    """
+    os.makedirs(output_path('reports'), exist_ok=True)
+    conditions = [c for c in envelope_map if c != 'baseline']
+    subset = df[df['condition'].isin(conditions)]
+    if subset.empty:
+        return pd.DataFrame()
+    config_hashes = subset.groupby('condition', sort=False)['config_hash'].first().to_dict()
+
+    keys, cached = {}, {}
+    if cache is not None:
+        present = [c for c in conditions if c in set(subset['condition'])]
+        keys = _condition_keys(subset, present, 'l2', L2_INPUT_COLUMNS, by_pattern=by_pattern)
+        cached = {c: v for c in present if (v := cache.get(keys[c])) is not MISSING}
+        subset = subset[~subset['condition'].isin(list(cached))]
+
+    # 先把每个参数的标志列和 |delta| 整理到同一张表，groupby 只扫一遍
+    work = subset[['condition', 'pattern_label']].copy()
+    rate_cols, shift_cols = [], []
+    for param in L2_PARAMS:
+        for name, col in (('requested_oob_rate', f'{param}_req_oob'),
+                          ('clamp_rate', f'{param}_clamped'),
+                          ('effective_oob_rate', f'{param}_eff_oob')):
+            work[f'{param}_{name}'] = subset[col].fillna(0)
+            rate_cols.append(f'{param}_{name}')
+        work[f'{param}_shift'] = subset[f'{param}_delta'].abs()
+        shift_cols.append(f'{param}_shift')
+
+    def aggregate(keys):
+        grouped = work.groupby(keys, sort=False, observed=True)
+        rates = grouped[rate_cols].mean()
+        shifts = grouped[shift_cols]
+        stats = pd.concat({
+            'mean': shifts.mean(),
+            'p95': shifts.quantile(0.95),
+            'max': shifts.max(),
+        }, axis=1).fillna(0)
+        table = pd.DataFrame(index=rates.index)
+        for param in L2_PARAMS:
+            table[f'{param}_requested_oob_rate'] = rates[f'{param}_requested_oob_rate']
+            table[f'{param}_clamp_rate'] = rates[f'{param}_clamp_rate']
+            for stat in ('mean', 'p95', 'max'):
+                table[f'{param}_shift_{stat}'] = stats[(stat, f'{param}_shift')]
+            table[f'{param}_effective_oob_rate'] = rates[f'{param}_effective_oob_rate']
+        return table.reset_index()
+
+    def finish(table, group_keys):
+        table = table[group_keys + [c for c in table.columns if c not in group_keys]]
+        table.insert(len(group_keys), 'config_hash', table['condition'].map(config_hashes))
+        order = {c: i for i, c in enumerate(conditions)}
+        return table.sort_values('condition', key=lambda s: s.map(order), kind='stable').reset_index(drop=True)
+
+    key_sets = [['condition']] + ([['condition', 'pattern_label']] if by_pattern else [])
+    tables = [[] for _ in key_sets]
+    if not subset.empty:
+        computed = [aggregate(group_keys) for group_keys in key_sets]
+        for i, table in enumerate(computed):
+            tables[i].append(table)
+        for condition in keys:
+            if condition not in cached:
+                # 缓存值不含 condition 名，相同输入的其他 condition 可直接复用
+                cache.put(keys[condition], [t[t['condition'] == condition].drop(columns='condition')
+                                            for t in computed])
+    for condition, values in cached.items():
+        for i, value in enumerate(values):
+            tables[i].append(value.assign(condition=condition))
+    results = [finish(pd.concat(parts, ignore_index=True), group_keys)
+               for parts, group_keys in zip(tables, key_sets)]
+
+    summary = results[0]
+    summary.to_csv(output_path('reports/l2_enforcement_summary.csv'), index=False)
+    for _, row in summary.iterrows():
+        suffix = row['condition'].replace('constrained_', '')
+        row.to_frame().T.to_csv(output_path(f'reports/l2_enforcement_summary_{suffix}.csv'), index=False)
+
+    if by_pattern:
+        results[1].to_csv(output_path('reports/l2_enforcement_by_pattern.csv'), index=False)
+    return summary
 
 
 def build_tuning_sensitivity(paired_map, df):
-    os.makedirs('reports', exist_ok=True)
+    os.makedirs(output_path('reports'), exist_ok=True)
     rows = []
     for condition, paired_df in paired_map.items():
         if paired_df.empty:
@@ -261,26 +451,206 @@ def build_tuning_sensitivity(paired_map, df):
             'delta_integrated_lufs_max': paired_df['delta_integrated_lufs'].max(),
         })
     if rows:
-        pd.DataFrame(rows).to_csv('reports/tuning_sensitivity_table.csv', index=False)
+        pd.DataFrame(rows).to_csv(output_path('reports/tuning_sensitivity_table.csv'), index=False)
+
+
+def _append_csv(df, path, started):
+    """追加写 CSV；同一次运行中第一次写入时覆盖旧文件并写表头"""
+    first = path not in started
+    df.to_csv(path, mode='w' if first else 'a', header=first, index=False)
+    started.add(path)
+
+
+def summarize_runs_streaming(runs_dir, conditions_path, chunk_size=5000, workers=None,
+                             by_pattern=False, runs=None):
+    """流式汇总：按 chunk_size 分块处理 run 并增量写出 CSV
+
+    每个 condition 的比例用计数器累计，shift / delta 分位数用可合并的 QuantileSketch，
+    因此内存与 run 总数无关；唯一随规模增长的是用于配对的 baseline 指标索引
+    （每个 baseline run 三个浮点数）。输出文件与非流式模式相同，p95 为近似值。
+    """
+    conditions = load_conditions(conditions_path)
+    envelope_map = load_envelope_map(conditions)
+    config_hashes = load_config_hashes(conditions, envelope_map)
+    paired_conditions = [name for name in conditions if name != 'baseline']
+    l2_conditions = [c for c in envelope_map if c != 'baseline']
+    key_sets = [('condition',)] + ([('condition', 'pattern_label')] if by_pattern else [])
+    l2_acc = {keys: {} for keys in key_sets}
+    tuning_acc = {}
+    baseline_parts, base = [], None
+    started = set()
+    os.makedirs(output_path('summary'), exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        if runs is None:
+            runs = iter_runs(runs_dir)
+        else:
+            runs = iter(sorted(runs, key=lambda run: run[0] != 'baseline'))
+        while True:
+            chunk = list(itertools.islice(runs, chunk_size))
+            if not chunk:
+                break
+            rows = [row for row in pool.map(lambda run: load_run(run, envelope_map, config_hashes), chunk) if row]
+            if not rows:
+                continue
+            frame = pd.DataFrame(rows)
+            # baseline 的 oob 为空，整表模式下这些列是浮点；分块时保持一致
+            oob_cols = [c for c in frame.columns if c.endswith('_oob')]
+            frame[oob_cols] = frame[oob_cols].astype(float)
+            _append_csv(frame, output_path('summary/summary_runs.csv'), started)
+
+            baseline_rows = frame[frame['condition'] == 'baseline']
+            if not baseline_rows.empty:
+                baseline_parts.append(baseline_rows[['trace_id', 'seed'] + PAIRED_METRICS])
+
+            constrained = frame[frame['condition'].isin(paired_conditions)]
+            if not constrained.empty:
+                if base is None:
+                    base = (pd.concat(baseline_parts) if baseline_parts
+                            else pd.DataFrame(columns=['trace_id', 'seed'] + PAIRED_METRICS))
+                    base = base.set_index(['trace_id', 'seed'])
+                    baseline_parts = []
+                for condition, group in constrained.groupby('condition', sort=False):
+                    acc = tuning_acc.setdefault(condition, {
+                        'n': 0, 'clamp_any': 0, 'n_paired': 0,
+                        'delta_lra_lu': QuantileSketch(),
+                        'delta_integrated_lufs': QuantileSketch(),
+                    })
+                    acc['n'] += len(group)
+                    acc['clamp_any'] += int((group[CLAMP_COLUMNS] == 1).any(axis=1).sum())
+
+                paired = build_paired_summaries(constrained, paired_conditions, base=base)
+                _append_csv(paired, output_path('summary/paired_summary_all.csv'), started)
+                for condition, group in paired.groupby('condition', sort=False):
+                    _append_csv(group.drop(columns='condition'), paired_summary_path(condition), started)
+                    acc = tuning_acc[condition]
+                    acc['n_paired'] += len(group)
+                    for col in ('delta_lra_lu', 'delta_integrated_lufs'):
+                        acc[col].update(group[col].values)
+
+            l2_frame = frame[frame['condition'].isin(l2_conditions)]
+            for keys in key_sets:
+                for key, group in l2_frame.groupby(list(keys), sort=False):
+                    counter, sketches = l2_acc[keys].setdefault(
+                        key, (RateCounter(), {p: QuantileSketch() for p in L2_PARAMS}))
+                    counter.n += len(group)
+                    for param in L2_PARAMS:
+                        counter.update_flags(group, [f'{param}_req_oob', f'{param}_clamped',
+                                                     f'{param}_eff_oob'])
+                        shift = group[f'{param}_delta'].abs().values
+                        counter.update_values(param, shift)
+                        sketches[param].update(shift)
+
+    os.makedirs(output_path('reports'), exist_ok=True)
+    order = {c: i for i, c in enumerate(l2_conditions)}
+    for keys in key_sets:
+        table_rows = []
+        items = sorted(l2_acc[keys].items(), key=lambda kv: (order[kv[0][0]],) + tuple(map(str, kv[0][1:])))
+        for key, (counter, sketches) in items:
+            row = dict(zip(keys, key))
+            row['config_hash'] = config_hashes.get(key[0])
+            for param in L2_PARAMS:
+                p95 = sketches[param].quantile(0.95)
+                row[f'{param}_requested_oob_rate'] = counter.rate(f'{param}_req_oob')
+                row[f'{param}_clamp_rate'] = counter.rate(f'{param}_clamped')
+                row[f'{param}_shift_mean'] = counter.mean(param)
+                row[f'{param}_shift_p95'] = 0 if math.isnan(p95) else p95
+                row[f'{param}_shift_max'] = counter.max(param)
+                row[f'{param}_effective_oob_rate'] = counter.rate(f'{param}_eff_oob')
+            table_rows.append(row)
+        table = pd.DataFrame(table_rows)
+        if keys == ('condition',):
+            table.to_csv(output_path('reports/l2_enforcement_summary.csv'), index=False)
+            for _, row in table.iterrows():
+                suffix = row['condition'].replace('constrained_', '')
+                row.to_frame().T.to_csv(output_path(f'reports/l2_enforcement_summary_{suffix}.csv'), index=False)
+        else:
+            table.to_csv(output_path('reports/l2_enforcement_by_pattern.csv'), index=False)
+
+    tuning_rows = []
+    for condition in paired_conditions:
+        acc = tuning_acc.get(condition)
+        if not acc or not acc['n_paired']:
+            continue
+        tuning_rows.append({
+            'condition': condition,
+            'clamp_rate_any': acc['clamp_any'] / acc['n'] if acc['n'] else 0,
+            'delta_lra_lu_p95': acc['delta_lra_lu'].quantile(0.95),
+            'delta_lra_lu_max': acc['delta_lra_lu'].max,
+            'delta_integrated_lufs_p95': acc['delta_integrated_lufs'].quantile(0.95),
+            'delta_integrated_lufs_max': acc['delta_integrated_lufs'].max,
+        })
+    if tuning_rows:
+        pd.DataFrame(tuning_rows).to_csv(output_path('reports/tuning_sensitivity_table.csv'), index=False)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--runs', default='runs')
     parser.add_argument('--conditions', default='conditions.yaml')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Threads used to load run directories (default: Python executor default)')
+    parser.add_argument('--manifest', default='summary/run_manifest.json',
+                        help='Run manifest used to skip unchanged runs (empty string disables it)')
+    parser.add_argument('--full', action='store_true',
+                        help='Ignore the manifest and reparse every run')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'both'], default='csv',
+                        help='Summary table format (parquet needs pyarrow)')
+    parser.add_argument('--by-pattern', action='store_true',
+                        help='Also write L2 enforcement statistics per (condition, pattern_label)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Process runs in fixed-size chunks with bounded memory (CSV output, '
+                             'sketch-based p95, no manifest)')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--index', default=None,
+                        help='Select runs from a SQLite run index (run_index.py) instead of walking --runs')
+    parser.add_argument('--select-condition', nargs='*', default=None,
+                        help='With --index: only these conditions (baseline is always included)')
+    parser.add_argument('--trace', nargs='*', default=None, help='With --index: only these trace ids')
+    parser.add_argument('--pattern', nargs='*', default=None, help='With --index: only these pattern labels')
+    parser.add_argument('--out-dir', default=None,
+                        help='Root for summary/ and reports/ outputs; required for a subset selected with '
+                             '--select-condition / --trace / --pattern so the full-run outputs are not overwritten')
+    parser.add_argument('--cache', default='.cache/memo',
+                        help='Memo cache for paired / L2 results keyed by input hashes (empty string disables it)')
+    parser.add_argument('--cache-max-mb', type=float, default=1024,
+                        help='Cache size cap; least recently used entries are evicted beyond it')
     args = parser.parse_args()
 
-    df, envelope_map = summarize_runs(args.runs, args.conditions)
-    paired_default = build_paired_summary_for_condition(df, 'constrained_default', 'summary/paired_summary.csv')
-    paired_tight = build_paired_summary_for_condition(df, 'constrained_tight', 'summary/paired_summary_tight.csv')
-    paired_relaxed = build_paired_summary_for_condition(df, 'constrained_relaxed', 'summary/paired_summary_relaxed.csv')
-    summarize_l2_enforcement(df, envelope_map)
-    paired_map = {
-        'constrained_default': paired_default,
-        'constrained_tight': paired_tight,
-        'constrained_relaxed': paired_relaxed,
-    }
+    runs = None
+    if args.index:
+        conditions = args.select_condition and sorted(set(args.select_condition) | {'baseline'})
+        runs = run_index.query_runs(args.index, conditions=conditions, trace_ids=args.trace,
+                                    pattern_labels=args.pattern,
+                                    require=['l1metrics.json', 'reward_spec.json'])
+    elif args.select_condition or args.trace or args.pattern:
+        parser.error('--select-condition / --trace / --pattern require --index')
+    if (args.select_condition or args.trace or args.pattern) and not args.out_dir:
+        parser.error('a subset (--select-condition / --trace / --pattern) needs --out-dir')
+    if args.out_dir:
+        global OUTPUT_ROOT
+        OUTPUT_ROOT = args.out_dir
+
+    if args.stream:
+        if args.format != 'csv':
+            parser.error('--stream only supports --format csv')
+        summarize_runs_streaming(args.runs, args.conditions, chunk_size=args.chunk_size,
+                                 workers=args.workers, by_pattern=args.by_pattern, runs=runs)
+        return
+
+    df, envelope_map = summarize_runs(args.runs, args.conditions, workers=args.workers,
+                                      manifest_path=args.manifest or None, rebuild=args.full,
+                                      fmt=args.format, runs=runs)
+    cache = MemoCache(args.cache, int(args.cache_max_mb * 1024 * 1024)) if args.cache else None
+    # conditions.yaml 中除 baseline 外的所有 condition 都与 baseline 配对
+    paired_conditions = [name for name in load_conditions(args.conditions) if name != 'baseline']
+    paired = build_paired_summaries_cached(df, paired_conditions, cache)
+    paired_map = write_paired_summaries(paired, paired_conditions, args.format)
+    summarize_l2_enforcement(df, envelope_map, by_pattern=args.by_pattern, cache=cache)
     build_tuning_sensitivity(paired_map, df)
+    if cache is not None:
+        print(f'Memo cache: {cache.hits} hits, {cache.misses} misses')
+        cache.close()
 
 
 if __name__ == '__main__':
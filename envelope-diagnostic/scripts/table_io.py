@@ -0,0 +1,79 @@
+"""
+Summary Table I/O (汇总表读写)
+
+Typed schema for summary_runs / paired_summary tables and CSV or Parquet output.
+Parquet output is zstd-compressed, uses categoricals for labels, int8 for the
+*_oob / *_clamped flags and float32 for display-only columns, and can be
+partitioned by condition so readers load only the partitions they need.
+Parquet needs pyarrow.
+"""
+
+import os
+import shutil
+
+import pandas as pd
+
+CATEGORY_COLUMNS = ('condition', 'pattern_label', 'gain_unit')
+# 仅用于展示的列转 float32；参与 clamp 判断和 delta 计算的列保持 float64
+FLOAT32_COLUMNS = ('peak_lufs', 'accent_pct_req', 'accent_pct_eff')
+INT32_COLUMNS = ('seed',)
+
+
+def is_flag_column(col):
+    return col.endswith('_oob') or col.endswith('_clamped')
+
+
+def apply_schema(df):
+    """按列名规则转换为紧凑类型；标志列用可空 Int8（baseline 的 oob 为空）"""
+    df = df.copy()
+    for col in df.columns:
+        if col in CATEGORY_COLUMNS:
+            df[col] = df[col].astype('category')
+        elif is_flag_column(col):
+            df[col] = df[col].astype('Int8')
+        elif col in FLOAT32_COLUMNS:
+            df[col] = df[col].astype('float32')
+        elif col in INT32_COLUMNS:
+            df[col] = df[col].astype('int32')
+    return df
+
+
+def parquet_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+
+def write_table(df, csv_path, fmt='csv', partition_cols=None):
+    """写出表格；fmt 为 'csv'、'parquet' 或 'both'，Parquet 路径由 csv_path 换扩展名得到"""
+    if fmt not in ('csv', 'parquet', 'both'):
+        raise ValueError(f'Unknown output format: {fmt}')
+    os.makedirs(os.path.dirname(csv_path) or '.', exist_ok=True)
+    if fmt in ('csv', 'both'):
+        df.to_csv(csv_path, index=False)
+    if fmt in ('parquet', 'both'):
+        out_path = parquet_path(csv_path)
+        # 分区数据集是目录，重写前需清空，否则旧分区文件会残留
+        if os.path.isdir(out_path):
+            shutil.rmtree(out_path)
+        typed = apply_schema(df)
+        if partition_cols:
+            # 分区列需要为普通字符串，读取时由 pyarrow 重新还原为 category
+            for col in partition_cols:
+                typed[col] = typed[col].astype(str)
+        typed.to_parquet(out_path, index=False, compression='zstd', partition_cols=partition_cols)
+
+
+def read_table(path, columns=None, conditions=None):
+    """读取 CSV 或 Parquet（按扩展名判断），只加载指定列和 condition"""
+    if path.endswith('.parquet'):
+        filters = [('condition', 'in', list(conditions))] if conditions else None
+        if conditions and columns is not None and 'condition' not in columns:
+            columns = list(columns) + ['condition']
+        return pd.read_parquet(path, columns=columns, filters=filters)
+
+    usecols = None
+    if columns is not None:
+        usecols = list(columns) + (['condition'] if conditions and 'condition' not in columns else [])
+    df = pd.read_csv(path, usecols=usecols)
+    if conditions:
+        df = df[df['condition'].isin(conditions)]
+    return df
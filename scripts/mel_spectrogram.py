@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Log-mel spectrogram and loudness contour engine (Python port of
+src/frontend/js/spectrogram-comparison.js)
+
+Same definitions as the browser export: Hann window, power spectrum, triangular
+mel filterbank between 20 Hz and 8 kHz, 10*log10(max(e, 1e-12)), and the 400 ms /
+100 ms RMS loudness contour with 0.3 exponential smoothing. Unlike the browser,
+frames are not decimated to 200, so hopSize is the real hop.
+
+- WAV files are memory-mapped and processed in chunks of frames, so memory stays
+  bounded for hour-long audio
+- filterbanks and windows are cached per (sr, n_fft, n_mels, fmin, fmax)
+- compare: baseline + constrained WAV -> spectrum_full_data.json for
+  plot_spectrogram_matplotlib.py
+- batch: many WAVs (or every audio.wav under a runs directory) -> <run>/mel.npz,
+  spread over a process pool
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft as sp_fft
+from scipy.io import wavfile
+from scipy.signal import lfilter
+
+DEFAULTS = {"n_fft": 2048, "hop": 1024, "n_mels": 64, "fmin": 20.0, "fmax": 8000.0}
+ENVELOPE_BOUNDS = {"loudnessMax": -14, "loudnessMin": -30, "lraMax": 7}
+CHUNK_FRAMES = 2048
+NPZ_VERSION = 1
+
+def hz_to_mel(hz):
+    return 2595.0 * np.log10(1.0 + np.asarray(hz, dtype=np.float64) / 700.0)
+
+def mel_to_hz(mel):
+    return 700.0 * (10.0 ** (np.asarray(mel, dtype=np.float64) / 2595.0) - 1.0)
+
+@lru_cache(maxsize=32)
+def mel_filterbank(sr, n_fft=2048, n_mels=64, fmin=20.0, fmax=8000.0):
+    """Triangular mel filterbank (n_mels x n_fft//2+1), built like createMelFilterbank in the JS"""
+    n_bins = n_fft // 2 + 1
+    mel_points = np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_mels + 2)
+    bins = np.clip(np.floor(mel_to_hz(mel_points) / sr * n_fft).astype(int), 0, n_bins - 1)
+    left, center, right = bins[:-2, None], bins[1:-1, None], bins[2:, None]
+    k = np.arange(n_bins)[None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rising = np.where(center == left, 0.0, (k - left) / (center - left))
+        falling = np.where(right == center, 0.0, (right - k) / (right - center))
+    # The falling edge is written last in the JS, so it wins at the center bin
+    fb = np.where((k >= center) & (k <= right), falling, np.where((k >= left) & (k <= center), rising, 0.0))
+    fb = fb.astype(np.float32)
+    fb.setflags(write=False)
+    return fb
+
+@lru_cache(maxsize=8)
+def hann_window(n):
+    window = np.hanning(n).astype(np.float32)
+    window.setflags(write=False)
+    return window
+
+def read_audio(path):
+    """Memory-map a WAV file; returns (first channel, sample rate, scale to [-1, 1])"""
+    try:
+        sr, data = wavfile.read(path, mmap=True)
+    except ValueError:
+        # e.g. 24-bit PCM cannot be memory-mapped
+        sr, data = wavfile.read(path)
+    if data.ndim > 1:
+        data = data[:, 0]
+    if data.dtype == np.uint8:
+        return data, sr, (1.0 / 128.0, -1.0)
+    if np.issubdtype(data.dtype, np.integer):
+        return data, sr, (1.0 / float(-np.iinfo(data.dtype).min), 0.0)
+    return data, sr, (1.0, 0.0)
+
+def _to_float(samples, scale):
+    factor, offset = scale
+    out = np.asarray(samples, dtype=np.float32)
+    if factor != 1.0 or offset != 0.0:
+        out = out * np.float32(factor) + np.float32(offset)
+    return out
+
+def frame_count(n_samples, n_fft, hop):
+    return (n_samples - n_fft) // hop + 1 if n_samples >= n_fft else 0
+
+def stft_power_chunks(samples, n_fft=2048, hop=1024, scale=(1.0, 0.0), chunk_frames=CHUNK_FRAMES):
+    """Yield (first frame index, power spectrum [frames, n_fft//2+1]) for chunk_frames frames at a time"""
+    n_frames = frame_count(len(samples), n_fft, hop)
+    window = hann_window(n_fft)
+    for f0 in range(0, n_frames, chunk_frames):
+        f1 = min(n_frames, f0 + chunk_frames)
+        seg = _to_float(samples[f0 * hop:(f1 - 1) * hop + n_fft], scale)
+        frames = sliding_window_view(seg, n_fft)[::hop]
+        spec = sp_fft.rfft(frames * window, axis=1)
+        yield f0, spec.real ** 2 + spec.imag ** 2
+
+def log_mel_spectrogram(samples, sr, n_fft=2048, hop=1024, n_mels=64, fmin=20.0, fmax=8000.0,
+                        scale=(1.0, 0.0), chunk_frames=CHUNK_FRAMES):
+    """Log-mel spectrogram in dB, shape (frames, n_mels), float32; computed chunk_frames at a time"""
+    fb_t = np.ascontiguousarray(mel_filterbank(sr, n_fft, n_mels, float(fmin), float(fmax)).T)
+    out = np.empty((frame_count(len(samples), n_fft, hop), n_mels), dtype=np.float32)
+    for f0, power in stft_power_chunks(samples, n_fft, hop, scale, chunk_frames):
+        out[f0:f0 + len(power)] = 10.0 * np.log10(np.maximum(power @ fb_t, 1e-12))
+    return out
+
+def loudness_contour(samples, sr, scale=(1.0, 0.0), chunk_windows=4096):
+    """400 ms / 100 ms RMS loudness (LUFS approximation) with the JS gating and smoothing"""
+    win = int(sr * 0.4)
+    hop = int(sr * 0.1)
+    n = len(samples)
+    n_windows = (n - win) // hop + 1 if n >= win else 0
+    raw = np.empty(n_windows, dtype=np.float64)
+    for w0 in range(0, n_windows, chunk_windows):
+        w1 = min(n_windows, w0 + chunk_windows)
+        seg = _to_float(samples[w0 * hop:(w1 - 1) * hop + win], scale).astype(np.float64)
+        csum = np.concatenate(([0.0], np.cumsum(seg * seg)))
+        starts = np.arange(w1 - w0) * hop
+        rms = np.sqrt(np.maximum(csum[starts + win] - csum[starts], 0.0) / win)
+        raw[w0:w1] = 20.0 * np.log10(np.maximum(rms, 1e-10)) - 0.691
+    times = np.arange(n_windows) * hop / sr
+    integrated = float(raw.mean()) if n_windows else -70.0
+    gate = integrated - 8.0
+    if n_windows:
+        smoothed = lfilter([0.7], [1.0, -0.3], raw, zi=[0.3 * raw[0]])[0]
+    else:
+        smoothed = raw
+    gated_smoothed = smoothed[smoothed >= gate]
+    gated = gated_smoothed if len(gated_smoothed) >= 4 else raw[raw >= gate]
+    return {"values": smoothed, "times": times, "integrated": integrated, "gated": gated}
+
+def compute_lra(contour):
+    """p95 - p10 of the gated contour, as computeLRA in the JS"""
+    gated = contour["gated"]
+    values = np.sort(gated if len(gated) >= 4 else contour["values"][contour["values"] > -70])
+    if len(values) < 2:
+        return 0.0
+    return float(values[int(len(values) * 0.95)] - values[int(len(values) * 0.1)])
+
+def analyze_file(path, n_fft=2048, hop=1024, n_mels=64, fmin=20.0, fmax=8000.0):
+    """Spectrogram, loudness contour and LRA of one WAV file"""
+    samples, sr, scale = read_audio(path)
+    mel = log_mel_spectrogram(samples, sr, n_fft, hop, n_mels, fmin, fmax, scale)
+    contour = loudness_contour(samples, sr, scale)
+    return {
+        "mel": mel, "sample_rate": int(sr), "n_fft": n_fft, "hop": hop, "n_mels": n_mels,
+        "fmin": fmin, "fmax": fmax, "loudness": contour, "lra": compute_lra(contour),
+        "duration_sec": len(samples) / sr,
+    }
+
+def side_document(result):
+    """One side of spectrum_full_data.json in the browser export layout"""
+    return {
+        "spectrogram": {
+            "data": result["mel"].tolist(),
+            "numFrames": int(result["mel"].shape[0]),
+            "numMelBins": result["n_mels"],
+            "hopSize": result["hop"],
+            "sampleRate": result["sample_rate"],
+        },
+        "loudness": {
+            "values": result["loudness"]["values"].tolist(),
+            "times": result["loudness"]["times"].tolist(),
+            "integrated": result["loudness"]["integrated"],
+        },
+        "lra": result["lra"],
+    }
+
+def save_npz(path, result):
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, version=NPZ_VERSION, mel=result["mel"], loudness_values=result["loudness"]["values"],
+             loudness_times=result["loudness"]["times"], loudness_integrated=result["loudness"]["integrated"],
+             lra=result["lra"], sample_rate=result["sample_rate"], n_fft=result["n_fft"], hop=result["hop"],
+             n_mels=result["n_mels"], fmin=result["fmin"], fmax=result["fmax"],
+             duration_sec=result["duration_sec"])
+    os.replace(tmp_path, path)
+
+def load_npz(path):
+    """Read a mel.npz written by batch mode back into the analyze_file layout"""
+    with np.load(path) as z:
+        return {
+            "mel": z["mel"], "sample_rate": int(z["sample_rate"]), "n_fft": int(z["n_fft"]), "hop": int(z["hop"]),
+            "n_mels": int(z["n_mels"]), "fmin": float(z["fmin"]), "fmax": float(z["fmax"]),
+            "loudness": {"values": z["loudness_values"], "times": z["loudness_times"],
+                         "integrated": float(z["loudness_integrated"])},
+            "lra": float(z["lra"]), "duration_sec": float(z["duration_sec"]),
+        }
+
+def npz_is_current(npz_path, wav_path, params):
+    """True if npz_path exists, is newer than the WAV and was computed with the same parameters"""
+    if not os.path.exists(npz_path) or os.path.getmtime(npz_path) < os.path.getmtime(wav_path):
+        return False
+    try:
+        with np.load(npz_path) as z:
+            return int(z["version"]) == NPZ_VERSION and all(float(z[k]) == float(v) for k, v in params.items())
+    except (OSError, KeyError, ValueError):
+        return False
+
+def find_wavs(runs_dir, audio_name="audio.wav"):
+    paths = []
+    for root, _, files in os.walk(runs_dir):
+        if audio_name in files:
+            paths.append(os.path.join(root, audio_name))
+    return sorted(paths)
+
+def _batch_task(task):
+    wav_path, out_name, overwrite, params = task
+    out_path = os.path.join(os.path.dirname(wav_path), out_name)
+    if not overwrite and npz_is_current(out_path, wav_path, params):
+        return wav_path, out_path, "skipped"
+    try:
+        save_npz(out_path, analyze_file(wav_path, **params))
+    except (ValueError, OSError) as e:
+        return wav_path, out_path, f"error: {e}"
+    return wav_path, out_path, "computed"
+
+def batch(wav_paths, out_name="mel.npz", workers=None, overwrite=False, **params):
+    """Compute <dir of wav>/<out_name> for every WAV in a process pool; returns [(wav, npz, status)]"""
+    params = {**DEFAULTS, **params}
+    tasks = [(path, out_name, overwrite, params) for path in wav_paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_batch_task, tasks, chunksize=4))
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute log-mel spectrograms and loudness contours from WAV files")
+    parser.add_argument("--n-fft", type=int, default=DEFAULTS["n_fft"])
+    parser.add_argument("--hop", type=int, default=DEFAULTS["hop"])
+    parser.add_argument("--n-mels", type=int, default=DEFAULTS["n_mels"])
+    parser.add_argument("--fmin", type=float, default=DEFAULTS["fmin"])
+    parser.add_argument("--fmax", type=float, default=DEFAULTS["fmax"])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    compare = sub.add_parser("compare", help="Write spectrum_full_data.json for plot_spectrogram_matplotlib.py")
+    compare.add_argument("baseline_wav")
+    compare.add_argument("constrained_wav")
+    compare.add_argument("--out", default="spectrum_full_data.json")
+
+    bat = sub.add_parser("batch", help="Write <run>/mel.npz for many WAV files")
+    bat.add_argument("wavs", nargs="*", help="WAV files (in addition to --runs)")
+    bat.add_argument("--runs", default=None, help="Process every --audio-name file under this directory")
+    bat.add_argument("--audio-name", default="audio.wav")
+    bat.add_argument("--out-name", default="mel.npz")
+    bat.add_argument("--workers", type=int, default=None)
+    bat.add_argument("--overwrite", action="store_true", help="Recompute even if mel.npz is up to date")
+    args = parser.parse_args()
+
+    params = {"n_fft": args.n_fft, "hop": args.hop, "n_mels": args.n_mels, "fmin": args.fmin, "fmax": args.fmax}
+    if args.command == "compare":
+        doc = {
+            "unconstrained": side_document(analyze_file(args.baseline_wav, **params)),
+            "constrained": side_document(analyze_file(args.constrained_wav, **params)),
+            "envelopeBounds": ENVELOPE_BOUNDS,
+        }
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(doc, f)
+        print(f"Saved: {args.out}")
+        return
+
+    wavs = list(args.wavs) + (find_wavs(args.runs, args.audio_name) if args.runs else [])
+    if not wavs:
+        parser.error("no WAV files given (pass paths or --runs)")
+    counts = {}
+    for wav_path, _, status in batch(wavs, args.out_name, args.workers, args.overwrite, **params):
+        if status.startswith("error"):
+            print(f"WARNING: {wav_path}: {status}")
+            status = "error"
+        counts[status] = counts.get(status, 0) + 1
+    print(", ".join(f"{k}: {v}" for k, v in sorted(counts.items())))
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,255 @@
+import os
+import glob
 import json
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import matplotlib.pyplot as plt
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from matplotlib.ticker import MultipleLocator
 
+LANES = ["C", "D", "E", "G", "A"]
+COLORS = {'C': '#F87171', 'D': '#FB923C', 'E': '#FBBF24', 'G': '#60A5FA', 'A': '#A78BFA'}
+DEFAULT_COLOR = '#999999'
+FORMATS = ("pdf", "eps", "svg")
+
+# 每个进程复用一张 Agg 画布：(fig, ax, scatter)
+_TRAIL_CANVAS = None
+
 def load_json(path):
     with open(path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
+def apply_style():
+    matplotlib.rcParams['font.family'] = 'sans-serif'
+    matplotlib.rcParams['font.sans-serif'] = ['Helvetica', 'Arial', 'DejaVu Sans']
+    matplotlib.rcParams['axes.labelweight'] = 'medium'
+
+def extract_points(points):
+    """points 列表 -> (times, lane 名数组)；每个字段一次遍历，lane 映射在去重后的名字上做"""
+    times = np.fromiter((p.get('timeSec', 0) for p in points), dtype=float, count=len(points))
+    names = np.array([p.get('lane', 'C') for p in points], dtype=str)
+    return times, names
+
+def lane_lookup(names, table, default):
+    """把 lane 名映射为 table 中的值（np.unique 后按逆索引展开），不在 table 中的取 default"""
+    uniq, inverse = np.unique(names, return_inverse=True)
+    # 末尾追加 default 以确定 dtype，空输入时也适用
+    values = np.array([table.get(u, default) for u in uniq] + [default])
+    return values[inverse]
+
+def _trail_canvas():
+    global _TRAIL_CANVAS
+    if _TRAIL_CANVAS is None:
+        fig = Figure(figsize=(10, 3))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        fig.subplots_adjust(left=0.12, right=0.98, top=0.92, bottom=0.20)
+        ax.set_ylabel('Notes', fontsize=13, labelpad=10)
+        ax.set_xlabel('Time (s)', fontsize=13)
+        ax.xaxis.set_minor_locator(MultipleLocator(0.5))
+        ax.grid(which='major', axis='y', linestyle='--', color='#d6d6d6', alpha=0.7)
+        ax.grid(which='minor', axis='x', linestyle=':', color='#e2e2e2', alpha=0.6)
+        for spine in ['top', 'right', 'left', 'bottom']:
+            ax.spines[spine].set_visible(True)
+            ax.spines[spine].set_linewidth(1.2)
+        scatter = ax.scatter([], [], s=64, alpha=0.9, edgecolors='black', linewidths=1.2, zorder=3)
+        _TRAIL_CANVAS = (fig, ax, scatter)
+    return _TRAIL_CANVAS
+
+def render_trail(data, out_paths):
+    """在复用的画布上绘制一次 session 的 click trail 并保存到 out_paths"""
+    fig, ax, scatter = _trail_canvas()
+    lanes = data.get("lanes", LANES)
+    duration = float(data.get("durationSec", 10))
+    times, names = extract_points(data.get("points", []))
+    ys = lane_lookup(names, {lane: i for i, lane in enumerate(lanes)}, 0)
+    colors = lane_lookup(names, COLORS, DEFAULT_COLOR)
+
+    ax.set_yticks(np.arange(len(lanes)))
+    ax.set_yticklabels(lanes)
+    ax.set_xlim(0, duration)
+    ax.set_ylim(-0.5, len(lanes) - 0.5)
+    scatter.set_offsets(np.column_stack([times, ys]) if len(times) else np.empty((0, 2)))
+    scatter.set_facecolors(list(colors))
+    for path in out_paths:
+        fig.savefig(path, bbox_inches='tight')
+    return out_paths
+
+def find_trails(directory):
+    return sorted(glob.glob(os.path.join(directory, "**", "*.json"), recursive=True))
+
+def _outputs_current(json_path, out_paths):
+    mtime = os.path.getmtime(json_path)
+    return all(os.path.exists(p) and os.path.getmtime(p) >= mtime for p in out_paths)
+
+def _render_task(task):
+    json_path, out_paths, overwrite = task
+    if not overwrite and _outputs_current(json_path, out_paths):
+        return json_path, "skipped"
+    try:
+        data = load_json(json_path)
+    except (OSError, ValueError) as e:
+        return json_path, f"error: {e}"
+    if "points" not in data:
+        return json_path, "error: no points"
+    render_trail(data, out_paths)
+    return json_path, "rendered"
+
+def batch_render(json_paths, out_dir, formats=FORMATS, workers=None, overwrite=False, root=None):
+    """批量渲染：每个 JSON 输出 <out_dir>/<相对路径>.<fmt>，进程池中每个进程复用一张画布"""
+    tasks = []
+    for path in json_paths:
+        rel = os.path.splitext(os.path.relpath(path, root) if root else os.path.basename(path))[0]
+        stem = os.path.join(out_dir, rel)
+        os.makedirs(os.path.dirname(stem) or ".", exist_ok=True)
+        tasks.append((path, [f"{stem}.{fmt}" for fmt in formats], overwrite))
+    counts = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=apply_style) as pool:
+        for path, status in pool.map(_render_task, tasks, chunksize=8):
+            if status.startswith("error"):
+                print(f"WARNING: {path}: {status}")
+                status = "error"
+            counts[status] = counts.get(status, 0) + 1
+    return counts
+
+def trail_histogram(points, duration, lanes, time_bin=0.5, time_bins=None):
+    """单个 session 的 lane x 时间 计数矩阵
+
+    time_bins 为 None 时按绝对时间 time_bin 秒分箱（列数由最后一次点击决定），
+    否则按 session 时长归一化为 time_bins 列。返回 (counts, 丢弃的点数)
+    """
+    times, names = extract_points(points)
+    rows = lane_lookup(names, {lane: i for i, lane in enumerate(lanes)}, -1).astype(np.int64)
+    if time_bins is None:
+        cols = np.floor(times / time_bin).astype(np.int64)
+        n_cols = int(cols.max()) + 1 if len(cols) and cols.max() >= 0 else 0
+    else:
+        frac = times / duration if duration > 0 else np.zeros_like(times)
+        cols = np.minimum(np.floor(frac * time_bins).astype(np.int64), time_bins - 1)
+        n_cols = time_bins
+    keep = (rows >= 0) & (cols >= 0) & (cols < n_cols) if n_cols else np.zeros(len(rows), dtype=bool)
+    counts = np.bincount(rows[keep] * n_cols + cols[keep], minlength=len(lanes) * n_cols)
+    return counts.reshape(len(lanes), n_cols), int((~keep).sum())
+
+def _add_into(total, part):
+    """按列数较大者对齐后相加（绝对时间分箱时各 session 的列数不同）"""
+    if part.shape[1] > total.shape[1]:
+        total = np.pad(total, ((0, 0), (0, part.shape[1] - total.shape[1])))
+    total[:, :part.shape[1]] += part
+    return total
+
+def _histogram_task(task):
+    paths, lanes, time_bin, time_bins = task
+    total = np.zeros((len(lanes), time_bins or 0), dtype=np.int64)
+    sessions, dropped, errors = 0, 0, []
+    for path in paths:
+        try:
+            data = load_json(path)
+        except (OSError, ValueError) as e:
+            errors.append(f"{path}: {e}")
+            continue
+        if "points" not in data:
+            continue
+        counts, n_dropped = trail_histogram(data["points"], float(data.get("durationSec", 10)), lanes,
+                                            time_bin, time_bins)
+        total = _add_into(total, counts)
+        sessions += 1
+        dropped += n_dropped
+    return total, sessions, dropped, errors
+
+def aggregate_histogram(json_paths, lanes=LANES, time_bin=0.5, time_bins=None, workers=None, chunk=64):
+    """汇总多个 session 的 lane x 时间 直方图；文件按 chunk 分组交给进程池，部分矩阵在主进程合并"""
+    tasks = [(json_paths[i:i + chunk], list(lanes), time_bin, time_bins) for i in range(0, len(json_paths), chunk)]
+    total = np.zeros((len(lanes), time_bins or 0), dtype=np.int64)
+    sessions, dropped = 0, 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for part, n_sessions, n_dropped, errors in pool.map(_histogram_task, tasks):
+            total = _add_into(total, part)
+            sessions += n_sessions
+            dropped += n_dropped
+            for error in errors:
+                print(f"WARNING: {error}")
+    return total, sessions, dropped
+
+def render_heatmap(counts, lanes, sessions, out_paths, time_bin=0.5, normalized=False):
+    apply_style()
+    fig = Figure(figsize=(10, 3))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    fig.subplots_adjust(left=0.12, right=0.98, top=0.92, bottom=0.20)
+    x_max = 1.0 if normalized else counts.shape[1] * time_bin
+    rate = counts / max(sessions, 1)
+    im = ax.imshow(rate, aspect='auto', origin='lower', cmap='magma',
+                   extent=[0, x_max, -0.5, len(lanes) - 0.5], interpolation='nearest')
+    ax.set_yticks(np.arange(len(lanes)))
+    ax.set_yticklabels(lanes)
+    ax.set_ylabel('Notes', fontsize=13, labelpad=10)
+    ax.set_xlabel('Session time (fraction)' if normalized else 'Time (s)', fontsize=13)
+    ax.set_title(f'{sessions} sessions, {int(counts.sum())} clicks', fontsize=11)
+    cb = fig.colorbar(im, ax=ax, pad=0.01)
+    cb.set_label('Clicks per session', fontsize=11)
+    for path in out_paths:
+        fig.savefig(path, bbox_inches='tight')
+    return out_paths
+
+def save_histogram_csv(counts, lanes, path, time_bin=0.5, normalized=False):
+    step = 1.0 / counts.shape[1] if normalized and counts.shape[1] else time_bin
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(",".join(["lane"] + [f"{i * step:g}" for i in range(counts.shape[1])]) + "\n")
+        for lane, row in zip(lanes, counts):
+            f.write(",".join([lane] + [str(int(v)) for v in row]) + "\n")
+
 def main():
     parser = argparse.ArgumentParser(description="Plot click trail with publication-grade styling")
-    parser.add_argument("json_path", help="Path to click_trail JSON")
+    parser.add_argument("json_path", nargs="?", help="Path to click_trail JSON")
     parser.add_argument("--pdf", default="click_trail.pdf", help="Output PDF filename")
     parser.add_argument("--eps", default="click_trail.eps", help="Output EPS filename")
     parser.add_argument("--svg", default="click_trail.svg", help="Output SVG filename")
+    parser.add_argument("--batch", default=None,
+                        help="Render every *.json under this directory (recursive) into --out-dir")
+    parser.add_argument("--aggregate", default=None,
+                        help="Lane x time heatmap over every *.json under this directory (recursive)")
+    parser.add_argument("--out-dir", default="click_trails", help="Batch output directory")
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), help="Batch / heatmap output formats")
+    parser.add_argument("--overwrite", action="store_true", help="Batch: re-render outputs newer than their JSON")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--heatmap", default="click_heatmap", help="Heatmap output path without extension (+ .csv)")
+    parser.add_argument("--lanes", nargs="+", default=LANES, help="Heatmap lanes (other lanes are not counted)")
+    parser.add_argument("--time-bin", type=float, default=0.5, help="Heatmap bin width in seconds")
+    parser.add_argument("--normalize-time", type=int, default=None, metavar="BINS",
+                        help="Heatmap over session time fraction in BINS columns instead of absolute seconds")
     args = parser.parse_args()
 
-    data = load_json(args.json_path)
-    lanes = data.get("lanes", ["C","D","E","G","A"])
-    points = data.get("points", [])
-    duration = float(data.get("durationSec", 10))
+    if not (args.json_path or args.batch or args.aggregate):
+        parser.error("give a click_trail JSON, --batch DIR or --aggregate DIR")
+    apply_style()
+    formats = [f.lstrip(".").lower() for f in args.formats]
 
-    plt.rcParams['font.family'] = 'sans-serif'
-    plt.rcParams['font.sans-serif'] = ['Helvetica', 'Arial', 'DejaVu Sans']
-    plt.rcParams['axes.labelweight'] = 'medium'
+    if args.json_path:
+        render_trail(load_json(args.json_path), [args.pdf, args.eps, args.svg])
+        print(f"Saved PDF: {args.pdf}")
+        print(f"Saved EPS: {args.eps}")
+        print(f"Saved SVG: {args.svg}")
 
-    fig, ax = plt.subplots(figsize=(10, 3))
-    plt.subplots_adjust(left=0.12, right=0.98, top=0.92, bottom=0.20)
+    if args.batch:
+        paths = find_trails(args.batch)
+        counts = batch_render(paths, args.out_dir, formats, args.workers, args.overwrite, root=args.batch)
+        print(f"Batch {args.batch}: " + ", ".join(f"{k}: {v}" for k, v in sorted(counts.items())))
 
-    y_positions = np.arange(len(lanes))
-    ax.set_yticks(y_positions)
-    ax.set_yticklabels(lanes)
-    ax.set_ylabel('Notes', fontsize=13, labelpad=10)
-    ax.set_xlabel('Time (s)', fontsize=13)
-
-    ax.set_xlim(0, duration)
-    ax.set_ylim(-0.5, len(lanes)-0.5)
-    ax.xaxis.set_minor_locator(MultipleLocator(0.5))
-    ax.grid(which='major', axis='y', linestyle='--', color='#d6d6d6', alpha=0.7)
-    ax.grid(which='minor', axis='x', linestyle=':', color='#e2e2e2', alpha=0.6)
-
-    for spine in ['top','right','left','bottom']:
-        ax.spines[spine].set_visible(True)
-        ax.spines[spine].set_linewidth(1.2)
-
-    lane_index = {lane:i for i,lane in enumerate(lanes)}
-    colors = {'C': '#F87171', 'D': '#FB923C', 'E': '#FBBF24', 'G': '#60A5FA', 'A': '#A78BFA'}
-    xs = []
-    ys = []
-    cs = []
-    for p in points:
-        lane = p.get('lane', 'C')
-        t = float(p.get('timeSec', 0))
-        xs.append(t)
-        ys.append(lane_index.get(lane, 0))
-        cs.append(colors.get(lane, '#999999'))
-    ax.scatter(xs, ys, s=64, c=cs, alpha=0.9, edgecolors='black', linewidths=1.2, zorder=3)
-
-    fig.savefig(args.pdf, bbox_inches='tight')
-    fig.savefig(args.eps, bbox_inches='tight')
-    fig.savefig(args.svg, bbox_inches='tight')
-    print(f"Saved PDF: {args.pdf}")
-    print(f"Saved EPS: {args.eps}")
-    print(f"Saved SVG: {args.svg}")
+    if args.aggregate:
+        paths = find_trails(args.aggregate)
+        hist, sessions, dropped = aggregate_histogram(paths, args.lanes, args.time_bin, args.normalize_time,
+                                                      args.workers)
+        normalized = args.normalize_time is not None
+        os.makedirs(os.path.dirname(args.heatmap) or ".", exist_ok=True)
+        outputs = render_heatmap(hist, args.lanes, sessions, [f"{args.heatmap}.{fmt}" for fmt in formats],
+                                 args.time_bin, normalized)
+        save_histogram_csv(hist, args.lanes, f"{args.heatmap}.csv", args.time_bin, normalized)
+        print(f"Aggregated {sessions} sessions ({int(hist.sum())} clicks, {dropped} outside lanes / range)")
+        for path in outputs + [f"{args.heatmap}.csv"]:
+            print(f"Saved: {path}")
 
 if __name__ == "__main__":
     main()
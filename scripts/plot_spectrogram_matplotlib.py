@@ -1,8 +1,27 @@
 import json
+import mmap
+import os
+import re
 import argparse
+from operator import itemgetter
 import numpy as np
 import matplotlib.pyplot as plt
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+SIDES = ("unconstrained", "constrained")
+# 每个 side 下需要转成数组的字段及其 dtype
+ARRAY_FIELDS = {
+    ("spectrogram", "data"): np.float32,
+    ("loudness", "values"): np.float64,
+    ("loudness", "times"): np.float64,
+}
+SIDECAR_VERSION = 1
+SPEC_POOL_MODES = ("max", "mean")
+
 def hz_ticks(min_hz, max_hz, n=6):
     ks = np.linspace(min_hz, max_hz, n)
     labels = [f"{k/1000:.1f}" for k in ks]
@@ -13,23 +32,308 @@ def load_json(path):
         return json.load(f)
 
 def to_array(data):
-    return np.array(data, dtype=float)
+    return np.asarray(data, dtype=float)
 
-def normalize_spec_matrix(spec_rows, num_mel=None):
-    norm = []
-    for row in spec_rows:
+class RowMatrix:
+    """预分配的 float32 行缓冲：行数不足时容量翻倍，列数随最长行扩展（缺失为 NaN）"""
+    def __init__(self, dtype=np.float32, capacity=1024, width=1):
+        self.buf = np.full((capacity, width), np.nan, dtype=dtype)
+        self.n = 0
+        # dict 行的列顺序：首行解析一次，键序相同的后续行直接复用
+        self.keys = None
+        self.order = None
+
+    def _reserve(self, width):
+        rows, cols = self.buf.shape
+        if self.n < rows and width <= cols:
+            return
+        grown = np.full((max(rows, 1) * 2 if self.n >= rows else rows, max(cols, width)), np.nan, dtype=self.buf.dtype)
+        grown[:self.n, :cols] = self.buf[:self.n]
+        self.buf = grown
+
+    def append(self, values):
+        self._reserve(len(values))
+        self.buf[self.n, :len(values)] = values
+        self.n += 1
+
+    def append_dict(self, keys, values):
+        # 与旧实现一致：按 int(key) 排序后依次排列
+        if keys != self.keys:
+            self.keys = keys
+            self.order = np.argsort([int(k) for k in keys], kind="stable")
+        self.append(np.asarray(values, dtype=self.buf.dtype)[self.order])
+
+    def result(self):
+        return self.buf[:self.n].copy()
+
+def spec_rows_to_matrix(rows, dtype=np.float32):
+    """spectrogram 行（list 或 {"0": v, ...}）转矩阵；行结构一致时整体转换，否则逐行填入预分配矩阵"""
+    if isinstance(rows, np.ndarray):
+        return rows.astype(dtype, copy=False)
+    if len(rows) == 0:
+        return np.empty((0, 0), dtype=dtype)
+    first = rows[0]
+    if isinstance(first, dict):
+        keys = sorted(first.keys(), key=lambda k: int(k))
+        getter = itemgetter(*keys)
+        if all(isinstance(row, dict) and len(row) == len(keys) for row in rows):
+            try:
+                return np.array([getter(row) for row in rows], dtype=dtype).reshape(len(rows), len(keys))
+            except KeyError:
+                pass
+    elif all(isinstance(row, list) for row in rows) and len(set(map(len, rows))) == 1:
+        return np.array(rows, dtype=dtype).reshape(len(rows), len(first))
+    matrix = RowMatrix(dtype, capacity=len(rows))
+    for row in rows:
         if isinstance(row, dict):
-            keys = sorted(row.keys(), key=lambda k: int(k))
-            vals = [float(row[k]) for k in keys]
+            keys = list(row.keys())
+            matrix.append_dict(keys, [row[k] for k in keys])
         else:
-            vals = [float(x) for x in row]
-        if num_mel is not None:
-            if len(vals) > num_mel:
-                vals = vals[:num_mel]
-            elif len(vals) < num_mel:
-                vals = vals + [np.nan] * (num_mel - len(vals))
-        norm.append(vals)
-    return np.array(norm, dtype=float)
+            matrix.append(row)
+    return matrix.result()
+
+def normalize_spec_matrix(spec_rows, num_mel=None):
+    spec = spec_rows_to_matrix(spec_rows)
+    if num_mel is not None:
+        num_mel = int(num_mel)
+        if spec.shape[1] > num_mel:
+            spec = spec[:, :num_mel]
+        elif spec.shape[1] < num_mel:
+            spec = np.pad(spec, ((0, 0), (0, num_mel - spec.shape[1])), constant_values=np.nan)
+    return spec
+
+def _array_field(prefix):
+    """ijson 前缀 -> (side, field)，例如 'constrained.loudness.values' -> ('constrained', ('loudness', 'values'))"""
+    parts = prefix.split(".")
+    if len(parts) >= 3 and parts[0] in SIDES and (parts[1], parts[2]) in ARRAY_FIELDS:
+        return parts[0], (parts[1], parts[2])
+    return None
+
+def _side_key_positions(mm):
+    return sorted((m.start(), side) for side in SIDES for m in re.finditer(rb'"%s"\s*:' % side.encode(), mm))
+
+def spectrogram_timing(path):
+    """不解析文档，按字节查找每个 side 的 spectrogram hopSize / sampleRate（导出时位于 data 之后）；
+    返回 {side: 每帧秒数}，结构不明确的 side 不返回"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return {}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            sides = _side_key_positions(mm)
+            found = {}
+            for key in ("hopSize", "sampleRate"):
+                for m in re.finditer(rb'"%s"\s*:\s*(-?[0-9.eE+-]+)' % key.encode(), mm):
+                    owner = [side for pos, side in sides if pos < m.start()]
+                    if owner:
+                        found.setdefault((owner[-1], key), []).append(float(m.group(1)))
+    counts = {side: sum(1 for _, name in sides if name == side) for side in SIDES}
+    timing = {}
+    for side in SIDES:
+        hop, sr = found.get((side, "hopSize")), found.get((side, "sampleRate"))
+        if counts[side] == 1 and hop and sr and len(hop) == len(sr) == 1 and sr[0] > 0:
+            timing[side] = hop[0] / sr[0]
+    return timing
+
+def stream_spectrum(path, window=None):
+    """用 ijson 流式解析：spectrogram.data 的行直接写入预分配矩阵，loudness 数组直接收集，
+    其余字段照常构建为 dict
+
+    window: (t0, t1) 秒。能预先确定 hopSize / sampleRate 的 side 只把窗口内的帧写入矩阵，
+    窗口外的行只做词法扫描不构建；其余 side 与 loudness 在解析后截取
+    """
+    builder = ijson.ObjectBuilder()
+    arrays = {}
+    target = None  # 正在解析的数组字段 (side, field)
+    row, row_keys, depth = None, None, 0
+    frame_ranges = {}
+    if window is not None:
+        t0, t1 = window
+        frame_ranges = {side: (int(t0 / spf), int(t1 / spf)) for side, spf in spectrogram_timing(path).items()}
+    row_index, lo, hi, keep = 0, 0, None, True
+    with open(path, "rb") as f:
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if target is None:
+                hit = _array_field(prefix) if event == "start_array" else None
+                if hit is None or prefix != ".".join((hit[0],) + hit[1]):
+                    builder.event(event, value)
+                    continue
+                target, depth = hit, 0
+                arrays[target] = RowMatrix(ARRAY_FIELDS[target[1]]) if target[1] == ("spectrogram", "data") else []
+                row_index, keep = 0, True
+                lo, hi = frame_ranges.get(target[0], (0, None)) if target[1] == ("spectrogram", "data") else (0, None)
+                continue
+            sink = arrays[target]
+            if event in ("start_array", "start_map"):
+                depth += 1
+                if depth == 1:
+                    keep = row_index >= lo and (hi is None or row_index < hi)
+                    row_index += 1
+                    row, row_keys = [], ([] if event == "start_map" else None)
+            elif event in ("end_array", "end_map"):
+                depth -= 1
+                if depth == 0:
+                    if keep and row_keys is not None:
+                        sink.append_dict(row_keys, row)
+                    elif keep:
+                        sink.append(row)
+                elif depth < 0:
+                    # 数组结束：在文档中留空位，稍后放入 ndarray
+                    builder.event("null", None)
+                    target = None
+            elif not keep:
+                continue
+            elif event == "map_key":
+                row_keys.append(value)
+            elif depth == 0:
+                sink.append(value)
+            else:
+                row.append(value)
+    doc = builder.value
+    for (side, (group, name)), sink in arrays.items():
+        values = sink.result() if isinstance(sink, RowMatrix) else np.asarray(sink, dtype=ARRAY_FIELDS[(group, name)])
+        doc[side][group][name] = values
+    if window is not None:
+        doc = select_window(doc, window, frame_sides=[side for side in SIDES if side not in frame_ranges])
+    return doc
+
+def _arrays_from_doc(doc):
+    for side in SIDES:
+        for (group, name), dtype in ARRAY_FIELDS.items():
+            values = doc.get(side, {}).get(group, {}).get(name)
+            if values is None:
+                continue
+            if (group, name) == ("spectrogram", "data"):
+                doc[side][group][name] = spec_rows_to_matrix(values, dtype)
+            else:
+                doc[side][group][name] = np.asarray(values, dtype=dtype)
+    return doc
+
+def _sidecar_dir(path):
+    return path + ".arrays"
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def load_sidecar(path):
+    """读取 .npy sidecar（数组以 mmap 方式打开）；不存在或源文件已变化时返回 None"""
+    meta_path = os.path.join(_sidecar_dir(path), "meta.json")
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != SIDECAR_VERSION or meta.get("source") != _source_stamp(path):
+        return None
+    doc = meta["doc"]
+    for side, group, name in meta["arrays"]:
+        doc[side][group][name] = np.load(os.path.join(_sidecar_dir(path), f"{side}.{group}.{name}.npy"), mmap_mode="r")
+    return doc
+
+def save_sidecar(path, doc):
+    """数组字段写为 <json>.arrays/<side>.<group>.<name>.npy，其余字段与源文件戳写入 meta.json"""
+    out_dir = _sidecar_dir(path)
+    os.makedirs(out_dir, exist_ok=True)
+    meta_doc = json.loads(json.dumps(doc, default=lambda v: None))
+    arrays = []
+    for side in SIDES:
+        for group, name in ARRAY_FIELDS:
+            values = doc.get(side, {}).get(group, {}).get(name)
+            if isinstance(values, np.ndarray):
+                np.save(os.path.join(out_dir, f"{side}.{group}.{name}.npy"), values)
+                arrays.append([side, group, name])
+    tmp_path = os.path.join(out_dir, "meta.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": SIDECAR_VERSION, "source": _source_stamp(path), "arrays": arrays, "doc": meta_doc}, f)
+    os.replace(tmp_path, os.path.join(out_dir, "meta.json"))
+
+def select_window(doc, window, frame_sides=SIDES):
+    """按时间窗 (t0, t1) 截取 spectrogram 帧（只对 frame_sides）和 loudness 点
+
+    对已解码的 list 截取可省去窗口外行的矩阵转换，但 JSON 本身已完整解析；mmap 的 sidecar
+    数组只读取窗口内的页。真正跳过窗口外行的解码见 stream_spectrum(window=...)。
+    """
+    if window is None:
+        return doc
+    t0, t1 = window
+    for side in SIDES:
+        part = doc.get(side) or {}
+        spec = part.get("spectrogram") or {}
+        if side in frame_sides and spec.get("data") is not None:
+            hop = float(spec.get("hopSize", 1024))
+            sr = float(spec.get("sampleRate", 44100))
+            seconds_per_frame = hop / sr if sr > 0 else 0.1
+            spec["data"] = spec["data"][int(t0 / seconds_per_frame):int(t1 / seconds_per_frame)]
+        loud = part.get("loudness") or {}
+        if loud.get("values") is not None and loud.get("times") is not None:
+            times = np.asarray(loud["times"], dtype=np.float64)
+            i0, i1 = np.searchsorted(times, t0, "left"), np.searchsorted(times, t1, "right")
+            loud["times"] = times[i0:i1]
+            loud["values"] = loud["values"][i0:i1]
+    return doc
+
+def load_spectrum(path, use_sidecar=False, stream=False, window=None):
+    """读取 spectrum_full_data.json，spectrogram.data 转为 float32 矩阵、loudness 转为数组
+
+    use_sidecar: 优先使用 <json>.arrays/ 下的 .npy sidecar（mmap），没有或已过期时解析后写出
+    stream: 用 ijson 流式解析，内存占用只有结果矩阵；比 json.load 慢，适合超大文件
+    window: (t0, t1) 秒，只返回该时间窗内的帧和点；sidecar 始终保存完整数组。
+        json.load 路径仍完整解析文档，只省去窗口外行的矩阵转换；stream（不写 sidecar 时）
+        在解析时跳过窗口外的行
+    """
+    if use_sidecar:
+        doc = load_sidecar(path)
+        if doc is not None:
+            return _arrays_from_doc(select_window(doc, window))
+    if stream and ijson is None:
+        print("WARNING: ijson not installed, falling back to json.load")
+    if stream and ijson is not None:
+        if not use_sidecar:
+            return stream_spectrum(path, window)
+        doc = stream_spectrum(path)
+    elif use_sidecar:
+        doc = _arrays_from_doc(load_json(path))
+    else:
+        return _arrays_from_doc(select_window(load_json(path), window))
+    if use_sidecar:
+        save_sidecar(path, doc)
+    return select_window(doc, window)
+
+def pool_frames(spec, n_out, mode="max"):
+    """沿时间轴把帧池化为 n_out 列：max 保留瞬态峰值，mean 保留平均能量；NaN 不参与"""
+    n = spec.shape[0]
+    if n_out < 1 or n <= n_out:
+        return spec
+    edges = np.linspace(0, n, n_out + 1).astype(np.int64)[:-1]
+    if mode == "max":
+        return np.fmax.reduceat(spec, edges, axis=0)
+    valid = ~np.isnan(spec)
+    sums = np.add.reduceat(np.where(valid, spec, 0), edges, axis=0)
+    counts = np.add.reduceat(valid, edges, axis=0)
+    with np.errstate(invalid="ignore"):
+        return (sums / counts).astype(spec.dtype)
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets 降采样：保留首尾点，每个桶取与前一选中点、下一桶均值
+    构成三角形面积最大的点"""
+    n = len(x)
+    if n_out < 3 or n <= n_out:
+        return x, y
+    # 中间 n_out - 2 个桶覆盖 [1, n - 1)，最后一个“下一桶”为末点
+    edges = np.append(np.linspace(1, n - 1, n_out - 1).astype(np.int64), n)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        cx, cy = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return x[idx], y[idx]
+
+def axes_pixel_width(fig, ax, dpi):
+    return max(1, int(round(ax.get_position().width * fig.get_figwidth() * dpi)))
 
 def main():
     parser = argparse.ArgumentParser(description="Plot spectrogram comparison with Matplotlib")
@@ -38,9 +342,21 @@ def main():
     parser.add_argument("--pdf", default="spectrogram_comparison_mpl.pdf", help="Output PDF filename")
     parser.add_argument("--svg", default="spectrogram_comparison_mpl.svg", help="Output SVG filename")
     parser.add_argument("--dpi", type=int, default=300, help="DPI for PNG")
+    parser.add_argument("--npy-cache", action="store_true",
+                        help="Cache parsed arrays as .npy files in <json>.arrays/ and memory-map them on reuse")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream-parse with ijson (bounded memory for very large exports; slower than json.load); "
+                             "spectrogram rows outside --start/--duration are skipped while parsing")
+    parser.add_argument("--start", type=float, default=0.0, help="Window start (s)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Window length (s)")
+    parser.add_argument("--spec-pool", choices=SPEC_POOL_MODES, default="max",
+                        help="Pooling of spectrogram frames beyond the panel's pixel width at --dpi")
+    parser.add_argument("--full-resolution", action="store_true",
+                        help="Plot every frame / loudness point (no pooling or LTTB decimation)")
     args = parser.parse_args()
 
-    data = load_json(args.json_path)
+    t0, t1 = args.start, args.start + args.duration
+    data = load_spectrum(args.json_path, use_sidecar=args.npy_cache, stream=args.stream, window=(t0, t1))
     env = data.get("envelopeBounds", {"loudnessMax": -14, "loudnessMin": -30})
 
     plt.rcParams['font.family'] = 'sans-serif'
@@ -67,24 +383,21 @@ def main():
         num_mel_b = data["constrained"]["spectrogram"].get("numMelBins", None)
         spec_a = normalize_spec_matrix(spec_a_data, num_mel_a)
         spec_b = normalize_spec_matrix(spec_b_data, num_mel_b)
-        hop = float(data["unconstrained"]["spectrogram"].get("hopSize", 1024))
-        sr = float(data["unconstrained"]["spectrogram"].get("sampleRate", 44100))
-        num_frames_a = spec_a.shape[0]
-        seconds_per_frame = hop / sr if sr > 0 else 0.1
-        max_frames_10s = int(10 / seconds_per_frame) if seconds_per_frame > 0 else num_frames_a
-        spec_a = spec_a[:min(num_frames_a, max_frames_10s), :]
-        spec_b = spec_b[:min(spec_b.shape[0], max_frames_10s), :]
+        # 帧数超过面板像素宽度时按列池化，imshow 的数据量与会话长度无关
+        if not args.full_resolution:
+            spec_a = pool_frames(spec_a, axes_pixel_width(fig, ax_spec_a, args.dpi), args.spec_pool)
+            spec_b = pool_frames(spec_b, axes_pixel_width(fig, ax_spec_b, args.dpi), args.spec_pool)
         lower_frac = 0.40
         bins_a = max(1, int(spec_a.shape[1] * lower_frac))
         bins_b = max(1, int(spec_b.shape[1] * lower_frac))
         spec_a_low = spec_a[:, :bins_a]
         spec_b_low = spec_b[:, :bins_b]
-        im = ax_spec_a.imshow(spec_a_low.T, aspect='auto', extent=[0, 10, 0, bins_a], origin='lower', cmap='viridis')
-        ax_spec_b.imshow(spec_b_low.T, aspect='auto', extent=[0, 10, 0, bins_b], origin='lower', cmap='viridis')
+        im = ax_spec_a.imshow(spec_a_low.T, aspect='auto', extent=[t0, t1, 0, bins_a], origin='lower', cmap='viridis')
+        ax_spec_b.imshow(spec_b_low.T, aspect='auto', extent=[t0, t1, 0, bins_b], origin='lower', cmap='viridis')
         ax_spec_a.set_ylabel('Frequency (kHz)', labelpad=18, fontsize=14)
         ax_spec_a.yaxis.set_label_coords(-0.12, 0.5)
-        ax_spec_a.set_xticks(np.linspace(0, 10, 11))
-        ax_spec_b.set_xticks(np.linspace(0, 10, 11))
+        ax_spec_a.set_xticks(np.linspace(t0, t1, 11))
+        ax_spec_b.set_xticks(np.linspace(t0, t1, 11))
         ax_spec_a.set_yticks(np.linspace(0, bins_a, 6))
         ax_spec_b.set_yticks(np.linspace(0, bins_b, 6))
         ax_spec_a.set_yticklabels(['0','1','2','3','4','5'])
@@ -102,8 +415,8 @@ def main():
         ax_spec_a.text(0.5, 0.5, 'No Spectrogram Data', ha='center', va='center', fontsize=10)
         ax_spec_b.text(0.5, 0.5, 'No Spectrogram Data', ha='center', va='center', fontsize=10)
         ax_spec_a.set_ylabel('Frequency (kHz)', labelpad=15)
-        ax_spec_a.set_xticks(np.linspace(0, 10, 11))
-        ax_spec_b.set_xticks(np.linspace(0, 10, 11))
+        ax_spec_a.set_xticks(np.linspace(t0, t1, 11))
+        ax_spec_b.set_xticks(np.linspace(t0, t1, 11))
         ax_spec_a.set_yticks([])
         ax_spec_b.set_yticks([])
         print("WARNING: JSON missing spectrogram arrays under unconstrained/constrained.spectrogram.data")
@@ -115,26 +428,26 @@ def main():
     loud_b_vals = data.get("constrained", {}).get("loudness", {}).get("values")
     time_b_vals = data.get("constrained", {}).get("loudness", {}).get("times")
     if loud_a_vals is not None and time_a_vals is not None:
-        loud_a = to_array(loud_a_vals)
-        time_a = to_array(time_a_vals)
-        mask_a = time_a <= 10
-        ax_loud_a.plot(time_a[mask_a], loud_a[mask_a], color='#111111', linewidth=2)
+        time_a, loud_a = to_array(time_a_vals), to_array(loud_a_vals)
+        if not args.full_resolution:
+            time_a, loud_a = lttb(time_a, loud_a, axes_pixel_width(fig, ax_loud_a, args.dpi))
+        ax_loud_a.plot(time_a, loud_a, color='#111111', linewidth=2)
     else:
         ax_loud_a.text(0.5, 0.5, 'No Loudness Data', ha='center', va='center', fontsize=10)
         print("WARNING: JSON missing unconstrained.loudness.values/times")
     if loud_b_vals is not None and time_b_vals is not None:
-        loud_b = to_array(loud_b_vals)
-        time_b = to_array(time_b_vals)
-        mask_b = time_b <= 10
-        ax_loud_b.plot(time_b[mask_b], loud_b[mask_b], color='#111111', linewidth=2)
+        time_b, loud_b = to_array(time_b_vals), to_array(loud_b_vals)
+        if not args.full_resolution:
+            time_b, loud_b = lttb(time_b, loud_b, axes_pixel_width(fig, ax_loud_b, args.dpi))
+        ax_loud_b.plot(time_b, loud_b, color='#111111', linewidth=2)
     else:
         ax_loud_b.text(0.5, 0.5, 'No Loudness Data', ha='center', va='center', fontsize=10)
         print("WARNING: JSON missing constrained.loudness.values/times")
     ax_loud_a.set_ylabel('Loudness (LUFS)', labelpad=14, fontsize=13)
     ax_loud_a.yaxis.set_label_coords(-0.12, 0.5)
     # 共享 X 轴标题：放在页脚统一显示
-    ax_loud_a.set_xlim(0, 10)
-    ax_loud_b.set_xlim(0, 10)
+    ax_loud_a.set_xlim(t0, t1)
+    ax_loud_b.set_xlim(t0, t1)
     ax_loud_a.set_ylim(-30, -10)
     ax_loud_b.set_ylim(-30, -10)
     ax_loud_a.set_yticks([-30, -20, -10])
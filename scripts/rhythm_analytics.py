@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Click-trail rhythm analytics and pattern labels, computed offline for many sessions
+
+All clicks of a batch of sessions are flattened into (session, time, lane) arrays
+and every feature is a segment reduction over them (bincount / reduceat / searchsorted),
+so there is no per-session Python loop:
+- inter-onset intervals (mean / median / std / CV), onset density, hits per second
+- lane counts, dominant lane, run lengths, repetition ratio
+- 5x5 lane-transition counts and normalized transition entropy
+- C-D-E-G-A sequence hits and coverage
+- pattern_label: the rule behind the session report's patternLabel
+  (game-result-manager.js analyzePattern): sequential / repetitive / exploratory
+- pattern_type: the music generator's rule (advanced-music-generator.js analyzePatterns):
+  sequential_pentatonic / repetitive / exploratory / mixed / sparse
+
+Input is a directory of click-trail JSONs ({"lanes", "points": [{"lane", "timeSec"}],
+"durationSec"}); output is one row per session as Parquet (or CSV by extension).
+Lanes outside C/D/E/G/A are ignored.
+"""
+
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from plot_clicktrail_matplotlib import LANES, extract_points, find_trails, lane_lookup, load_json
+
+N_LANES = len(LANES)
+# C-D-E-G-A 依次为 lane 0..4
+SEQUENCE = np.arange(N_LANES)
+GENERATOR_TYPES = np.array(["sequential_pentatonic", "repetitive", "exploratory"])
+REPORT_LABELS = np.array(["sequential", "repetitive", "exploratory"])
+
+def flatten_sessions(sessions):
+    """[(points, ...)] -> (sid, times, lanes)，按 (sid, time) 稳定排序；未知 lane 的点丢弃"""
+    lane_index = {lane: i for i, lane in enumerate(LANES)}
+    sids, times, lanes = [], [], []
+    for sid, points in enumerate(sessions):
+        t, names = extract_points(points)
+        idx = lane_lookup(names, lane_index, -1)
+        keep = idx >= 0
+        sids.append(np.full(int(keep.sum()), sid, dtype=np.int64))
+        times.append(t[keep])
+        lanes.append(idx[keep].astype(np.int64))
+    sid = np.concatenate(sids) if sids else np.empty(0, dtype=np.int64)
+    t = np.concatenate(times) if times else np.empty(0)
+    lane = np.concatenate(lanes) if lanes else np.empty(0, dtype=np.int64)
+    order = np.lexsort((t, sid))
+    return sid[order], t[order], lane[order]
+
+def _divide(a, b, fill=0.0):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(b > 0, a / np.where(b > 0, b, 1), fill)
+
+def segment_stats(sid, values, n_sessions):
+    """每个 session 的 (count, mean, median, std)；values 须已按 sid 分组"""
+    count = np.bincount(sid, minlength=n_sessions)
+    mean = _divide(np.bincount(sid, weights=values, minlength=n_sessions), count, np.nan)
+    sq = _divide(np.bincount(sid, weights=values * values, minlength=n_sessions), count, np.nan)
+    std = np.sqrt(np.maximum(sq - mean * mean, 0.0))
+    ordered = values[np.lexsort((values, sid))]
+    start = np.concatenate(([0], np.cumsum(count)[:-1]))
+    has = count > 0
+    lo = np.where(has, start + (count - 1) // 2, 0)
+    hi = np.where(has, start + count // 2, 0)
+    median = np.where(has, (ordered[lo] + ordered[hi]) / 2 if len(ordered) else np.nan, np.nan)
+    return count, mean, median, std
+
+def next_lane_index(sid, lane):
+    """nxt[L, p]：位置 p 之后同一 session 内第一个 lane == L 的位置，没有为 -1；第 n 列为哨兵"""
+    n = len(lane)
+    nxt = np.full((N_LANES, n + 1), -1, dtype=np.int64)
+    positions = np.arange(n)
+    for lane_id in range(N_LANES):
+        pos = np.flatnonzero(lane == lane_id)
+        if len(pos) == 0:
+            continue
+        k = np.searchsorted(pos, positions, side="right")
+        cand = pos[np.minimum(k, len(pos) - 1)]
+        nxt[lane_id, :n] = np.where((k < len(pos)) & (sid[cand] == sid), cand, -1)
+    return nxt
+
+def sequence_hits(sid, t, lane, nxt, n_sessions, window, relative_window, max_gap=None):
+    """从每个 C 出发依次找下一个 D、E、G、A（只看首次出现）
+
+    relative_window=False：所有音须在起点后 window 个位置内（生成器 detectCDEGAStrict）；
+    True：每一步距上一音不超过 window 个位置（报告 analyzePattern）。max_gap 为相邻两音的最大时间差。
+    返回每个 session 的 (命中次数, 覆盖率分子)
+    """
+    n = len(sid)
+    start = np.flatnonzero(lane == SEQUENCE[0])
+    cur = start.copy()
+    ok = np.ones(len(start), dtype=bool)
+    chain = [start]
+    for target in SEQUENCE[1:]:
+        j = nxt[target, np.where(ok, cur, n)]
+        limit = cur + window if relative_window else start + window - 1
+        good = ok & (j >= 0) & (j <= limit)
+        if max_gap is not None:
+            good &= (t[np.maximum(j, 0)] - t[cur]) <= max_gap
+        ok = good
+        cur = np.where(ok, j, cur)
+        chain.append(cur)
+    hits = np.bincount(sid[start[ok]], minlength=n_sessions)
+    covered = np.unique(np.concatenate([c[ok] for c in chain])) if ok.any() else np.empty(0, dtype=np.int64)
+    return hits, np.bincount(sid[covered], minlength=n_sessions)
+
+def rhythm_features(sid, t, lane, n_sessions, durations):
+    """扁平点数组 -> 每个 session 一行特征的 dict of arrays（含两种模式标签）"""
+    S = n_sessions
+    clicks = np.bincount(sid, minlength=S)
+    lane_counts = np.bincount(sid * N_LANES + lane, minlength=S * N_LANES).reshape(S, N_LANES)
+    dominant = lane_counts.argmax(axis=1)
+    dominant_ratio = _divide(lane_counts.max(axis=1), clicks)
+    diversity = (lane_counts > 0).sum(axis=1)
+
+    # 同一 session 内的相邻点
+    same = sid[1:] == sid[:-1]
+    ioi = (t[1:] - t[:-1])[same]
+    _, ioi_mean, ioi_median, ioi_std = segment_stats(sid[1:][same], ioi, S)
+
+    # 连续同 lane 的段（run）
+    new_run = np.ones(len(lane), dtype=bool)
+    new_run[1:] = ~same | (lane[1:] != lane[:-1])
+    run_len = np.bincount(np.cumsum(new_run) - 1) if len(lane) else np.empty(0, dtype=np.int64)
+    run_sid = sid[new_run]
+    avg_run = _divide(clicks, np.bincount(run_sid, minlength=S))
+    max_run = np.zeros(S, dtype=np.int64)
+    np.maximum.at(max_run, run_sid, run_len)
+    repetition = np.clip(_divide(np.bincount(run_sid, weights=run_len * (run_len >= 3), minlength=S), clicks), 0, 1)
+
+    trans = np.bincount(sid[:-1][same] * N_LANES * N_LANES + lane[:-1][same] * N_LANES + lane[1:][same],
+                        minlength=S * N_LANES * N_LANES).reshape(S, N_LANES * N_LANES)
+    p = trans / np.maximum(trans.sum(axis=1, keepdims=True), 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        entropy = -np.where(p > 0, p * np.log(p), 0.0).sum(axis=1)
+    entropy = np.clip(entropy / np.log(N_LANES * N_LANES), 0, 1)
+
+    last = np.zeros(S)
+    np.maximum.at(last, sid, t)
+    hits_per_sec = clicks / np.maximum(last, 1.0)
+
+    nxt = next_lane_index(sid, lane)
+    hit_strict, covered_strict = sequence_hits(sid, t, lane, nxt, S, window=7, relative_window=False, max_gap=1.2)
+    coverage = np.clip(_divide(covered_strict, clicks), 0, 1)
+    _, covered_loose = sequence_hits(sid, t, lane, nxt, S, window=6, relative_window=True)
+    seq_coverage = _divide(covered_loose, clicks)
+
+    # advanced-music-generator.js analyzePatterns
+    seq_pass = (hit_strict >= 2) & (coverage >= 0.25) & (diversity >= 4)
+    rep_pass = (dominant_ratio >= 0.6) & ((max_run >= 4) | (avg_run >= 2.2)) & (entropy <= 0.4)
+    exp_pass = (diversity >= 5) & (entropy >= 0.6) & (dominant_ratio <= 0.45) & ~seq_pass & ~rep_pass
+    seq_score = np.clip(np.minimum(np.minimum(hit_strict / 3, coverage / 0.3), diversity / 5), 0, 1)
+    run_score = np.clip(np.maximum(max_run / 4, avg_run / 2.2), 0, 1)
+    rep_score = np.clip(0.4 * dominant_ratio + 0.3 * run_score + 0.3 * (1 - entropy), 0, 1)
+    exp_score = np.clip(0.4 * (diversity / 5) + 0.3 * entropy + 0.3 * (1 - dominant_ratio), 0, 1)
+    gated = np.column_stack([seq_pass * seq_score, rep_pass * rep_score, exp_pass * exp_score])
+    # JS 的两个分支（>= 0.4 且领先 0.1 / >= 0.3）选出的都是最高分，合并为一个阈值
+    pattern_type = np.where(gated.max(axis=1) >= 0.3, GENERATOR_TYPES[gated.argmax(axis=1)], "mixed")
+    pattern_type = np.where(clicks == 0, "sparse", pattern_type)
+
+    # game-result-manager.js analyzePattern（session report 的 patternLabel）
+    seq_raw = np.minimum(1, (seq_coverage / 0.3) * 0.7 + (diversity / 5) * 0.3)
+    rep_raw = np.minimum(1, dominant_ratio / 0.6)
+    exp_raw = np.minimum(1, (diversity / 5) * 0.6 + (1 - dominant_ratio) * 0.4)
+    raw = np.column_stack([seq_raw, rep_raw, exp_raw])
+    # 顺序型与最高分相差不超过 0.05 时优先顺序型；其余按分数取最高（同分时 repetitive 在前）
+    label = np.where(seq_raw >= raw.max(axis=1) - 0.05, "sequential",
+                     REPORT_LABELS[1 + raw[:, 1:].argmax(axis=1)])
+    label = np.where(clicks < 3, None, label)
+
+    duration = np.asarray(durations, dtype=float)
+    features = {
+        "n_clicks": clicks,
+        "duration_sec": duration,
+        "onset_density_eps": _divide(clicks, duration, np.nan),
+        "hits_per_sec": hits_per_sec,
+        "ioi_mean_sec": ioi_mean,
+        "ioi_median_sec": ioi_median,
+        "ioi_std_sec": ioi_std,
+        "ioi_cv": _divide(ioi_std, ioi_mean, np.nan),
+    }
+    features.update({f"lane_count_{name}": lane_counts[:, i] for i, name in enumerate(LANES)})
+    features.update({
+        "dominant_lane": np.where(clicks > 0, np.array(LANES)[dominant], None),
+        "dominant_lane_ratio": dominant_ratio,
+        "lane_diversity": diversity,
+        "avg_run_len": avg_run,
+        "max_run_len": max_run,
+        "repetition_ratio": repetition,
+        "transition_entropy": entropy,
+        "hit_strict": hit_strict,
+        "coverage": coverage,
+        "sequential_coverage": seq_coverage,
+        "seq_score": seq_score,
+        "rep_score": rep_score,
+        "exp_score": exp_score,
+        "pattern_type": pattern_type,
+        "pattern_label": label,
+    })
+    features.update({f"trans_{LANES[i // N_LANES]}_{LANES[i % N_LANES]}": trans[:, i]
+                     for i in range(N_LANES * N_LANES)})
+    return features
+
+def _chunk_task(task):
+    paths, root = task
+    names, points, durations, reported, errors = [], [], [], [], []
+    for path in paths:
+        try:
+            data = load_json(path)
+        except (OSError, ValueError) as e:
+            errors.append(f"{path}: {e}")
+            continue
+        if "points" not in data:
+            continue
+        names.append(os.path.splitext(os.path.relpath(path, root))[0])
+        points.append(data["points"])
+        durations.append(float(data.get("durationSec", 10)))
+        label = data.get("patternLabel", data.get("pattern_label"))
+        reported.append(label.lower() if isinstance(label, str) else None)
+    sid, t, lane = flatten_sessions(points)
+    df = pd.DataFrame(rhythm_features(sid, t, lane, len(points), durations))
+    df.insert(0, "session", names)
+    df["reported_label"] = reported
+    return df, errors
+
+def analyze_directory(directory, workers=None, chunk=500):
+    paths = find_trails(directory)
+    tasks = [(paths[i:i + chunk], directory) for i in range(0, len(paths), chunk)]
+    frames = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for df, errors in pool.map(_chunk_task, tasks):
+            frames.append(df)
+            for error in errors:
+                print(f"WARNING: {error}")
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def write_features(df, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if path.endswith(".parquet"):
+        typed = df.copy()
+        for col in ("pattern_type", "pattern_label", "reported_label", "dominant_lane"):
+            typed[col] = typed[col].astype("category")
+        typed.to_parquet(path, index=False, compression="zstd")
+    else:
+        df.to_csv(path, index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rhythm features and pattern labels for click-trail sessions")
+    parser.add_argument("trails", help="Directory of click-trail JSONs (searched recursively)")
+    parser.add_argument("--out", default="reports/rhythm_features.parquet",
+                        help="Output table (.parquet needs pyarrow; any other extension writes CSV)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk", type=int, default=500, help="Sessions per worker task")
+    args = parser.parse_args()
+
+    df = analyze_directory(args.trails, args.workers, args.chunk)
+    if df.empty:
+        raise SystemExit(f"No click trails found under {args.trails}")
+    write_features(df, args.out)
+    print(f"Saved: {args.out} ({len(df)} sessions)")
+    print(df["pattern_label"].value_counts(dropna=False).to_string())
+    audited = df[df["reported_label"].notna()]
+    if len(audited):
+        agree = (audited["reported_label"] == audited["pattern_label"]).mean()
+        print(f"Agreement with reported patternLabel: {agree:.1%} of {len(audited)} sessions")
+        print(pd.crosstab(audited["reported_label"], audited["pattern_label"].fillna("none")).to_string())
+
+if __name__ == "__main__":
+    main()